@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import autenticacao  # noqa: F401  (sinais que limpam o usuário em cache)
+        from . import services_medicamentos  # noqa: F401  (sinais que invalidam o catálogo em cache)
@@ -0,0 +1,151 @@
+"""
+Arquivo do histórico de pacientes com alta antiga.
+
+O histórico clínico (aferições, atendimentos, PREVENT, triagens e prescrições) de quem teve alta
+há muito tempo sai das tabelas do dia a dia, cujos índices as telas ativas usam o tempo todo, e
+vira uma linha de ArquivoPaciente por paciente: as linhas de cada tabela (com as chaves
+primárias originais) em JSON comprimido com zlib. O cadastro do paciente continua onde está
+(busca, CPF único, resumo de risco e última PA).
+- arquivar_pacientes(ids): usado em lotes pelo comando arquivar_pacientes;
+- carregar_arquivo(paciente): instâncias só para leitura (detalhe do paciente);
+- restaurar_paciente(paciente): devolve tudo às tabelas (readmissão).
+"""
+import json
+import zlib
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import (
+    Afericao, ArquivoPaciente, AtendimentoMedico, AtendimentoMultidisciplinar, AvaliacaoPrevent, ItemPrescricao,
+    Medicamento, PrescricaoMedica, TriagemHipertensao, Usuario,
+)
+
+# Modelo -> caminho até o paciente. Na ordem de inserção (pais antes dos filhos)
+CONTEUDO = [
+    (Afericao, 'paciente_id'),
+    (AtendimentoMultidisciplinar, 'paciente_id'),
+    (AvaliacaoPrevent, 'paciente_id'),
+    (TriagemHipertensao, 'paciente_id'),
+    (AtendimentoMedico, 'paciente_id'),
+    (PrescricaoMedica, 'atendimento__paciente_id'),
+    (ItemPrescricao, 'prescricao__atendimento__paciente_id'),
+]
+MEDICAMENTOS_AFERICAO = Afericao.medicamentos.through
+CHAVE_MEDICAMENTOS = 'medicamentos_afericao'
+
+
+def _campos(modelo):
+    return [campo.attname for campo in modelo._meta.concrete_fields]
+
+
+def arquivar_pacientes(ids):
+    """
+    Move o histórico dos pacientes para o arquivo em uma transação. Pacientes já arquivados são
+    ignorados. Retorna (pacientes arquivados, registros movidos).
+    """
+    with transaction.atomic():
+        ids = set(ids) - set(ArquivoPaciente.objects.filter(paciente_id__in=ids).values_list('paciente_id', flat=True))
+        conteudo = {paciente_id: defaultdict(list) for paciente_id in ids}
+        totais = dict.fromkeys(ids, 0)
+        for modelo, caminho in CONTEUDO:
+            registros = modelo.objects.filter(**{f'{caminho}__in': ids}).order_by('pk')
+            for linha in registros.values(*_campos(modelo), paciente_arquivo=F(caminho)):
+                paciente_id = linha.pop('paciente_arquivo')
+                conteudo[paciente_id][modelo._meta.label].append(linha)
+                totais[paciente_id] += 1
+        for afericao_id, medicamento_id, paciente_id in MEDICAMENTOS_AFERICAO.objects.filter(
+                afericao__paciente_id__in=ids).values_list('afericao_id', 'medicamento_id', 'afericao__paciente_id'):
+            conteudo[paciente_id][CHAVE_MEDICAMENTOS].append([afericao_id, medicamento_id])
+
+        ArquivoPaciente.objects.bulk_create([
+            ArquivoPaciente(
+                paciente_id=paciente_id,
+                total_registros=totais[paciente_id],
+                dados=zlib.compress(json.dumps(conteudo[paciente_id], default=str).encode('utf-8')),
+            )
+            for paciente_id in ids
+        ], batch_size=100)
+
+        # Do filho para o pai (as exclusões em cascata já não encontram nada)
+        for modelo, caminho in reversed(CONTEUDO):
+            modelo.objects.filter(**{f'{caminho}__in': ids}).delete()
+    return len(ids), sum(totais.values())
+
+
+# Datas, horários e decimais vão como texto (str mantém os microssegundos) e voltam pelo to_python
+def _ler(arquivo):
+    return json.loads(zlib.decompress(bytes(arquivo.dados)).decode('utf-8'))
+
+
+def _instancias(conteudo, modelo):
+    """Linhas do arquivo -> instâncias não salvas (o texto do JSON passa pelo to_python de cada campo)."""
+    campos = {campo.attname: campo for campo in modelo._meta.concrete_fields}
+    return [
+        modelo(**{nome: campos[nome].to_python(valor) for nome, valor in linha.items()})
+        for linha in conteudo.get(modelo._meta.label, [])
+    ]
+
+
+class HistoricoArquivado:
+    """Registros de um arquivo como instâncias não salvas, com as relações já ligadas para os templates."""
+
+    _CAMPOS_USUARIO = [
+        (Afericao, 'usuario'), (AtendimentoMultidisciplinar, 'profissional'),
+        (TriagemHipertensao, 'profissional'), (AtendimentoMedico, 'medico'),
+    ]
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        conteudo = _ler(arquivo)
+        self.registros = {modelo: _instancias(conteudo, modelo) for modelo, _ in CONTEUDO}
+
+        # Profissionais em uma consulta (as FKs apontam para as tabelas do dia a dia)
+        usuarios = Usuario.objects.in_bulk({
+            getattr(registro, f'{campo}_id') for modelo, campo in self._CAMPOS_USUARIO
+            for registro in self.registros[modelo]
+        } - {None})
+        for modelo, campo in self._CAMPOS_USUARIO:
+            for registro in self.registros[modelo]:
+                registro._state.fields_cache[campo] = usuarios.get(getattr(registro, f'{campo}_id'))
+
+        atendimentos = {a.pk: a for a in self.registros[AtendimentoMedico]}
+        itens = defaultdict(list)
+        for item in self.registros[ItemPrescricao]:
+            itens[item.prescricao_id].append(item)
+        for prescricao in self.registros[PrescricaoMedica]:
+            prescricao._state.fields_cache['atendimento'] = atendimentos.get(prescricao.atendimento_id)
+            prescricao._prefetched_objects_cache = {'itens': itens[prescricao.pk]}
+
+    def __getitem__(self, modelo):
+        return self.registros[modelo]
+
+
+def carregar_arquivo(paciente):
+    """Histórico arquivado do paciente (somente leitura) ou None."""
+    arquivo = ArquivoPaciente.objects.filter(paciente=paciente).first()
+    return HistoricoArquivado(arquivo) if arquivo else None
+
+
+def restaurar_paciente(paciente):
+    """Devolve o histórico arquivado às tabelas, com as chaves originais. Retorna os registros restaurados."""
+    with transaction.atomic():
+        arquivo = ArquivoPaciente.objects.filter(paciente=paciente).first()
+        if arquivo is None:
+            return 0
+        conteudo = _ler(arquivo)
+        total = 0
+        for modelo, _ in CONTEUDO:
+            # bulk_create não chama os save() dos modelos: o resumo do paciente já está certo
+            total += len(modelo.objects.bulk_create(_instancias(conteudo, modelo), batch_size=500))
+
+        # Ignora medicamentos excluídos do catálogo nesse meio tempo
+        existentes = set(Medicamento.objects.values_list('id', flat=True))
+        MEDICAMENTOS_AFERICAO.objects.bulk_create([
+            MEDICAMENTOS_AFERICAO(afericao_id=afericao_id, medicamento_id=medicamento_id)
+            for afericao_id, medicamento_id in conteudo.get(CHAVE_MEDICAMENTOS, []) if medicamento_id in existentes
+        ], batch_size=500)
+
+        arquivo.delete()
+    return total
@@ -0,0 +1,121 @@
+"""
+Usuário e papéis da requisição sem ir ao banco.
+
+- A sessão fica no cache (SESSION_ENGINE em settings), não na tabela django_session.
+- O usuário logado fica no cache compartilhado junto com o hash de autenticação da sessão; só
+  vale se o hash bater com o da sessão (senha trocada = sessões antigas deslogadas, como no
+  Django). Qualquer save/delete do usuário apaga a entrada (sinais no fim do arquivo).
+- Os papéis (admin, médico, equipe multi, equipe de saúde) são calculados uma vez por requisição
+  e usados pelos decoradores e, via context processor, pelos templates. O menu lateral e os cartões
+  do início ficam em cache por combinação de papéis ({% cache ... papeis.chave_menu %}).
+"""
+import hashlib
+from functools import cached_property, lru_cache
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template.loader import get_template
+from django.utils.autoreload import file_changed
+from django.utils.functional import SimpleLazyObject
+
+from . import cache
+from .models import Usuario
+
+MULTI = {'ENF', 'NUT', 'FAR'}
+EQUIPE_SAUDE = {'MED', 'ENF', 'NUT', 'FAR'}
+TEMPLATES_MENU = ('sidebar.html', 'index.html')
+
+
+def _cache():
+    return caches[getattr(settings, 'USUARIO_CACHE_ALIAS', 'default')]
+
+
+def _chave(usuario_id):
+    return f'usuario:{usuario_id}'
+
+
+def carregar_usuario(request):
+    """Mesmo resultado de django.contrib.auth.get_user, mas do cache quando o hash da sessão confere."""
+    try:
+        usuario_id = request.session[SESSION_KEY]
+        backend = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    hash_sessao = request.session.get(HASH_SESSION_KEY)
+
+    if hash_sessao and backend in settings.AUTHENTICATION_BACKENDS:
+        em_cache = _cache().get(_chave(usuario_id))
+        if em_cache is not None and em_cache[0] == hash_sessao:
+            return em_cache[1]
+
+    usuario = get_user(request)  # confere o hash (e desloga se não bater) e se o usuário está ativo
+    if usuario.is_authenticated:
+        _cache().set(_chave(usuario.pk), (usuario.get_session_auth_hash(), usuario),
+                     getattr(settings, 'USUARIO_CACHE_SEGUNDOS', 300))
+    return usuario
+
+
+class AutenticacaoMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware do Django com o request.user vindo de carregar_usuario."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: carregar_usuario(request))
+
+
+@lru_cache(maxsize=None)
+def _versao_templates_menu():
+    """Hash dos templates com fragmentos de menu: um deploy que os altere não relê fragmentos antigos."""
+    conteudo = hashlib.md5()
+    for nome in TEMPLATES_MENU:
+        with open(get_template(nome).origin.name, 'rb') as arquivo:
+            conteudo.update(arquivo.read())
+    return conteudo.hexdigest()[:8]
+
+
+@receiver(file_changed)
+def _template_alterado(sender, file_path, **kwargs):
+    # runserver: o autoreload recarrega templates sem reiniciar o processo
+    if file_path.suffix == '.html':
+        _versao_templates_menu.cache_clear()
+
+
+class Papeis:
+    def __init__(self, usuario):
+        tipo = usuario.tipo_profissional if usuario.is_authenticated else None
+        self.admin = bool(usuario.is_authenticated and usuario.is_superuser)
+        self.medico = self.admin or tipo == 'MED'
+        self.multi = self.admin or tipo in MULTI
+        self.equipe_saude = self.admin or tipo in EQUIPE_SAUDE
+
+    @cached_property
+    def chave_menu(self):
+        """Chave dos fragmentos de menu: papéis, versão dos templates e do namespace 'menu' em core.cache."""
+        papeis = f"{self.admin:d}{self.medico:d}{self.multi:d}{self.equipe_saude:d}"
+        return f"{papeis}:{_versao_templates_menu()}:v{cache.versao('menu')}"
+
+
+def papeis(request):
+    """Papéis do usuário da requisição, calculados na primeira chamada e guardados no request."""
+    if not hasattr(request, '_papeis'):
+        request._papeis = Papeis(request.user)
+    return request._papeis
+
+
+def papeis_do_usuario(request):
+    """Context processor: {{ papeis.admin }}, {{ papeis.multi }}... nos templates."""
+    return {'papeis': SimpleLazyObject(lambda: papeis(request))}
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def _descartar_usuario_em_cache(sender, instance, update_fields=None, **kwargs):
+    _cache().delete(_chave(instance.pk))
+    # O login só grava last_login: não mexe no menu
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        cache.invalidar('menu')
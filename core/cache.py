@@ -0,0 +1,105 @@
+"""
+Camada de cache sobre o cache compartilhado entre os workers (settings.CACHES['default']).
+
+- Chaves com namespace e versão: 'hipertensao:<namespace>:v<versão>:<chave>'. invalidar(namespace)
+  só incrementa a versão; as entradas antigas deixam de ser lidas e expiram sozinhas.
+- Proteção contra estouro de recálculo: quem encontra a entrada vencida pega uma trava (cache.add)
+  e recalcula sozinho; os outros esperam o valor novo (ou, na renovação antecipada, seguem com o
+  valor ainda válido). A renovação antecipada é probabilística (XFetch): quanto mais perto do
+  vencimento e mais caro o cálculo, maior a chance de uma requisição renovar antes de vencer.
+- Acertos, faltas, renovações e esperas vão para core.metricas (cache_consultas_total).
+Obs.: no backend de arquivos o add() não é atômico entre processos (pode haver dois cálculos
+simultâneos de vez em quando); no Redis é.
+"""
+import hashlib
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metricas
+
+PREFIXO = 'hipertensao'
+
+
+def _cache():
+    return caches[getattr(settings, 'CORE_CACHE_ALIAS', 'default')]
+
+
+def _chave_versao(namespace):
+    return f'{PREFIXO}:{namespace}:versao'
+
+
+def versao(namespace):
+    return _cache().get_or_set(_chave_versao(namespace), 1, None)
+
+
+def _chave(namespace, chave):
+    if isinstance(chave, (list, tuple)):
+        chave = ':'.join(str(parte) for parte in chave)
+    chave = str(chave)
+    if len(chave) > 150 or not chave.isprintable() or ' ' in chave:
+        chave = hashlib.md5(chave.encode('utf-8')).hexdigest()  # limite e caracteres do memcached
+    return f'{PREFIXO}:{namespace}:v{versao(namespace)}:{chave}'
+
+
+def invalidar(namespace):
+    """Descarta todas as entradas do namespace (em todos os workers)."""
+    # set em vez de incr: o incr genérico do Django regrava a chave com o timeout padrão (a versão
+    # expiraria e voltaria a 1). Duas invalidações simultâneas somando só 1 não fazem diferença.
+    _cache().set(_chave_versao(namespace), versao(namespace) + 1, None)
+
+
+def apagar(namespace, chave):
+    _cache().delete(_chave(namespace, chave))
+
+
+def obter(namespace, chave, calcular, segundos, beta=1.0, espera_maxima=10):
+    """
+    Valor em cache de calcular() ou o recalculado. `segundos` é a validade; `beta` > 1 antecipa
+    mais a renovação. Quem não pega a trava e não tem valor válido espera até `espera_maxima` s.
+    """
+    cache = _cache()
+    chave = _chave(namespace, chave)
+    entrada = cache.get(chave)  # (valor, segundos do último cálculo, vence_em)
+    agora = time.time()
+    if entrada is not None:
+        valor, custo, vence_em = entrada
+        if agora - custo * beta * math.log(1 - random.random()) < vence_em:
+            metricas.incrementar('cache_consultas_total', namespace=namespace, resultado='acerto')
+            return valor
+
+    trava = f'{chave}:trava'
+    if cache.add(trava, 1, espera_maxima):
+        try:
+            return _calcular_e_gravar(namespace, chave, calcular, segundos, renovacao=entrada is not None)
+        finally:
+            cache.delete(trava)
+
+    if entrada is not None:  # outro worker já está renovando: o valor atual ainda vale
+        metricas.incrementar('cache_consultas_total', namespace=namespace, resultado='acerto')
+        return entrada[0]
+
+    metricas.incrementar('cache_consultas_total', namespace=namespace, resultado='espera')
+    limite = time.monotonic() + espera_maxima
+    while time.monotonic() < limite:
+        time.sleep(0.05)
+        entrada = cache.get(chave)
+        if entrada is not None:
+            return entrada[0]
+        if not cache.has_key(trava):
+            break  # quem calculava falhou: calcula aqui
+    return _calcular_e_gravar(namespace, chave, calcular, segundos, renovacao=False)
+
+
+def _calcular_e_gravar(namespace, chave, calcular, segundos, renovacao):
+    metricas.incrementar('cache_consultas_total', namespace=namespace,
+                         resultado='renovacao' if renovacao else 'falta')
+    inicio = time.time()
+    valor = calcular()
+    custo = time.time() - inicio
+    metricas.observar('cache_calculo_segundos', custo, namespace=namespace)
+    _cache().set(chave, (valor, custo, inicio + custo + segundos), segundos)
+    return valor
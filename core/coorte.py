@@ -0,0 +1,29 @@
+"""
+Consultas em conjunto (set-based) sobre a coorte de pacientes, usadas pelos
+comandos de reprocessamento em lote.
+"""
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+
+def ultimos_por_paciente(queryset, campo_data, *campos):
+    """
+    Retorna {paciente_id: (campos...)} com o registro mais recente de cada paciente
+    do queryset, em uma única consulta (ROW_NUMBER() particionado por paciente).
+    """
+    qs = queryset.annotate(
+        _ordem=Window(
+            RowNumber(),
+            partition_by=F('paciente_id'),
+            order_by=(F(campo_data).desc(), F('id').desc()),
+        )
+    ).filter(_ordem=1).values_list('paciente_id', *campos)
+    return {linha[0]: linha[1:] for linha in qs}
+
+
+def idades_em(datas_nascimento, referencia):
+    """Idade em anos completos na data de referência para uma lista de datas de nascimento."""
+    return [
+        referencia.year - n.year - ((referencia.month, referencia.day) < (n.month, n.day))
+        for n in datas_nascimento
+    ]
@@ -4,12 +4,15 @@ from django.shortcuts import redirect
 from django.contrib import messages
 from functools import wraps
 
+from .autenticacao import papeis
+from .replica import estado_atual
+
 
 # Decorador para garantir que apenas o Admin acesse
 def admin_only(view_func):
     def wrapper_func(request, *args, **kwargs):
         # Verifica se é superusuário
-        if request.user.is_authenticated and request.user.is_superuser:
+        if papeis(request).admin:
             return view_func(request, *args, **kwargs)
         else:
             messages.error(request, "Você não tem permissão para acessar esta página.")
@@ -19,7 +22,7 @@ def admin_only(view_func):
 # Decorador para Médicos (e Admin)
 def medico_only(view_func):
     def wrapper_func(request, *args, **kwargs):
-        if request.user.is_authenticated and (request.user.tipo_profissional == 'MED' or request.user.is_superuser):
+        if papeis(request).medico:
             return view_func(request, *args, **kwargs)
         else:
             messages.error(request, "Acesso restrito a Médicos.")
@@ -29,9 +32,8 @@ def medico_only(view_func):
 # Decorador para Equipe Multi + Admin
 def multi_only(view_func):
     def wrapper_func(request, *args, **kwargs):
-        # Lista de profissionais permitidos
-        allowed_roles = ['ENF', 'NUT', 'FAR']
-        if request.user.is_authenticated and (request.user.tipo_profissional in allowed_roles or request.user.is_superuser):
+        # Enfermagem, Nutrição e Farmácia (core.autenticacao.MULTI)
+        if papeis(request).multi:
             return view_func(request, *args, **kwargs)
         else:
             messages.error(request, "Acesso restrito à Equipe Multidisciplinar.")
@@ -40,12 +42,22 @@ def multi_only(view_func):
 
 def health_team(view_func):
     def wrapper_func(request, *args, **kwargs):
-        allowed_roles = ['MED', 'ENF', 'NUT', 'FAR']
-        if request.user.is_authenticated and (
-                request.user.tipo_profissional in allowed_roles or request.user.is_superuser):
+        if papeis(request).equipe_saude:
             return view_func(request, *args, **kwargs)
         else:
             messages.error(request, "Acesso restrito à Equipe de Profissionais de Saúde.")
             return redirect('index')
 
-    return wrapper_func
\ No newline at end of file
+    return wrapper_func
+
+
+# Views só de leitura (painéis, relatórios, exportações): as consultas vão para a réplica de
+# leitura, se houver uma configurada (ver core/replica.py). Usar por último, junto da view.
+def usa_replica(view_func):
+    @wraps(view_func)
+    def wrapper_func(request, *args, **kwargs):
+        estado = estado_atual()
+        if estado is not None:
+            estado.usa_replica = True
+        return view_func(request, *args, **kwargs)
+    return wrapper_func
@@ -0,0 +1,84 @@
+"""
+Disjuntor (circuit breaker) para as APIs externas: depois de N falhas seguidas a API é dada como
+fora do ar por alguns segundos e as chamadas falham na hora, em vez de segurar a página (e o
+worker) até o timeout. Passado esse tempo, uma chamada de teste decide se volta ao normal.
+O estado é por processo; latência, erros e estado vão para core.metricas.
+"""
+import threading
+import time
+
+from . import metricas
+
+FECHADO, MEIO_ABERTO, ABERTO = 0, 1, 2
+
+
+class CircuitoAberto(Exception):
+    pass
+
+
+class Disjuntor:
+    def __init__(self, nome, falhas_para_abrir=3, segundos_aberto=30):
+        self.nome = nome
+        self.falhas_para_abrir = falhas_para_abrir
+        self.segundos_aberto = segundos_aberto
+        self.estado = FECHADO
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self._lock = threading.Lock()
+
+    def _mudar(self, estado):
+        if estado != self.estado:
+            self.estado = estado
+            metricas.definir('disjuntor_estado', estado, api=self.nome)
+
+    def _permite(self):
+        with self._lock:
+            if self.estado == ABERTO:
+                if time.monotonic() < self.aberto_ate:
+                    return False
+                self._mudar(MEIO_ABERTO)  # esta chamada é o teste
+            elif self.estado == MEIO_ABERTO:
+                return False  # já há uma chamada de teste em andamento
+            return True
+
+    def _registrar(self, sucesso):
+        with self._lock:
+            if sucesso:
+                self.falhas = 0
+                self._mudar(FECHADO)
+                return
+            self.falhas += 1
+            if self.estado == MEIO_ABERTO or self.falhas >= self.falhas_para_abrir:
+                self.aberto_ate = time.monotonic() + self.segundos_aberto
+                self._mudar(ABERTO)
+
+    def chamar(self, funcao, *args, **kwargs):
+        """
+        Executa a chamada HTTP (ex.: requests.get) pelo disjuntor. Exceções e respostas 5xx contam
+        como falha; com o circuito aberto levanta CircuitoAberto sem chamar a API.
+        """
+        if not self._permite():
+            metricas.incrementar('api_externa_bloqueadas_total', api=self.nome)
+            raise CircuitoAberto(f'API {self.nome} indisponível (disjuntor aberto)')
+
+        inicio = time.perf_counter()
+        try:
+            response = funcao(*args, **kwargs)
+        except Exception:
+            self._falhou(inicio)
+            raise
+        if response.status_code >= 500:
+            self._falhou(inicio)
+        else:
+            metricas.observar('api_externa_segundos', time.perf_counter() - inicio, api=self.nome)
+            self._registrar(True)
+        return response
+
+    def _falhou(self, inicio):
+        metricas.observar('api_externa_segundos', time.perf_counter() - inicio, api=self.nome)
+        metricas.incrementar('api_externa_erros_total', api=self.nome)
+        self._registrar(False)
+
+
+LABORATORIO = Disjuntor('laboratorio')
+OMS = Disjuntor('oms')
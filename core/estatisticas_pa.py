@@ -0,0 +1,227 @@
+"""
+Estatísticas de PA por paciente mantidas a cada aferição nova, sem reler o histórico: média,
+desvio-padrão (variância de Welford), variabilidade visita a visita (ARV: média das diferenças
+absolutas entre aferições seguidas) e percentual de aferições no alvo.
+
+- EstatisticaPressao: todo o histórico, atualizada em O(1) por aferição (registrar);
+- ResumoPressaoDiario: os mesmos acumuladores por dia. A janela dos últimos N dias junta no máximo N
+  linhas (fórmula de Chan para médias e variâncias): em Python (janela) e em SQL (coorte, para
+  filtros de listas). A variação entre duas aferições conta no dia da segunda;
+- aferição anterior à última já contada (importação fora de ordem), editada ou excluída: o paciente
+  é recalculado do zero (recalcular). Também após mudar o alvo: python manage.py recalcular_estatisticas_pa.
+Alvo e janela: ESTATISTICAS_PA_PADRAO, sobrescritos por settings.ESTATISTICAS_PA.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Greatest, NullIf, Sqrt
+from django.utils import timezone
+
+from .models import Afericao, EstatisticaPressao, ResumoPressaoDiario
+
+ESTATISTICAS_PA_PADRAO = {
+    'alvo_pas': 140,  # no alvo: PAS < 140 e PAD < 90 (o "controlado" do painel)
+    'alvo_pad': 90,
+    'janela_dias': 90,
+}
+CAMPOS_ACUMULADOR = ['n', 'media_pas', 'm2_pas', 'media_pad', 'm2_pad', 'no_alvo', 'n_variacoes',
+                     'soma_variacao_pas', 'soma_variacao_pad']
+CAMPOS_ESTATISTICA = CAMPOS_ACUMULADOR + ['ultima_pas', 'ultima_pad', 'data_ultima']
+PACIENTES_POR_LOTE = 500
+
+
+def parametros():
+    parametros = dict(ESTATISTICAS_PA_PADRAO)
+    parametros.update(getattr(settings, 'ESTATISTICAS_PA', {}))
+    return parametros
+
+
+def _acumular(acumulador, pas, pad, anterior, alvo):
+    """Uma aferição a mais (Welford). `anterior`: (PAS, PAD) da aferição anterior do paciente, ou None."""
+    acumulador.n += 1
+    delta = pas - acumulador.media_pas
+    acumulador.media_pas += delta / acumulador.n
+    acumulador.m2_pas += delta * (pas - acumulador.media_pas)
+    delta = pad - acumulador.media_pad
+    acumulador.media_pad += delta / acumulador.n
+    acumulador.m2_pad += delta * (pad - acumulador.media_pad)
+    if pas < alvo['alvo_pas'] and pad < alvo['alvo_pad']:
+        acumulador.no_alvo += 1
+    if anterior is not None:
+        acumulador.n_variacoes += 1
+        acumulador.soma_variacao_pas += abs(pas - anterior[0])
+        acumulador.soma_variacao_pad += abs(pad - anterior[1])
+
+
+def _combinar(destino, origem):
+    """Junta os acumuladores de `origem` aos de `destino` (Chan et al.)."""
+    n = destino.n + origem.n
+    if not origem.n:
+        return
+    for pressao in ('pas', 'pad'):
+        media_destino, media_origem = getattr(destino, f'media_{pressao}'), getattr(origem, f'media_{pressao}')
+        delta = media_origem - media_destino
+        setattr(destino, f'm2_{pressao}', getattr(destino, f'm2_{pressao}') + getattr(origem, f'm2_{pressao}')
+                + delta * delta * destino.n * origem.n / n)
+        setattr(destino, f'media_{pressao}', media_destino + delta * origem.n / n)
+    destino.n = n
+    for campo in ('no_alvo', 'n_variacoes', 'soma_variacao_pas', 'soma_variacao_pad'):
+        setattr(destino, campo, getattr(destino, campo) + getattr(origem, campo))
+
+
+def _dia(data, fuso=None):
+    return data.astimezone(fuso or timezone.get_current_timezone()).date()
+
+
+def registrar(afericoes):
+    """
+    Acrescenta aferições recém-gravadas às estatísticas (Afericao.save e importação em lote): duas
+    leituras e as gravações do lote, qualquer que seja o tamanho do histórico.
+    """
+    alvo = parametros()
+    por_paciente = defaultdict(list)
+    for afericao in afericoes:
+        por_paciente[afericao.paciente_id].append(afericao)
+
+    fora_de_ordem = []
+    with transaction.atomic():
+        # select_for_update: dois registros simultâneos do mesmo paciente não perdem atualização (no
+        # SQLite a transação IMMEDIATE já serializa as escritas)
+        estatisticas = EstatisticaPressao.objects.select_for_update().in_bulk(list(por_paciente))
+        resumos = {
+            (resumo.paciente_id, resumo.dia): resumo
+            for resumo in ResumoPressaoDiario.objects.select_for_update().filter(
+                paciente_id__in=list(por_paciente), dia__in={_dia(a.data_afericao) for a in afericoes})
+        }
+        existentes = set(resumos)
+
+        alteradas, novas = [], []
+        for paciente_id, lista in por_paciente.items():
+            lista.sort(key=attrgetter('data_afericao'))
+            estatistica = estatisticas.get(paciente_id)
+            if estatistica is not None and estatistica.data_ultima and lista[0].data_afericao < estatistica.data_ultima:
+                fora_de_ordem.append(paciente_id)
+                continue
+            if estatistica is None:
+                estatistica = EstatisticaPressao(paciente_id=paciente_id)
+                novas.append(estatistica)
+            else:
+                alteradas.append(estatistica)
+            for afericao in lista:
+                chave = (paciente_id, _dia(afericao.data_afericao))
+                resumo = resumos.setdefault(chave, ResumoPressaoDiario(paciente_id=paciente_id, dia=chave[1]))
+                anterior = (estatistica.ultima_pas, estatistica.ultima_pad) if estatistica.n else None
+                for acumulador in (estatistica, resumo):
+                    _acumular(acumulador, afericao.pressao_sistolica, afericao.pressao_diastolica, anterior, alvo)
+                estatistica.ultima_pas = afericao.pressao_sistolica
+                estatistica.ultima_pad = afericao.pressao_diastolica
+                estatistica.data_ultima = afericao.data_afericao
+
+        EstatisticaPressao.objects.bulk_create(novas, batch_size=500)
+        EstatisticaPressao.objects.bulk_update(alteradas, CAMPOS_ESTATISTICA, batch_size=500)
+        tocados = [resumo for chave, resumo in resumos.items() if chave[0] not in fora_de_ordem]
+        ResumoPressaoDiario.objects.bulk_create([r for r in tocados if r.pk is None], batch_size=500)
+        ResumoPressaoDiario.objects.bulk_update([r for r in tocados if (r.paciente_id, r.dia) in existentes],
+                                                CAMPOS_ACUMULADOR, batch_size=500)
+        if fora_de_ordem:
+            recalcular(fora_de_ordem)
+
+
+def recalcular(paciente_ids=None, modelos=None):
+    """
+    Refaz as estatísticas a partir das aferições (todas, ou só dos pacientes indicados), lendo o
+    histórico já ordenado pelo índice (paciente, data_afericao). `modelos`: (Afericao,
+    EstatisticaPressao, ResumoPressaoDiario) da migração que preenche as tabelas.
+    Retorna o número de pacientes.
+    """
+    Afericoes, Estatisticas, Resumos = modelos or (Afericao, EstatisticaPressao, ResumoPressaoDiario)
+    alvo = parametros()
+    afericoes = Afericoes.objects.order_by('paciente_id', 'data_afericao', 'id')
+    if paciente_ids is not None:
+        afericoes = afericoes.filter(paciente_id__in=paciente_ids)
+
+    estatisticas, resumos = [], []
+    total = 0
+
+    def gravar():
+        Estatisticas.objects.bulk_create(estatisticas, batch_size=500)
+        Resumos.objects.bulk_create(resumos, batch_size=500)
+        estatisticas.clear()
+        resumos.clear()
+
+    with transaction.atomic():
+        for modelo in (Estatisticas, Resumos):
+            apagar = modelo.objects.all()
+            if paciente_ids is not None:
+                apagar = apagar.filter(paciente_id__in=paciente_ids)
+            apagar.delete()  # um DELETE só: nada referencia estas tabelas
+
+        fuso = timezone.get_current_timezone()  # uma vez, não por aferição
+        estatistica = resumo = None
+        for paciente_id, data, pas, pad in afericoes.values_list(
+                'paciente_id', 'data_afericao', 'pressao_sistolica', 'pressao_diastolica').iterator(chunk_size=2000):
+            if estatistica is None or estatistica.paciente_id != paciente_id:
+                if len(estatisticas) >= PACIENTES_POR_LOTE:
+                    gravar()
+                estatistica = Estatisticas(paciente_id=paciente_id)
+                estatisticas.append(estatistica)
+                resumo = None
+                total += 1
+            dia = _dia(data, fuso)
+            if resumo is None or resumo.dia != dia:
+                resumo = Resumos(paciente_id=paciente_id, dia=dia)
+                resumos.append(resumo)
+            anterior = (estatistica.ultima_pas, estatistica.ultima_pad) if estatistica.n else None
+            for acumulador in (estatistica, resumo):
+                _acumular(acumulador, pas, pad, anterior, alvo)
+            estatistica.ultima_pas, estatistica.ultima_pad, estatistica.data_ultima = pas, pad, data
+        gravar()
+    return total
+
+
+def _inicio_janela(dias):
+    return timezone.localdate() - timedelta(days=(dias or parametros()['janela_dias']) - 1)
+
+
+def janela(paciente_id, dias=None):
+    """Acumuladores dos últimos `dias` dias (padrão: janela_dias), em um ResumoPressaoDiario não gravado."""
+    combinado = ResumoPressaoDiario(paciente_id=paciente_id, dia=timezone.localdate())
+    for resumo in ResumoPressaoDiario.objects.filter(paciente_id=paciente_id, dia__gte=_inicio_janela(dias)):
+        _combinar(combinado, resumo)
+    return combinado
+
+
+def _desvio(pressao, n):
+    media = F(f'media_{pressao}')
+    soma = Sum(F('n') * media)
+    quadrados = Sum(F(f'm2_{pressao}') + F('n') * media * media)
+    variancia = (quadrados - soma * soma / n) / NullIf(n - 1, 0)
+    return Sqrt(Greatest(variancia, Value(0.0)))  # arredondamento pode dar -0,000…
+
+
+def _float(expressao):
+    return Cast(expressao, FloatField())
+
+
+def coorte(dias=None, **filtros):
+    """
+    Estatísticas da janela por paciente, em SQL (values com paciente_id), para filtrar coortes:
+    coorte(percentual_alvo__lt=50).values('paciente_id') como subconsulta de Paciente. Campos:
+    total, media_sistolica, media_diastolica, desvio_sistolica, desvio_diastolica, arv_sistolica,
+    arv_diastolica e percentual_alvo (os nomes dos acumuladores já são colunas do modelo).
+    """
+    n = Sum('n')
+    return ResumoPressaoDiario.objects.filter(dia__gte=_inicio_janela(dias)).values('paciente_id').annotate(
+        total=n,
+        media_sistolica=Sum(F('n') * F('media_pas')) / n,
+        media_diastolica=Sum(F('n') * F('media_pad')) / n,
+        desvio_sistolica=_desvio('pas', n),
+        desvio_diastolica=_desvio('pad', n),
+        arv_sistolica=_float(Sum('soma_variacao_pas')) / NullIf(Sum('n_variacoes'), 0),
+        arv_diastolica=_float(Sum('soma_variacao_pad')) / NullIf(Sum('n_variacoes'), 0),
+        percentual_alvo=100 * _float(Sum('no_alvo')) / n,
+    ).filter(**filtros).order_by()
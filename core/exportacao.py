@@ -0,0 +1,238 @@
+"""
+Exportação em planilha (CSV ou XLSX) do cadastro de pacientes, aferições e atendimentos.
+
+As linhas saem de values_list(...).iterator(chunk_size=...): sem instanciar modelos e sem
+carregar o resultado inteiro, em memória constante para qualquer volume. O CSV (';', UTF-8 com
+BOM, como os das importações) é gerado em fluxo; o XLSX usa o modo write-only do openpyxl, que
+grava as linhas em arquivo temporário à medida que chegam, em quantas abas forem necessárias
+(limite de 1.048.576 linhas por aba do Excel). Pelo navegador o XLSX vai até LIMITE_XLSX_WEB linhas
+(settings.EXPORTACAO_XLSX_LIMITE_WEB): o arquivo só começa a ser enviado depois de completo, e um
+volume maior prenderia a requisição; acima disso, CSV ou python manage.py exportar.
+- ler_filtros(request.GET): município(s), período e situação do paciente;
+- filtrar / consultar(nome, banco=..., **filtros): consulta e linhas do conjunto;
+- gerar(nome, formato, linhas): pedaços de bytes para StreamingHttpResponse ou para um arquivo.
+"""
+import csv
+import tempfile
+from datetime import date, datetime, time as hora_do_dia, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import Afericao, AtendimentoMedico, AtendimentoMultidisciplinar, Paciente, Usuario
+
+FORMATOS = ('csv', 'xlsx')
+LINHAS_POR_LOTE = 2000
+TAMANHO_PEDACO = 64 * 1024
+LINHAS_POR_ABA = 1_048_576 - 1  # limite de linhas da aba do Excel, menos o cabeçalho
+LIMITE_XLSX_WEB = 200_000
+
+
+class Conjunto:
+    """Um modelo exportável: colunas (cabeçalho, caminho no values_list) e onde aplicar os filtros."""
+
+    def __init__(self, modelo, titulo, campo_data, colunas, paciente='', usuario=None):
+        self.modelo = modelo
+        self.titulo = titulo
+        self.campo_data = campo_data
+        self.cabecalho = [cabecalho for cabecalho, _ in colunas]
+        self.campos = [campo for _, campo in colunas]
+        self.paciente = paciente  # prefixo até o Paciente ('' no próprio cadastro)
+        self.usuario = usuario  # coluna com o id do profissional, trocado pelo login
+
+
+COLUNAS_PACIENTE = [
+    ('CPF', 'paciente__cpf'), ('Paciente', 'paciente__nome'), ('Município', 'paciente__municipio'),
+]
+
+CONJUNTOS = {
+    'pacientes': Conjunto(Paciente, 'Pacientes', 'data_insercao', [
+        ('ID', 'id'), ('Nome', 'nome'), ('CPF', 'cpf'), ('Sexo', 'sexo'), ('Etnia', 'etnia'),
+        ('Data de Nascimento', 'data_nascimento'), ('Município', 'municipio'), ('Telefone', 'telefone'),
+        ('SIRESP', 'siresp'), ('Data de Inserção', 'data_insercao'), ('Data da Alta', 'data_alta'),
+        ('Ativo', 'ativo'), ('Nível de Risco', 'nivel_risco'), ('Risco PREVENT (%)', 'risco_prevent_atual'),
+        ('Última PAS', 'ultima_pas'), ('Última PAD', 'ultima_pad'), ('Última Aferição', 'data_ultima_afericao'),
+    ]),
+    'afericoes': Conjunto(Afericao, 'Aferições', 'data_afericao', [
+        ('ID', 'id'), *COLUNAS_PACIENTE, ('Data', 'data_afericao'), ('PAS', 'pressao_sistolica'),
+        ('PAD', 'pressao_diastolica'), ('FC', 'frequencia_cardiaca'), ('Peso (kg)', 'peso'),
+        ('Altura (m)', 'altura'), ('IMC', 'imc'), ('Registrado por', 'usuario_id'),
+        ('Observação', 'observacao'),
+    ], paciente='paciente__', usuario='usuario_id'),
+    'atendimentos': Conjunto(AtendimentoMedico, 'Atendimentos Médicos', 'data_atendimento', [
+        ('ID', 'id'), *COLUNAS_PACIENTE, ('Data', 'data_atendimento'), ('Médico', 'medico_id'),
+        ('Score PREVENT (%)', 'score_prevent_valor'), ('CID-10 Principal', 'cid10_1'),
+        ('CID-10 Secundário', 'cid10_2'),
+    ], paciente='paciente__', usuario='medico_id'),
+    'atendimentos_multi': Conjunto(AtendimentoMultidisciplinar, 'Atendimentos Multi', 'data_atendimento', [
+        ('ID', 'id'), *COLUNAS_PACIENTE, ('Data', 'data_atendimento'), ('Profissional', 'profissional_id'),
+        ('Peso (kg)', 'peso'), ('Altura (m)', 'altura'), ('IMC', 'imc'),
+        ('Circunferência Abdominal (cm)', 'circunferencia_abdominal'), ('Diabetes', 'tem_diabetes'),
+        ('Fumante', 'fumante'), ('Lesão de Órgão-Alvo', 'tem_lesao_orgao'),
+    ], paciente='paciente__', usuario='profissional_id'),
+}
+
+
+def ler_filtros(dados):
+    """Filtros da query string: municipios[] (vários), inicio/fim (AAAA-MM-DD), ativo (1/0). ValueError se inválidos."""
+    filtros = {'municipios': [m for m in dados.getlist('municipios[]') if m]}
+    for campo in ('inicio', 'fim'):
+        valor = dados.get(campo)
+        try:
+            filtros[campo] = date.fromisoformat(valor) if valor else None
+        except ValueError:
+            raise ValueError(f"Data inválida em '{campo}': {valor} (use AAAA-MM-DD).")
+    if filtros['inicio'] and filtros['fim'] and filtros['inicio'] > filtros['fim']:
+        raise ValueError('A data inicial é posterior à final.')
+    filtros['ativo'] = {'1': True, '0': False}.get(dados.get('ativo'))
+    return filtros
+
+
+def filtrar(nome, municipios=None, inicio=None, fim=None, ativo=None, banco=None):
+    """
+    values_list do conjunto. Datas inclusivas; `ativo` None = todos os pacientes. Sem ORDER BY: as
+    linhas saem na ordem do plano (por id, ou por paciente e data quando o filtro de município usa o
+    índice), sem o SQLite ordenar o resultado inteiro numa B-tree temporária antes da primeira linha.
+    """
+    conjunto = CONJUNTOS[nome]
+    consulta = conjunto.modelo.objects.using(banco or 'default')
+    filtros = {}
+    if municipios:
+        filtros[f'{conjunto.paciente}municipio__in'] = municipios
+    if ativo is not None:
+        filtros[f'{conjunto.paciente}ativo'] = ativo
+    campo_data = conjunto.modelo._meta.get_field(conjunto.campo_data)
+    if campo_data.get_internal_type() == 'DateTimeField':
+        # Intervalo de datas locais em vez de __date (que não usa índice)
+        if inicio:
+            filtros[f'{conjunto.campo_data}__gte'] = timezone.make_aware(datetime.combine(inicio, hora_do_dia.min))
+        if fim:
+            filtros[f'{conjunto.campo_data}__lt'] = timezone.make_aware(
+                datetime.combine(fim + timedelta(days=1), hora_do_dia.min))
+    else:
+        if inicio:
+            filtros[f'{conjunto.campo_data}__gte'] = inicio
+        if fim:
+            filtros[f'{conjunto.campo_data}__lte'] = fim
+    return consulta.filter(**filtros).order_by().values_list(*conjunto.campos)
+
+
+def consultar(nome, banco=None, **filtros):
+    """
+    Linhas (tuplas) do conjunto, lidas em lotes. `banco`: alias da conexão (as views passam a
+    réplica, resolvida antes da resposta em fluxo).
+    """
+    conjunto = CONJUNTOS[nome]
+    linhas = filtrar(nome, banco=banco, **filtros).iterator(chunk_size=LINHAS_POR_LOTE)
+    if conjunto.usuario is None:
+        return linhas
+    # Login do profissional por dicionário, sem JOIN: com a tabela de usuários (pequena) no JOIN o
+    # SQLite começa a leitura por ela e varre as linhas pelo índice de usuario_id
+    logins = dict(Usuario.objects.using(banco or 'default').values_list('id', 'username'))
+    posicao = conjunto.campos.index(conjunto.usuario)
+    return (linha[:posicao] + (logins.get(linha[posicao]),) + linha[posicao + 1:] for linha in linhas)
+
+
+def _tipo(conjunto, caminho):
+    modelo = conjunto.modelo
+    *relacoes, nome = caminho.split('__')
+    for relacao in relacoes:
+        modelo = modelo._meta.get_field(relacao).related_model
+    return modelo._meta.get_field(nome).get_internal_type()
+
+
+def _sem_mudanca(valor):
+    return valor
+
+
+def _formatadores(nome, texto):
+    """
+    Uma função por coluna, escolhida pelo tipo do campo (e não testando o tipo de cada valor), com o
+    fuso local obtido uma vez: a formatação é o custo principal das exportações grandes.
+    """
+    conjunto = CONJUNTOS[nome]
+    fuso = timezone.get_current_timezone()
+
+    def data_hora(valor):
+        return valor.astimezone(fuso).replace(tzinfo=None) if valor is not None else None
+
+    def data_hora_texto(valor):
+        return f'{valor.astimezone(fuso):%d/%m/%Y %H:%M}' if valor is not None else ''
+
+    def data_texto(valor):
+        return f'{valor:%d/%m/%Y}' if valor is not None else ''
+
+    def sim_nao(valor):
+        return 'Sim' if valor else 'Não'
+
+    def decimal_texto(valor):
+        return str(valor).replace('.', ',') if valor is not None else ''  # Excel em português
+
+    por_tipo = {'DateTimeField': data_hora_texto, 'DateField': data_texto, 'BooleanField': sim_nao,
+                'DecimalField': decimal_texto} if texto else {'DateTimeField': data_hora}
+    return [
+        _sem_mudanca if campo == conjunto.usuario else por_tipo.get(_tipo(conjunto, campo), _sem_mudanca)
+        for campo in conjunto.campos
+    ]
+
+
+class _Eco:
+    """'Arquivo' do csv.writer que devolve a linha formatada em vez de gravá-la."""
+
+    def write(self, texto):
+        return texto
+
+
+def gerar_csv(nome, linhas):
+    escritor = csv.writer(_Eco(), delimiter=';')
+    formatadores = _formatadores(nome, texto=True)
+    yield ('\ufeff' + escritor.writerow(CONJUNTOS[nome].cabecalho)).encode('utf-8')
+    lote = []
+    for linha in linhas:
+        lote.append(escritor.writerow([formatar(valor) for formatar, valor in zip(formatadores, linha)]))
+        if len(lote) == LINHAS_POR_LOTE:
+            yield ''.join(lote).encode('utf-8')
+            lote = []
+    if lote:
+        yield ''.join(lote).encode('utf-8')
+
+
+def limite_xlsx_web():
+    return getattr(settings, 'EXPORTACAO_XLSX_LIMITE_WEB', LIMITE_XLSX_WEB)
+
+
+def excede_limite_xlsx_web(nome, **filtros):
+    """True se o conjunto filtrado passa do limite do XLSX pelo navegador (conta só até o limite + 1)."""
+    limite = limite_xlsx_web()
+    return filtrar(nome, **filtros)[:limite + 1].count() > limite
+
+
+def gerar_xlsx(nome, linhas):
+    """
+    O XLSX é um zip: só pode ser enviado depois de completo. As linhas vão para disco, não para a
+    memória; a cada LINHAS_POR_ABA abre-se uma aba nova ("Aferições (2)"...), com o cabeçalho.
+    """
+    conjunto = CONJUNTOS[nome]
+    planilha = Workbook(write_only=True)
+    formatadores = _formatadores(nome, texto=False)
+    aba, numero, na_aba = None, 0, LINHAS_POR_ABA
+    for linha in linhas:
+        if na_aba == LINHAS_POR_ABA:
+            numero += 1
+            aba = planilha.create_sheet(conjunto.titulo if numero == 1 else f'{conjunto.titulo} ({numero})')
+            aba.append(conjunto.cabecalho)
+            na_aba = 0
+        aba.append([formatar(valor) for formatar, valor in zip(formatadores, linha)])
+        na_aba += 1
+    if aba is None:  # sem linhas: só o cabeçalho
+        planilha.create_sheet(conjunto.titulo).append(conjunto.cabecalho)
+    with tempfile.TemporaryFile() as arquivo:
+        planilha.save(arquivo)
+        arquivo.seek(0)
+        while pedaco := arquivo.read(TAMANHO_PEDACO):
+            yield pedaco
+
+
+def gerar(nome, formato, linhas):
+    return gerar_xlsx(nome, linhas) if formato == 'xlsx' else gerar_csv(nome, linhas)
@@ -0,0 +1,361 @@
+"""
+Exportação em massa FHIR R4 (Bulk Data $export) em NDJSON, para a rede regional de saúde.
+
+- Patient (Paciente), Observation (Afericao: painel de PA com PAS/PAD e, se houver, frequência
+  cardíaca), Condition (CID-10 1 a 3 do AtendimentoMedico) e MedicationRequest (ItemPrescricao);
+- um arquivo <Tipo>.ndjson por recurso na pasta da exportação, com as linhas lidas em lotes por
+  values_list(...).iterator(chunk_size): sem instanciar modelos e sem consulta por linha (o que vem
+  de outras tabelas entra no mesmo SELECT);
+- _since: só o que foi criado ou alterado depois da data (campo atualizado_em). O transactionTime
+  do manifesto é o _since da próxima execução incremental. Exclusões não são exportadas;
+- solicitar_exportacao() registra o ExportacaoFHIR e o executa em segundo plano após o commit;
+  o comando exportar_fhir executa na hora (cron);
+- execução sem progresso há FHIR_EXPORTACAO_SEM_PROGRESSO segundos (worker reiniciado no meio) vira
+  ERRO na consulta do status; arquivos e registros saem com DELETE na URL de status (Bulk Data) ou
+  depois de FHIR_EXPORTACAO_RETENCAO_DIAS dias, a cada nova exportação.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, time as hora_do_dia, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Afericao, AtendimentoMedico, ExportacaoFHIR, ItemPrescricao, Paciente
+from .services_cid import descricao_cid10, normalizar_cid10
+
+logger = logging.getLogger(__name__)
+
+TIPOS = ('Patient', 'Observation', 'Condition', 'MedicationRequest')
+FORMATOS_SAIDA = ('application/fhir+ndjson', 'application/ndjson', 'ndjson')
+LINHAS_POR_LOTE = 2000
+RECURSOS_POR_PROGRESSO = 50_000  # a cada tantos recursos a execução registra que continua viva
+
+SISTEMA_CPF = 'http://rnds.saude.gov.br/fhir/r4/NamingSystem/cpf'
+SISTEMA_CID10 = 'http://hl7.org/fhir/sid/icd-10'
+LOINC = 'http://loinc.org'
+UCUM = 'http://unitsofmeasure.org'
+SINAIS_VITAIS = [{'coding': [{
+    'system': 'http://terminology.hl7.org/CodeSystem/observation-category', 'code': 'vital-signs',
+    'display': 'Vital Signs',
+}]}]
+DIAGNOSTICO = [{'coding': [{
+    'system': 'http://terminology.hl7.org/CodeSystem/condition-category', 'code': 'encounter-diagnosis',
+    'display': 'Encounter Diagnosis',
+}]}]
+GENERO = {'M': 'male', 'F': 'female'}
+CURSO_TERAPIA = {'CONTINUO': 'continuous', 'TEMPORARIO': 'acute'}
+
+
+def pasta_exportacao(exportacao_id):
+    raiz = getattr(settings, 'FHIR_EXPORTACAO_PASTA', os.path.join(tempfile.gettempdir(), 'hipertensao_fhir'))
+    return os.path.join(raiz, str(exportacao_id))
+
+
+def _instante(valor):
+    return timezone.localtime(valor).isoformat(timespec='seconds') if valor else None
+
+
+def _meta(atualizado_em):
+    return {'lastUpdated': _instante(atualizado_em)} if atualizado_em else None
+
+
+def _sem_vazios(recurso):
+    return {chave: valor for chave, valor in recurso.items() if valor not in (None, '', [])}
+
+
+def _quantidade(valor, unidade, codigo):
+    return {'value': valor, 'unit': unidade, 'system': UCUM, 'code': codigo}
+
+
+def _loinc(codigo, nome):
+    return {'coding': [{'system': LOINC, 'code': codigo, 'display': nome}]}
+
+
+# --- Recursos: (campos do values_list, função linha -> recursos) ---
+
+def _pacientes(linha):
+    id_, nome, cpf, sexo, nascimento, municipio, telefone, ativo, atualizado_em = linha
+    yield _sem_vazios({
+        'resourceType': 'Patient', 'id': str(id_), 'meta': _meta(atualizado_em),
+        'identifier': [{'system': SISTEMA_CPF, 'value': re.sub(r'\D', '', cpf)}],
+        'active': ativo,
+        'name': [{'text': nome}],
+        'gender': GENERO.get(sexo, 'unknown'),
+        'birthDate': nascimento.isoformat() if nascimento else None,
+        'telecom': [{'system': 'phone', 'value': telefone}] if telefone else None,
+        'address': [{'city': municipio, 'state': 'SP', 'country': 'BR'}] if municipio else None,
+    })
+
+
+def _afericoes(linha):
+    id_, paciente_id, data, sistolica, diastolica, frequencia, atualizado_em = linha
+    comum = {
+        'meta': _meta(atualizado_em), 'status': 'final', 'category': SINAIS_VITAIS,
+        'subject': {'reference': f'Patient/{paciente_id}'}, 'effectiveDateTime': _instante(data),
+    }
+    yield _sem_vazios({
+        'resourceType': 'Observation', 'id': f'pa-{id_}', **comum,
+        'code': _loinc('85354-9', 'Blood pressure panel with all children optional'),
+        'component': [
+            {'code': _loinc('8480-6', 'Systolic blood pressure'),
+             'valueQuantity': _quantidade(sistolica, 'mmHg', 'mm[Hg]')},
+            {'code': _loinc('8462-4', 'Diastolic blood pressure'),
+             'valueQuantity': _quantidade(diastolica, 'mmHg', 'mm[Hg]')},
+        ],
+    })
+    if frequencia:
+        yield _sem_vazios({
+            'resourceType': 'Observation', 'id': f'fc-{id_}', **comum,
+            'code': _loinc('8867-4', 'Heart rate'),
+            'valueQuantity': _quantidade(frequencia, 'beats/minute', '/min'),
+        })
+
+
+def _diagnosticos(linha):
+    id_, paciente_id, data, atualizado_em, *cids = linha
+    for posicao, cid in enumerate(cids, start=1):
+        if not cid:
+            continue
+        codigo = normalizar_cid10(cid)
+        yield _sem_vazios({
+            'resourceType': 'Condition', 'id': f'{id_}-{posicao}', 'meta': _meta(atualizado_em),
+            'category': DIAGNOSTICO,
+            'code': {'coding': [_sem_vazios({'system': SISTEMA_CID10, 'code': codigo,
+                                             'display': descricao_cid10(codigo)})]},
+            'subject': {'reference': f'Patient/{paciente_id}'},
+            'recordedDate': _instante(data),
+        })
+
+
+def _prescricoes(linha):
+    id_, nome, concentracao, posologia, quantidade, tipo, paciente_id, data, atualizado_em = linha
+    quantidade = (quantidade or '').strip()
+    yield _sem_vazios({
+        'resourceType': 'MedicationRequest', 'id': str(id_), 'meta': _meta(atualizado_em),
+        'status': 'unknown',  # a receita não registra suspensão nem dispensação
+        'intent': 'order',
+        'medicationCodeableConcept': {'text': f'{nome} {concentracao}'.strip()},
+        'subject': {'reference': f'Patient/{paciente_id}'},
+        'authoredOn': _instante(data),
+        'courseOfTherapyType': {'coding': [{
+            'system': 'http://terminology.hl7.org/CodeSystem/medicationrequest-course-of-therapy',
+            'code': CURSO_TERAPIA[tipo],
+        }]} if tipo in CURSO_TERAPIA else None,
+        'dosageInstruction': [{'text': posologia}] if posologia else None,
+        'dispenseRequest': {'quantity': {'value': int(quantidade)}} if quantidade.isdigit() else None,
+        'note': [{'text': f'Quantidade: {quantidade}'}] if quantidade and not quantidade.isdigit() else None,
+    })
+
+
+RECURSOS = {
+    'Patient': (Paciente, ['id', 'nome', 'cpf', 'sexo', 'data_nascimento', 'municipio', 'telefone', 'ativo',
+                           'atualizado_em'], _pacientes),
+    'Observation': (Afericao, ['id', 'paciente_id', 'data_afericao', 'pressao_sistolica', 'pressao_diastolica',
+                               'frequencia_cardiaca', 'atualizado_em'], _afericoes),
+    'Condition': (AtendimentoMedico, ['id', 'paciente_id', 'data_atendimento', 'atualizado_em',
+                                      'cid10_1', 'cid10_2', 'cid10_3'], _diagnosticos),
+    'MedicationRequest': (ItemPrescricao, ['id', 'medicamento_nome', 'concentracao', 'posologia', 'quantidade',
+                                           'tipo', 'prescricao__atendimento__paciente_id',
+                                           'prescricao__data_prescricao', 'atualizado_em'], _prescricoes),
+}
+
+
+def recursos(tipo, desde=None):
+    """Recursos FHIR (dicts) do tipo, alterados depois de `desde` (todos se None)."""
+    modelo, campos, converter = RECURSOS[tipo]
+    consulta = modelo.objects.order_by()  # sem ORDER BY: o SQLite não ordena a tabela inteira antes da 1ª linha
+    if desde is not None:
+        consulta = consulta.filter(atualizado_em__gt=desde)
+    for linha in consulta.values_list(*campos).iterator(chunk_size=LINHAS_POR_LOTE):
+        yield from converter(linha)
+
+
+# --- Parâmetros do $export ---
+
+def ler_tipos(valor):
+    tipos = [tipo.strip() for tipo in (valor or '').split(',') if tipo.strip()] or list(TIPOS)
+    invalidos = [tipo for tipo in tipos if tipo not in TIPOS]
+    if invalidos:
+        raise ValueError(f"Tipo de recurso não suportado em _type: {', '.join(invalidos)}.")
+    return [tipo for tipo in TIPOS if tipo in tipos]
+
+
+def ler_desde(valor):
+    """_since: instante FHIR (2026-01-01T00:00:00-03:00) ou só a data (meia-noite local)."""
+    if not valor:
+        return None
+    instante = parse_datetime(valor)
+    if instante is None and parse_date(valor):
+        instante = datetime.combine(parse_date(valor), hora_do_dia.min)
+    if instante is None:
+        raise ValueError(f"_since inválido: {valor} (use AAAA-MM-DDThh:mm:ss+zz:zz).")
+    return instante if timezone.is_aware(instante) else timezone.make_aware(instante)
+
+
+def operation_outcome(mensagem):
+    return {'resourceType': 'OperationOutcome',
+            'issue': [{'severity': 'error', 'code': 'processing', 'diagnostics': mensagem}]}
+
+
+# --- Execução ---
+
+def executar(exportacao):
+    """Gera os arquivos NDJSON da exportação (no processo atual). Erros ficam registrados nela."""
+    exportacao.status = 'EXECUTANDO'
+    exportacao.data_transacao = timezone.now()  # antes das leituras: o que mudar durante a exportação sai na próxima
+    exportacao.ultimo_progresso = exportacao.data_transacao
+    exportacao.save(update_fields=['status', 'data_transacao', 'ultimo_progresso'])
+    pasta = pasta_exportacao(exportacao.id)
+    os.makedirs(pasta, exist_ok=True)
+
+    tipos = exportacao.tipos.split(',')
+    arquivos = []
+    try:
+        for posicao, tipo in enumerate(tipos, start=1):
+            _progresso(exportacao, f'{tipo} ({posicao}/{len(tipos)})')
+            nome = f'{tipo}.ndjson'
+            total = 0
+            with open(os.path.join(pasta, nome), 'w', encoding='utf-8') as arquivo:
+                for recurso in recursos(tipo, exportacao.desde):
+                    arquivo.write(json.dumps(recurso, ensure_ascii=False, separators=(',', ':')))
+                    arquivo.write('\n')
+                    total += 1
+                    if total % RECURSOS_POR_PROGRESSO == 0:
+                        _progresso(exportacao, f'{tipo} ({posicao}/{len(tipos)}): {total} recursos')
+            if total:
+                arquivos.append({'type': tipo, 'arquivo': nome, 'count': total})
+            else:
+                os.remove(os.path.join(pasta, nome))  # tipos sem recursos ficam fora do manifesto
+        exportacao.status = 'CONCLUIDA'
+        exportacao.progresso = ''
+    except Exception as erro:
+        exportacao.status = 'ERRO'
+        exportacao.erro = f'{type(erro).__name__}: {erro}'
+        shutil.rmtree(pasta, ignore_errors=True)
+        arquivos = []
+    exportacao.arquivos = arquivos
+    exportacao.data_conclusao = timezone.now()
+    exportacao.save(update_fields=['status', 'progresso', 'erro', 'arquivos', 'data_conclusao'])
+    return exportacao
+
+
+def _progresso(exportacao, texto):
+    exportacao.progresso = texto
+    exportacao.ultimo_progresso = timezone.now()
+    exportacao.save(update_fields=['progresso', 'ultimo_progresso'])
+
+
+def conferir_interrompida(exportacao):
+    """
+    Na consulta do status: exportação na fila ou em execução sem progresso há mais de
+    FHIR_EXPORTACAO_SEM_PROGRESSO segundos ficou órfã (worker reiniciado, fila em memória perdida)
+    e passa a ERRO, em vez de responder 202 para sempre. Na fila conta o progresso da exportação
+    que está à frente, se houver.
+    """
+    if exportacao.status not in ('PENDENTE', 'EXECUTANDO'):
+        return exportacao
+    limite = timezone.now() - timedelta(seconds=getattr(settings, 'FHIR_EXPORTACAO_SEM_PROGRESSO', 900))
+    if (exportacao.ultimo_progresso or exportacao.data_solicitacao) >= limite:
+        return exportacao
+    if exportacao.status == 'PENDENTE':
+        a_frente = ExportacaoFHIR.objects.filter(status='EXECUTANDO').aggregate(m=Max('ultimo_progresso'))['m']
+        if a_frente and a_frente >= limite:
+            return exportacao
+
+    exportacao.status = 'ERRO'
+    exportacao.erro = 'Exportação interrompida (sem progresso; o servidor pode ter sido reiniciado). Solicite de novo.'
+    exportacao.progresso = ''
+    exportacao.data_conclusao = timezone.now()
+    # Condicional: se a execução terminou entre a leitura e aqui, o resultado dela vale
+    if ExportacaoFHIR.objects.filter(pk=exportacao.pk, status__in=('PENDENTE', 'EXECUTANDO')).update(
+            status=exportacao.status, erro=exportacao.erro, progresso='', data_conclusao=exportacao.data_conclusao):
+        logger.warning('Exportação FHIR %s interrompida: marcada como erro', exportacao.pk)
+        shutil.rmtree(pasta_exportacao(exportacao.pk), ignore_errors=True)
+        return exportacao
+    exportacao.refresh_from_db()
+    return exportacao
+
+
+def apagar(exportacao):
+    """DELETE na URL de status (Bulk Data): remove os arquivos e o registro."""
+    shutil.rmtree(pasta_exportacao(exportacao.pk), ignore_errors=True)
+    exportacao.delete()
+
+
+def apagar_antigas():
+    """Remove exportações concluídas (ou com erro) há mais de FHIR_EXPORTACAO_RETENCAO_DIAS dias."""
+    limite = timezone.now() - timedelta(days=getattr(settings, 'FHIR_EXPORTACAO_RETENCAO_DIAS', 7))
+    antigas = list(ExportacaoFHIR.objects.filter(status__in=('CONCLUIDA', 'ERRO'), data_solicitacao__lt=limite)
+                   .order_by().values_list('pk', flat=True))
+    for pk in antigas:
+        shutil.rmtree(pasta_exportacao(pk), ignore_errors=True)
+    ExportacaoFHIR.objects.filter(pk__in=antigas).delete()
+    return len(antigas)
+
+
+def manifesto(exportacao, url_requisicao, url_arquivo):
+    return {
+        'transactionTime': _instante(exportacao.data_transacao),
+        'request': url_requisicao,
+        'requiresAccessToken': True,  # os arquivos exigem a sessão de um administrador
+        'output': [{'type': item['type'], 'url': url_arquivo(item['arquivo']), 'count': item['count']}
+                   for item in exportacao.arquivos],
+        'error': [],
+    }
+
+
+# --- Segundo plano ---
+# Uma exportação por vez por processo; cada uma em sua própria conexão com o banco.
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fhir-export')
+_pendentes = set()
+_pendentes_lock = threading.Lock()
+
+
+def _executar_em_segundo_plano(exportacao_id):
+    try:
+        executar(ExportacaoFHIR.objects.get(pk=exportacao_id))
+    except Exception:
+        logger.exception('Erro na exportação FHIR %s', exportacao_id)
+    finally:
+        connection.close()
+
+
+def _enfileirar(exportacao_id):
+    futuro = _executor.submit(_executar_em_segundo_plano, exportacao_id)
+    with _pendentes_lock:
+        _pendentes.add(futuro)
+    futuro.add_done_callback(_descartar_pendente)
+
+
+def _descartar_pendente(futuro):
+    with _pendentes_lock:
+        _pendentes.discard(futuro)
+
+
+def solicitar_exportacao(solicitante, tipos=None, desde=None):
+    """Registra a exportação (_type e _since como na query string) e a agenda para depois do commit."""
+    tipos, desde = ler_tipos(tipos), ler_desde(desde)
+    apagar_antigas()
+    exportacao = ExportacaoFHIR.objects.create(
+        solicitante=solicitante, tipos=','.join(tipos), desde=desde,
+    )
+    transaction.on_commit(lambda: _enfileirar(exportacao.id))
+    return exportacao
+
+
+def aguardar_pendentes(timeout=None):
+    """Espera as exportações em andamento (testes e desligamento do servidor)."""
+    with _pendentes_lock:
+        futuros = list(_pendentes)
+    wait(futuros, timeout=timeout)
@@ -4,7 +4,8 @@ from .models import Paciente, Usuario, TriagemHipertensao, AtendimentoMedico
 class PacienteForm(forms.ModelForm):
     class Meta:
         model = Paciente
-        fields = '__all__'
+        # Resumo de risco/última PA é mantido pelos saves de AvaliacaoPrevent e Afericao
+        exclude = ['nivel_risco', 'risco_prevent_atual', 'ultima_pas', 'ultima_pad', 'data_ultima_afericao']
         widgets = {
             'data_nascimento': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
             'data_insercao': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
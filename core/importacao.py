@@ -0,0 +1,516 @@
+"""
+Importação em massa de planilhas CSV/XLSX:
+- pacientes encaminhados pela CROSS (importar_pacientes);
+- aferições exportadas por monitores de pressão domiciliares (importar_afericoes).
+
+As linhas são lidas em fluxo (csv.DictReader / openpyxl read-only), validadas e
+gravadas em lotes com bulk_create/bulk_update, cada lote em sua própria transação.
+"""
+import csv
+import os
+import re
+import time
+import unicodedata
+from datetime import date, datetime, time as hora_do_dia
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from django.db import transaction
+from django.forms.models import model_to_dict
+from django.utils import timezone
+
+from .estatisticas_pa import registrar as registrar_estatisticas
+from .forms import PacienteForm
+from .models import Afericao, Medicamento, Paciente
+
+# Cabeçalhos aceitos (sem acentos, minúsculos, só letras/números) -> campo do modelo
+COLUNAS = {
+    'nome': 'nome', 'nomepaciente': 'nome', 'paciente': 'nome',
+    'cpf': 'cpf',
+    'sexo': 'sexo',
+    'etnia': 'etnia', 'racacor': 'etnia', 'raca': 'etnia',
+    'datanascimento': 'data_nascimento', 'datadenascimento': 'data_nascimento',
+    'nascimento': 'data_nascimento', 'dtnascimento': 'data_nascimento',
+    'datainsercao': 'data_insercao', 'datadeinsercao': 'data_insercao',
+    'dataencaminhamento': 'data_insercao', 'datadoencaminhamento': 'data_insercao',
+    'municipio': 'municipio', 'cidade': 'municipio',
+    'telefone': 'telefone', 'celular': 'telefone',
+    'siresp': 'siresp', 'cross': 'siresp', 'numerocross': 'siresp',
+    'ncross': 'siresp', 'nocross': 'siresp',  # 'Nº CROSS' (º vira 'o' sem acento)
+}
+
+ETNIAS = {'branca': 'Branca', 'parda': 'Parda', 'negra': 'Negra', 'preta': 'Negra', 'indigena': 'Indígena'}
+
+
+class PacienteImportacaoForm(PacienteForm):
+    def validate_unique(self):
+        # A unicidade do CPF é resolvida pelo upsert do lote (uma consulta por lote, não por linha)
+        pass
+
+
+def _sem_acento(texto):
+    texto = unicodedata.normalize('NFKD', str(texto))
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+@lru_cache(maxsize=512)
+def _chave_coluna(nome):
+    # 'SYS (mmHg)' -> 'sys': unidades entre parênteses são ignoradas
+    nome = re.sub(r'\(.*?\)', '', _sem_acento(nome or '').lower())
+    return re.sub(r'[^a-z0-9]', '', nome)
+
+
+def _texto(valor):
+    """Converte o valor da célula em texto; números do Excel (12345.0) perdem o '.0'."""
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def normalizar_cpf(valor):
+    digitos = re.sub(r'\D', '', _texto(valor))
+    return digitos.zfill(11) if digitos else ''
+
+
+def cpf_valido(cpf):
+    """Confere os dígitos verificadores de um CPF já normalizado (11 dígitos)."""
+    if len(cpf) != 11 or cpf == cpf[0] * 11:
+        return False
+    for tamanho in (9, 10):
+        soma = sum(int(d) * peso for d, peso in zip(cpf[:tamanho], range(tamanho + 1, 1, -1)))
+        if int(cpf[tamanho]) != soma * 10 % 11 % 10:
+            return False
+    return True
+
+
+def normalizar_cross(valor):
+    return re.sub(r'[\s.\-/]', '', _texto(valor)).upper()
+
+
+def _normalizar_linha(linha):
+    """Mapeia os cabeçalhos da planilha e padroniza os valores para o PacienteForm."""
+    dados = {}
+    for coluna, valor in linha.items():
+        campo = COLUNAS.get(_chave_coluna(coluna))
+        if campo and valor not in (None, ''):
+            dados[campo] = valor
+
+    if 'cpf' in dados:
+        dados['cpf'] = normalizar_cpf(dados['cpf'])
+    if 'siresp' in dados:
+        dados['siresp'] = normalizar_cross(dados['siresp'])
+    if 'sexo' in dados:
+        dados['sexo'] = _texto(dados['sexo'])[:1].upper()
+    if 'etnia' in dados:
+        chave = _sem_acento(_texto(dados['etnia'])).lower()
+        dados['etnia'] = ETNIAS.get(chave, _texto(dados['etnia']))
+    for campo in ('data_nascimento', 'data_insercao'):
+        if isinstance(dados.get(campo), datetime):
+            dados[campo] = dados[campo].date()
+    for campo in ('nome', 'municipio', 'telefone'):
+        if campo in dados:
+            dados[campo] = _texto(dados[campo])
+    return dados
+
+
+def ler_planilha(caminho, encoding='utf-8-sig'):
+    """Gera (numero_linha, {coluna: valor}) sem carregar o arquivo inteiro em memória."""
+    if os.path.splitext(caminho)[1].lower() in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+
+        planilha = load_workbook(caminho, read_only=True, data_only=True)
+        try:
+            linhas = planilha.active.iter_rows(values_only=True)
+            cabecalho = [_texto(c) for c in next(linhas, ())]
+            for numero, valores in enumerate(linhas, start=2):
+                if any(v not in (None, '') for v in valores):
+                    yield numero, dict(zip(cabecalho, valores))
+        finally:
+            planilha.close()
+    else:
+        with open(caminho, encoding=encoding, newline='') as arquivo:
+            amostra = arquivo.read(4096)
+            arquivo.seek(0)
+            delimitador = ';' if amostra.count(';') >= amostra.count(',') else ','
+            for numero, linha in enumerate(csv.DictReader(arquivo, delimiter=delimitador), start=2):
+                yield numero, linha
+
+
+def _gravar_lote(lote, resultado, rejeitar):
+    """Valida e grava um lote de linhas [(numero, original, dados)]: uma consulta de leitura + bulk."""
+    cpfs = [dados.get('cpf') for _, _, dados in lote if dados.get('cpf')]
+    existentes = Paciente.objects.in_bulk(cpfs, field_name='cpf')
+
+    novos = {}
+    alterados = {}
+    inalterados = set()
+    campos_alterados = set()
+    for numero, original, dados in lote:
+        instancia = existentes.get(dados.get('cpf')) or alterados.get(dados.get('cpf'))
+        if instancia is not None:
+            # Colunas ausentes na planilha mantêm o valor cadastrado
+            base_original = model_to_dict(instancia)
+            base = dict(base_original)
+            base.update(dados)
+            form = PacienteImportacaoForm(base, instance=instancia)
+        else:
+            base = {'data_insercao': date.today(), 'municipio': 'Caraguatatuba', 'ativo': True}
+            base.update(dados)
+            form = PacienteImportacaoForm(base)
+
+        if not form.is_valid():
+            erros = '; '.join(f"{campo}: {' '.join(msgs)}" for campo, msgs in form.errors.items())
+            rejeitar(numero, original, erros)
+            continue
+
+        paciente = form.save(commit=False)
+        if instancia is not None:
+            # bulk_update monta um CASE por campo: só entram os campos que de fato mudaram
+            mudancas = {c for c in dados if c != 'cpf' and getattr(paciente, c) != base_original[c]}
+            if mudancas:
+                alterados[paciente.cpf] = paciente
+                campos_alterados |= mudancas
+            else:
+                inalterados.add(paciente.cpf)
+        else:
+            novos[paciente.cpf] = paciente  # CPF repetido no mesmo lote: vale a última linha
+
+    with transaction.atomic():
+        Paciente.objects.bulk_create(novos.values(), batch_size=500)
+        if alterados and campos_alterados:
+            agora = timezone.now()  # bulk_update não preenche o auto_now (exportação FHIR incremental)
+            for paciente in alterados.values():
+                paciente.atualizado_em = agora
+            Paciente.objects.bulk_update(alterados.values(), sorted(campos_alterados | {'atualizado_em'}),
+                                         batch_size=500)
+
+    resultado['inseridos'] += len(novos)
+    resultado['atualizados'] += len(alterados)
+    resultado['inalterados'] += len(inalterados - alterados.keys())
+
+
+class ArquivoRejeitados:
+    """Grava as linhas rejeitadas (CSV ';', coluna extra 'erro'); sem caminho, apenas conta."""
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho
+        self.total = 0
+        self._saida = None
+        self._escritor = None
+
+    def __enter__(self):
+        if self.caminho:
+            self._saida = open(self.caminho, 'w', newline='', encoding='utf-8-sig')
+        return self
+
+    def __exit__(self, *exc):
+        if self._saida is not None:
+            self._saida.close()
+
+    def __call__(self, numero, original, erro):
+        self.total += 1
+        if self._saida is None:
+            return
+        if self._escritor is None:
+            self._escritor = csv.writer(self._saida, delimiter=';')
+            self._escritor.writerow(['linha', *original.keys(), 'erro'])
+        self._escritor.writerow([numero, *(_texto(v) for v in original.values()), erro])
+
+
+def _finalizar(resultado, rejeitar, inicio):
+    resultado['rejeitados'] = rejeitar.total
+    resultado['segundos'] = round(time.perf_counter() - inicio, 2)
+    resultado['linhas_por_segundo'] = round(resultado['lidos'] / resultado['segundos']) if resultado['segundos'] else 0
+    return resultado
+
+
+def importar_pacientes(caminho, arquivo_rejeitados=None, lote=1000, encoding='utf-8-sig'):
+    """
+    Importa a planilha e retorna o resumo {'lidos', 'inseridos', 'atualizados', 'inalterados',
+    'rejeitados', 'segundos', 'linhas_por_segundo'}. Linhas rejeitadas vão para `arquivo_rejeitados` (CSV ';')
+    com a coluna extra 'erro'.
+    """
+    inicio = time.perf_counter()
+    resultado = {'lidos': 0, 'inseridos': 0, 'atualizados': 0, 'inalterados': 0}
+
+    with ArquivoRejeitados(arquivo_rejeitados) as rejeitar:
+        pendentes = []
+        for numero, original in ler_planilha(caminho, encoding):
+            resultado['lidos'] += 1
+            dados = _normalizar_linha(original)
+            if not dados.get('cpf'):
+                rejeitar(numero, original, 'cpf: CPF ausente.')
+                continue
+            if not cpf_valido(dados['cpf']):
+                rejeitar(numero, original, 'cpf: CPF inválido.')
+                continue
+            pendentes.append((numero, original, dados))
+            if len(pendentes) >= lote:
+                _gravar_lote(pendentes, resultado, rejeitar)
+                pendentes = []
+        if pendentes:
+            _gravar_lote(pendentes, resultado, rejeitar)
+
+    return _finalizar(resultado, rejeitar, inicio)
+
+
+# --- Aferições de monitores domiciliares (MAPA/MRPA, aparelhos Omron, G-Tech etc.) ---
+
+COLUNAS_AFERICAO = {
+    'cpf': 'cpf',
+    'data': 'data', 'date': 'data', 'datahora': 'data', 'datetime': 'data', 'dataafericao': 'data',
+    'datamedicao': 'data', 'datadamedicao': 'data', 'measurementdate': 'data', 'timestamp': 'data',
+    'hora': 'hora', 'time': 'hora', 'horario': 'hora',
+    'sistolica': 'pas', 'pas': 'pas', 'sys': 'pas', 'systolic': 'pas', 'pressaosistolica': 'pas',
+    'diastolica': 'pad', 'pad': 'pad', 'dia': 'pad', 'diastolic': 'pad', 'pressaodiastolica': 'pad',
+    'pulso': 'fc', 'pulse': 'fc', 'fc': 'fc', 'bpm': 'fc', 'frequenciacardiaca': 'fc', 'heartrate': 'fc',
+    'peso': 'peso', 'weight': 'peso',
+    'altura': 'altura', 'height': 'altura',
+    'observacao': 'observacao', 'obs': 'observacao', 'notes': 'observacao', 'nota': 'observacao',
+    'comentario': 'observacao',
+    'medicamentos': 'medicamentos', 'medicacao': 'medicamentos', 'medications': 'medicamentos',
+}
+
+FORMATOS_DATA_HORA = (
+    '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M', '%Y-%m-%dT%H:%M', '%Y/%m/%d %H:%M:%S', '%Y/%m/%d %H:%M', '%d/%m/%y %H:%M',
+    '%d/%m/%Y', '%Y-%m-%d',
+)
+
+# Faixas aceitas (fora delas a leitura é tratada como erro do aparelho)
+FAIXA_PAS = (50, 300)
+FAIXA_PAD = (30, 200)
+FAIXA_FC = (20, 250)
+
+
+def _data_hora(data, hora):
+    """Combina as colunas de data e hora do aparelho em um datetime com fuso (segundos inteiros)."""
+    if isinstance(data, datetime):
+        valor = data
+    elif isinstance(data, date):
+        valor = datetime.combine(data, hora_do_dia())
+    else:
+        texto = _texto(data)
+        if hora not in (None, ''):
+            texto = f"{texto} {hora.strftime('%H:%M:%S') if isinstance(hora, hora_do_dia) else _texto(hora)}"
+        for formato in FORMATOS_DATA_HORA:
+            try:
+                valor = datetime.strptime(texto, formato)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ValueError(f"data/hora não reconhecida: '{texto}'")
+    if isinstance(hora, hora_do_dia) and valor.time() == hora_do_dia():
+        valor = datetime.combine(valor.date(), hora)
+    if timezone.is_naive(valor):
+        valor = timezone.make_aware(valor)
+    return valor.replace(microsecond=0)
+
+
+def _inteiro(valor, rotulo, faixa, obrigatorio=True):
+    texto = _texto(valor)
+    if not texto:
+        if obrigatorio:
+            raise ValueError(f'{rotulo} ausente')
+        return None
+    try:
+        numero = int(round(float(texto.replace(',', '.'))))
+    except ValueError:
+        raise ValueError(f"{rotulo} inválida: '{texto}'")
+    if not faixa[0] <= numero <= faixa[1]:
+        raise ValueError(f'{rotulo} fora da faixa ({faixa[0]}-{faixa[1]}): {numero}')
+    return numero
+
+
+def _decimal(valor, rotulo):
+    texto = _texto(valor)
+    if not texto:
+        return None
+    try:
+        return Decimal(texto.replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"{rotulo} inválido: '{texto}'")
+
+
+def calcular_imc(peso, altura):
+    """IMC (kg/m²) com 2 casas; altura aceita em metros ou centímetros."""
+    if not peso or not altura:
+        return None
+    altura = Decimal(altura)
+    if altura > 3:
+        altura = altura / 100
+    return (Decimal(peso) / (altura * altura)).quantize(Decimal('0.01'))
+
+
+def _catalogo_medicamentos():
+    """{principio ativo sem acento em minúsculas: id}, uma consulta por importação."""
+    return {
+        _sem_acento(nome).lower(): mid
+        for mid, nome in Medicamento.objects.values_list('id', 'principio_ativo')
+    }
+
+
+def _ids_medicamentos(texto, catalogo):
+    ids = set()
+    for nome in re.split(r'[|;,+/]', _texto(texto)):
+        chave = _sem_acento(nome).lower().strip()
+        if not chave:
+            continue
+        if chave not in catalogo:
+            raise ValueError(f"medicamento não cadastrado: '{nome.strip()}'")
+        ids.add(catalogo[chave])
+    return ids
+
+
+def _ler_afericao(linha, cpf_padrao, catalogo, medicamentos_padrao):
+    """Converte uma linha do aparelho em dicionário validado; lança ValueError com o motivo."""
+    dados = {}
+    for coluna, valor in linha.items():
+        campo = COLUNAS_AFERICAO.get(_chave_coluna(coluna))
+        if campo and valor not in (None, ''):
+            dados[campo] = valor
+
+    cpf = normalizar_cpf(dados.get('cpf')) or cpf_padrao
+    if not cpf:
+        raise ValueError('CPF ausente')
+    if not dados.get('data'):
+        raise ValueError('data ausente')
+
+    pas = _inteiro(dados.get('pas'), 'PAS', FAIXA_PAS)
+    pad = _inteiro(dados.get('pad'), 'PAD', FAIXA_PAD)
+    if pad >= pas:
+        raise ValueError(f'PAD ({pad}) maior ou igual à PAS ({pas})')
+
+    data_afericao = _data_hora(dados['data'], dados.get('hora'))
+    if data_afericao > timezone.now():
+        raise ValueError('data/hora no futuro (relógio do aparelho desajustado?)')
+
+    medicamentos = set(medicamentos_padrao)
+    if dados.get('medicamentos'):
+        medicamentos |= _ids_medicamentos(dados['medicamentos'], catalogo)
+
+    return {
+        'cpf': cpf,
+        'data_afericao': data_afericao,
+        'pressao_sistolica': pas,
+        'pressao_diastolica': pad,
+        'frequencia_cardiaca': _inteiro(dados.get('fc'), 'Frequência cardíaca', FAIXA_FC, obrigatorio=False),
+        'peso': _decimal(dados.get('peso'), 'Peso'),
+        'altura': _decimal(dados.get('altura'), 'Altura'),
+        'observacao': _texto(dados.get('observacao')),
+        'medicamentos': medicamentos,
+    }
+
+
+def _gravar_lote_afericoes(lote, usuario, vistos, resultado, rejeitar):
+    """
+    Grava um lote [(numero, original, dados)]: uma consulta de pacientes, uma de aferições já
+    existentes no período, bulk_create das aferições e um único bulk_create na tabela
+    intermediária de medicamentos.
+    """
+    pacientes = Paciente.objects.only('id', 'cpf', 'altura_ultima', 'data_ultima_afericao').in_bulk(
+        {dados['cpf'] for _, _, dados in lote}, field_name='cpf'
+    )
+    existentes = set(Afericao.objects.filter(
+        paciente_id__in=[p.id for p in pacientes.values()],
+        data_afericao__in={dados['data_afericao'] for _, _, dados in lote},
+    ).values_list('paciente_id', 'data_afericao'))
+
+    afericoes = []
+    medicamentos = []
+    for numero, original, dados in lote:
+        paciente = pacientes.get(dados['cpf'])
+        if paciente is None:
+            rejeitar(numero, original, f"CPF {dados['cpf']} não cadastrado")
+            continue
+
+        chave = (paciente.id, dados['data_afericao'])
+        if chave in existentes or chave in vistos:
+            resultado['duplicados'] += 1
+            continue
+        vistos.add(chave)
+
+        altura = dados['altura']
+        if altura and altura > 3:
+            altura = altura / 100
+        afericoes.append(Afericao(
+            paciente=paciente,
+            usuario=usuario,
+            data_afericao=dados['data_afericao'],  # horário do aparelho, não o da importação
+            pressao_sistolica=dados['pressao_sistolica'],
+            pressao_diastolica=dados['pressao_diastolica'],
+            frequencia_cardiaca=dados['frequencia_cardiaca'],
+            peso=dados['peso'],
+            altura=altura,
+            imc=calcular_imc(dados['peso'], altura or paciente.altura_ultima),
+            observacao=dados['observacao'],
+        ))
+        medicamentos.append(dados['medicamentos'])
+
+    if not afericoes:
+        return
+
+    # bulk_create não passa pelo Afericao.save(): a última PA e as estatísticas do paciente são atualizadas aqui
+    mais_recentes = {}
+    for afericao in afericoes:
+        atual = mais_recentes.get(afericao.paciente_id)
+        if atual is None or afericao.data_afericao > atual.data_afericao:
+            mais_recentes[afericao.paciente_id] = afericao
+    resumos = []
+    for afericao in mais_recentes.values():
+        paciente = afericao.paciente
+        if paciente.data_ultima_afericao is None or paciente.data_ultima_afericao <= afericao.data_afericao:
+            paciente.ultima_pas = afericao.pressao_sistolica
+            paciente.ultima_pad = afericao.pressao_diastolica
+            paciente.data_ultima_afericao = afericao.data_afericao
+            resumos.append(paciente)
+
+    Vinculo = Afericao.medicamentos.through
+    with transaction.atomic():
+        Afericao.objects.bulk_create(afericoes, batch_size=500)
+        Vinculo.objects.bulk_create([
+            Vinculo(afericao_id=afericao.id, medicamento_id=mid)
+            for afericao, ids in zip(afericoes, medicamentos) for mid in ids
+        ], batch_size=500)
+        Paciente.objects.bulk_update(resumos, ['ultima_pas', 'ultima_pad', 'data_ultima_afericao'], batch_size=500)
+        registrar_estatisticas(afericoes)
+
+    resultado['inseridos'] += len(afericoes)
+
+
+def importar_afericoes(caminho, usuario, cpf=None, medicamentos=(), arquivo_rejeitados=None,
+                       lote=2000, encoding='utf-8-sig'):
+    """
+    Importa as leituras exportadas por um monitor de pressão.
+    - `cpf`: paciente das linhas sem coluna de CPF (exportação de um único aparelho);
+    - `medicamentos`: princípios ativos em uso, vinculados a todas as leituras.
+    Leituras repetidas (mesmo paciente e horário, no banco ou no arquivo) são ignoradas.
+    Retorna {'lidos', 'inseridos', 'duplicados', 'rejeitados', 'segundos', 'linhas_por_segundo'}.
+    """
+    inicio = time.perf_counter()
+    resultado = {'lidos': 0, 'inseridos': 0, 'duplicados': 0}
+    catalogo = _catalogo_medicamentos()
+    medicamentos_padrao = _ids_medicamentos('|'.join(medicamentos), catalogo)
+    cpf_padrao = normalizar_cpf(cpf)
+    vistos = set()
+
+    with ArquivoRejeitados(arquivo_rejeitados) as rejeitar:
+        pendentes = []
+        for numero, original in ler_planilha(caminho, encoding):
+            resultado['lidos'] += 1
+            try:
+                dados = _ler_afericao(original, cpf_padrao, catalogo, medicamentos_padrao)
+            except ValueError as e:
+                rejeitar(numero, original, str(e))
+                continue
+            pendentes.append((numero, original, dados))
+            if len(pendentes) >= lote:
+                _gravar_lote_afericoes(pendentes, usuario, vistos, resultado, rejeitar)
+                pendentes = []
+        if pendentes:
+            _gravar_lote_afericoes(pendentes, usuario, vistos, resultado, rejeitar)
+
+    return _finalizar(resultado, rejeitar, inicio)
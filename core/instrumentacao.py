@@ -0,0 +1,93 @@
+"""
+Medição por requisição: SQL, renderização de templates, geração de PDF (pisa) e HTTP externo
+(API do laboratório, API da OMS). Usado pelo InstrumentacaoMiddleware (core/middleware.py).
+
+Os pontos medidos são envolvidos uma única vez por instalar(), e só quando a instrumentação está
+habilitada; fora de uma requisição medida (ex.: threads da resolução CID-11) nada é registrado.
+"""
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+import requests
+from django.template.backends.django import Template
+from xhtml2pdf import pisa
+
+# Categorias na ordem do cabeçalho Server-Timing
+CATEGORIAS = ('sql', 'template', 'pdf', 'http')
+
+_medicao_atual = ContextVar('medicao_atual', default=None)
+_instalado = False
+
+
+class Medicao:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.segundos = defaultdict(float)
+        self.chamadas = defaultdict(int)
+
+    def registrar(self, categoria, segundos):
+        self.segundos[categoria] += segundos
+        self.chamadas[categoria] += 1
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.inicio
+
+
+@contextmanager
+def medindo():
+    """Abre uma medição para o trecho (a requisição) e a devolve."""
+    medicao = Medicao()
+    token = _medicao_atual.set(medicao)
+    try:
+        yield medicao
+    finally:
+        _medicao_atual.reset(token)
+
+
+@contextmanager
+def medir(categoria):
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicao.registrar(categoria, time.perf_counter() - inicio)
+
+
+def medir_sql(execute, sql, params, many, context):
+    """execute_wrapper do Django: conta e cronometra cada consulta."""
+    with medir('sql'):
+        return execute(sql, params, many, context)
+
+
+def _envolver(objeto, nome, categoria):
+    original = getattr(objeto, nome)
+
+    @wraps(original)
+    def medido(*args, **kwargs):
+        if _medicao_atual.get() is None:
+            return original(*args, **kwargs)
+        with medir(categoria):
+            return original(*args, **kwargs)
+
+    setattr(objeto, nome, medido)
+
+
+def instalar():
+    """Envolve render() dos templates, pisa.CreatePDF e as requisições HTTP do `requests` (idempotente)."""
+    global _instalado
+    if _instalado:
+        return
+    _instalado = True
+    # Só o render() do backend: includes e extends internos ficam dentro do mesmo tempo
+    _envolver(Template, 'render', 'template')
+    _envolver(pisa, 'CreatePDF', 'pdf')
+    # requests.get/post passam todos por Session.request
+    _envolver(requests.Session, 'request', 'http')
@@ -0,0 +1,67 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.arquivo import arquivar_pacientes, restaurar_paciente
+from core.models import Paciente
+
+
+def _meses_atras(hoje, meses):
+    total = hoje.year * 12 + hoje.month - 1 - meses
+    ano, mes = divmod(total, 12)
+    for dia in (hoje.day, 30, 29, 28):  # 31/03 - 1 mês = 28 ou 29/02
+        try:
+            return date(ano, mes + 1, dia)
+        except ValueError:
+            continue
+
+
+class Command(BaseCommand):
+    help = ('Move para o arquivo (ArquivoPaciente) o histórico clínico dos pacientes com alta há mais de '
+            '--meses meses, em lotes, cada lote em sua própria transação. O histórico continua visível '
+            '(somente leitura) no detalhe do paciente e volta às tabelas na readmissão ou com --restaurar')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=24, help='Meses desde a alta (padrão: 24)')
+        parser.add_argument('--lote', type=int, default=200, help='Pacientes por transação')
+        parser.add_argument('--simular', action='store_true', help='Só conta os pacientes elegíveis')
+        parser.add_argument('--restaurar', type=int, nargs='+', metavar='PACIENTE_ID',
+                            help='Devolve às tabelas o histórico arquivado destes pacientes')
+
+    def handle(self, *args, **options):
+        if options['restaurar']:
+            for paciente in Paciente.objects.filter(id__in=options['restaurar']):
+                self.stdout.write(f"{paciente}: {restaurar_paciente(paciente)} registros restaurados")
+            return
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser ao menos 1.')
+
+        limite = _meses_atras(date.today(), options['meses'])
+        elegiveis = Paciente.objects.filter(ativo=False, data_alta__lt=limite, arquivo__isnull=True)
+        if options['simular']:
+            self.stdout.write(f"{elegiveis.count()} pacientes com alta antes de {limite:%d/%m/%Y} seriam arquivados.")
+            return
+
+        inicio = time.perf_counter()
+        pacientes = registros = 0
+        ultimo_id = 0
+        while True:
+            # Paginação por chave (id): cada lote é uma transação curta, sem segurar a escrita do banco
+            ids = list(elegiveis.filter(id__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:options['lote']])
+            if not ids:
+                break
+            ultimo_id = ids[-1]
+            arquivados, movidos = arquivar_pacientes(ids)
+            pacientes += arquivados
+            registros += movidos
+            self.stdout.write(f"- {pacientes} pacientes / {registros} registros arquivados")
+
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"Arquivamento concluído: {pacientes} pacientes com alta antes de {limite:%d/%m/%Y}, "
+            f"{registros} registros em {duracao:.1f}s."
+        ))
+        if registros:
+            self.stdout.write('O espaço liberado é reaproveitado pelo SQLite; para encolher o arquivo, rode VACUUM '
+                              'fora do horário de atendimento.')
@@ -0,0 +1,49 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.replica import REPLICA, atraso_maximo, caminho_marcador
+
+
+class Command(BaseCommand):
+    help = ('Atualiza a réplica de leitura SQLite local (DATABASES["replica"]) com a API de backup do SQLite: '
+            'cópia consistente do banco principal em uso, sem parar as escritas. Com --continuo repete a cada '
+            '--intervalo segundos (padrão: um terço de REPLICA_ATRASO_MAXIMO)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true', help='Fica em laço atualizando a réplica')
+        parser.add_argument('--intervalo', type=float, help='Segundos entre as cópias no modo contínuo')
+
+    def handle(self, *args, **options):
+        principal = settings.DATABASES['default']
+        replica = settings.DATABASES.get(REPLICA)
+        if not replica:
+            raise CommandError('Réplica não configurada (defina HIPERTENSAO_REPLICA com o caminho do arquivo).')
+        if principal['ENGINE'] != replica['ENGINE'] or replica['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Este comando só atualiza réplicas SQLite locais; '
+                               'réplicas de outros bancos são mantidas pela replicação do próprio banco.')
+        if str(principal['NAME']) == str(replica['NAME']):
+            raise CommandError('A réplica aponta para o mesmo arquivo do banco principal.')
+
+        intervalo = options['intervalo'] or max(1.0, atraso_maximo() / 3)
+        while True:
+            segundos = self._copiar(str(principal['NAME']), str(replica['NAME']))
+            self.stdout.write(f"Réplica atualizada em {segundos:.2f}s")
+            if not options['continuo']:
+                break
+            time.sleep(max(0.0, intervalo - segundos))
+
+    def _copiar(self, origem, destino):
+        inicio = time.time()
+        # A cópia inteira em um passo: a réplica passa de um retrato consistente para o seguinte, e as
+        # leituras em andamento (WAL) continuam vendo o retrato anterior até terminarem
+        with sqlite3.connect(origem) as fonte, sqlite3.connect(destino, timeout=30) as copia:
+            fonte.backup(copia)
+        fonte.close()
+        copia.close()
+        # Hora de início: a réplica contém tudo que foi gravado até esse instante
+        with open(caminho_marcador(), 'w', encoding='utf-8') as arquivo:
+            arquivo.write(repr(inicio))
+        return time.time() - inicio
@@ -0,0 +1,213 @@
+import json
+import platform
+import random
+import time
+from collections import defaultdict
+
+import django
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from core.models import AtendimentoMedico, Medicamento, Paciente, Usuario
+
+FLUXOS = ('triagem', 'consulta', 'painel')
+SENHA = 'benchmark-fluxos'
+
+
+class Fluxos:
+    """
+    Os fluxos clínicos reais, requisição por requisição, pelo test client do Django (sem rede).
+    Cada requisição é cronometrada com o nome da etapa; redirecionamentos são seguidos à mão
+    para que o PDF gerado no final conte como etapa própria.
+    """
+
+    def __init__(self, host, rng, pacientes, municipios, medicamentos):
+        self.host = host
+        self.rng = rng
+        self.pacientes = pacientes
+        self.municipios = municipios
+        self.medicamentos = medicamentos
+        self.tempos = defaultdict(list)
+        self.erros = defaultdict(int)
+        self.client = None
+
+    def _requisitar(self, etapa, metodo, url, dados=None):
+        inicio = time.perf_counter()
+        response = getattr(self.client, metodo)(url, dados or {})
+        if response.streaming:
+            b''.join(response.streaming_content)
+        self.tempos[etapa].append(time.perf_counter() - inicio)
+        if response.status_code >= 400:
+            self.erros[etapa] += 1
+        return response
+
+    def _seguir(self, response):
+        """Segue o redirecionamento; a etapa recebe o nome da rota de destino."""
+        destino = response['Location']
+        return self._requisitar(resolve(destino).url_name, 'get', destino)
+
+    def _login(self, usuario):
+        self.client = Client(HTTP_HOST=self.host, raise_request_exception=False)
+        self._requisitar('login', 'post', reverse('login'), {'username': usuario.username, 'password': SENHA})
+
+    def triagem(self, usuario):
+        """login -> busca no hub -> ficha multidisciplinar -> kit de exames ou contrarreferência (PDF)"""
+        self._login(usuario)
+        paciente = self.rng.choice(self.pacientes)
+        self._requisitar('hub_busca', 'post', reverse('atendimento_hub'), {'busca_termo': paciente['cpf']})
+        url = reverse('atendimento_multidisciplinar', args=[paciente['id']])
+        self._requisitar('multi_ficha', 'get', url)
+        response = self._requisitar('multi_salvar', 'post', url, {
+            'peso': f"{self.rng.uniform(55, 110):.1f}", 'altura': f"{self.rng.uniform(1.50, 1.90):.2f}",
+            'circunf': f"{self.rng.uniform(75, 120):.1f}",
+            'diabetes': 'on' if self.rng.random() < 0.3 else '', 'fumante': '',
+            'loa_rins': 'on' if self.rng.random() < 0.2 else '', 'obs': 'benchmark',
+        })
+        if response.status_code == 302:
+            self._seguir(response)
+
+    def consulta(self, usuario):
+        """login -> ficha médica -> prescrição com itens -> salvar -> reimpressão da receita (PDF)"""
+        self._login(usuario)
+        paciente = self.rng.choice(self.pacientes)
+        url = reverse('atendimento_medico', args=[paciente['id']])
+        self._requisitar('medico_ficha', 'get', url)
+        response = self._requisitar('medico_salvar', 'post', url, {
+            'subjetivo': 'Assintomático', 'objetivo': 'PA 150x95', 'avaliacao': 'HAS estágio 1',
+            'plano': 'Ajuste terapêutico', 'cid10_1': 'I10', 'action': 'prescricao',
+        })
+        if response.status_code != 302:
+            return
+        url_prescricao = response['Location']
+        self._requisitar('prescricao_form', 'get', url_prescricao)
+        for medicamento in self.rng.sample(self.medicamentos, min(2, len(self.medicamentos))):
+            self._requisitar('prescricao_item', 'post', url_prescricao, {
+                'adicionar_item': '1', 'medicamento_id': medicamento, 'posologia': '1 cp pela manhã',
+                'quantidade': '30 cp', 'tipo_uso': 'CONTINUO',
+            })
+        self._requisitar('prescricao_salvar', 'post', url_prescricao, {'action': 'salvar', 'observacoes': ''})
+        atendimento = AtendimentoMedico.objects.filter(paciente_id=paciente['id']).order_by('-id').first()
+        self._requisitar('reimprimir_receita', 'get', reverse('reimprimir_receita', args=[atendimento.prescricao.id]))
+
+    def painel(self, usuario):
+        """login -> tela de índices -> atualização do painel com filtros de município"""
+        self._login(usuario)
+        self._requisitar('indices', 'get', reverse('indices'))
+        self._requisitar('api_dashboard', 'get', reverse('api_dashboard'))
+        filtro = self.rng.sample(self.municipios, self.rng.randint(1, len(self.municipios)))
+        self._requisitar('api_dashboard_filtro', 'get', reverse('api_dashboard'), {'municipios[]': filtro})
+        self._requisitar('api_triagem_coorte', 'get', reverse('api_triagem_coorte'), {'municipios[]': filtro})
+
+
+def _estatisticas(tempos, erros):
+    ms = np.array(tempos) * 1000
+    return {
+        'n': len(tempos),
+        'erros': erros,
+        'p50_ms': round(float(np.percentile(ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(ms, 95)), 2),
+        'p99_ms': round(float(np.percentile(ms, 99)), 2),
+        'media_ms': round(float(ms.mean()), 2),
+        'req_s': round(len(tempos) / (ms.sum() / 1000), 2) if ms.sum() else None,
+    }
+
+
+class Command(BaseCommand):
+    help = ('Benchmark ponta a ponta dos fluxos clínicos (triagem, consulta médica, painel) pelo test client, '
+            'sem rede. Relata p50/p95/p99 e vazão por etapa e grava o resultado em JSON para comparar versões. '
+            'Por padrão tudo roda em uma transação desfeita no final (a base não muda entre execuções)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iteracoes', type=int, default=30, help='Execuções medidas de cada fluxo')
+        parser.add_argument('--aquecimento', type=int, default=3, help='Execuções descartadas de cada fluxo')
+        parser.add_argument('--fluxos', nargs='+', choices=FLUXOS, default=list(FLUXOS))
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--saida', help='Arquivo JSON com o resultado')
+        parser.add_argument('--rotulo', default='', help='Identificação da execução no JSON (ex.: versão)')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior para mostrar a variação do p95')
+        parser.add_argument('--manter-dados', action='store_true',
+                            help='Grava de fato os atendimentos criados (padrão: desfaz no final)')
+
+    def handle(self, *args, **options):
+        if options['iteracoes'] < 1:
+            raise CommandError('--iteracoes deve ser ao menos 1.')
+        anterior = None
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as arquivo:
+                anterior = json.load(arquivo)
+
+        pacientes = list(Paciente.objects.filter(ativo=True).order_by('id').values('id', 'cpf')[:5000])
+        medicamentos = list(Medicamento.objects.filter(ativo=True).values_list('id', flat=True))
+        municipios = list(Paciente.objects.filter(ativo=True).values_list('municipio', flat=True)
+                          .distinct().order_by('municipio'))
+        if not pacientes or not medicamentos:
+            raise CommandError('A base precisa de pacientes e medicamentos (rode setup_db e gerar_dados_sinteticos).')
+
+        hosts = [h for h in settings.ALLOWED_HOSTS if h != '*' and not h.startswith('.')]
+        fluxos = Fluxos(hosts[0] if hosts else 'localhost', random.Random(options['seed']),
+                        pacientes, municipios, medicamentos)
+
+        self._etapas = {}
+        inicio = time.perf_counter()
+        with transaction.atomic():
+            usuario = Usuario.objects.filter(username='benchmark').first() or Usuario(username='benchmark')
+            usuario.set_password(SENHA)
+            usuario.is_superuser = True
+            usuario.is_active = True
+            usuario.mudar_senha = False
+            usuario.tipo_profissional = 'ENF'
+            usuario.save()
+
+            for nome in options['fluxos']:
+                self.stdout.write(f"Fluxo {nome}: {options['aquecimento']} de aquecimento + {options['iteracoes']}...")
+                executar = getattr(fluxos, nome)
+                for _ in range(options['aquecimento']):
+                    executar(usuario)
+                fluxos.tempos.clear()
+                fluxos.erros.clear()
+                for _ in range(options['iteracoes']):
+                    executar(usuario)
+                self._guardar(nome, fluxos)
+
+            if not options['manter_dados']:
+                transaction.set_rollback(True)
+
+        resultado = {
+            'rotulo': options['rotulo'],
+            'data': timezone.now().isoformat(),
+            'duracao_s': round(time.perf_counter() - inicio, 1),
+            'ambiente': {
+                'python': platform.python_version(), 'django': django.get_version(),
+                'banco': connection.vendor, 'debug': settings.DEBUG,
+                'pacientes_ativos': Paciente.objects.filter(ativo=True).count(),
+            },
+            'parametros': {k: options[k] for k in ('iteracoes', 'aquecimento', 'fluxos', 'seed')},
+            'etapas': self._etapas,
+        }
+        self._imprimir(resultado, anterior)
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8') as arquivo:
+                json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultado gravado em {options['saida']}"))
+
+    def _guardar(self, fluxo, fluxos):
+        for etapa, tempos in fluxos.tempos.items():
+            self._etapas[f'{fluxo}/{etapa}'] = _estatisticas(tempos, fluxos.erros[etapa])
+
+    def _imprimir(self, resultado, anterior):
+        anteriores = anterior['etapas'] if anterior else {}
+        self.stdout.write('')
+        self.stdout.write(f"{'etapa':<44}{'n':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>8}{'erros':>7}"
+                          + (f"{'Δp95':>9}" if anterior else ''))
+        for etapa, e in resultado['etapas'].items():
+            linha = (f"{etapa:<44}{e['n']:>5}{e['p50_ms']:>9.1f}{e['p95_ms']:>9.1f}{e['p99_ms']:>9.1f}"
+                     f"{e['req_s'] or 0:>8.1f}{e['erros']:>7}")
+            if etapa in anteriores and anteriores[etapa]['p95_ms']:
+                linha += f"{(e['p95_ms'] / anteriores[etapa]['p95_ms'] - 1) * 100:>+8.0f}%"
+            self.stdout.write(self.style.ERROR(linha) if e['erros'] else linha)
+        self.stdout.write('(tempos em ms)')
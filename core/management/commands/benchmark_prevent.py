@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from core.prevent import FAIXAS, IDADE_MAX, IDADE_MIN, calcular_risco_prevent, calcular_risco_prevent_lote
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark do motor PREVENT: pacientes calculados por segundo (individual x vetorizado)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=1_000_000, help='Tamanho da coorte sintética')
+        parser.add_argument('--repeticoes', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        n = options['pacientes']
+        rng = np.random.default_rng(options['seed'])
+
+        # Entradas sorteadas dentro das faixas validadas (prevent.FAIXAS): o caminho individual
+        # valida cada paciente e rejeitaria valores fora delas
+        coorte = {
+            'idade': rng.integers(IDADE_MIN, IDADE_MAX, n, endpoint=True),
+            'sexo': rng.choice(np.array(['M', 'F']), n),
+            'colesterol_total': rng.integers(*FAIXAS['colesterol_total'], n, endpoint=True),
+            'hdl': rng.integers(*FAIXAS['hdl'], n, endpoint=True),
+            'pressao_sistolica': rng.integers(*FAIXAS['pressao_sistolica'], n, endpoint=True),
+            'tfg': rng.uniform(*FAIXAS['tfg'], n),
+            'em_tratamento_has': rng.random(n) < 0.8,
+            'tem_diabetes': rng.random(n) < 0.3,
+            'fumante': rng.random(n) < 0.15,
+        }
+
+        # 1. Vetorizado (coorte inteira)
+        tempos = []
+        for _ in range(options['repeticoes']):
+            inicio = time.perf_counter()
+            calcular_risco_prevent_lote(**coorte)
+            tempos.append(time.perf_counter() - inicio)
+        melhor = min(tempos)
+        self.stdout.write(self.style.SUCCESS(
+            f'Vetorizado: {n} pacientes em {melhor * 1000:.1f} ms -> {n / melhor:,.0f} pacientes/s'
+        ))
+
+        # 2. Um paciente por vez (caminho do formulário), em amostra menor
+        amostra = min(n, 5000)
+        linhas = [{campo: valores[i].item() for campo, valores in coorte.items()} for i in range(amostra)]
+        inicio = time.perf_counter()
+        for linha in linhas:
+            calcular_risco_prevent(**linha)
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(
+            f'Individual: {amostra} pacientes em {duracao * 1000:.1f} ms -> {amostra / duracao:,.0f} pacientes/s'
+        )
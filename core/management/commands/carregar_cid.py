@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import MapeamentoCid
+from core.services_cid import ARQUIVO_MAPEAMENTO, ler_arquivo_mapeamento, recarregar_indice
+
+
+class Command(BaseCommand):
+    help = 'Carrega a tabela de equivalência CID-10 -> CID-11 da OMS (arquivo TSV) no banco'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--arquivo', default=ARQUIVO_MAPEAMENTO,
+                            help='Arquivo TSV de mapeamento (padrão: tabela empacotada em core/data)')
+        parser.add_argument('--lote', type=int, default=2000, help='Tamanho do lote de inserção')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        self.stdout.write(f"Lendo {options['arquivo']}...")
+
+        # Um mesmo CID-10 pode aparecer repetido no arquivo; vale a última linha
+        registros = {}
+        for cid10, cid11, titulo, classe in ler_arquivo_mapeamento(options['arquivo']):
+            registros[cid10] = MapeamentoCid(cid10=cid10, cid11=cid11, titulo=titulo[:255], classe=classe)
+
+        with transaction.atomic():
+            MapeamentoCid.objects.all().delete()
+            MapeamentoCid.objects.bulk_create(registros.values(), batch_size=options['lote'])
+
+        recarregar_indice()
+
+        self.stdout.write(self.style.SUCCESS('Mapeamento carregado!'))
+        self.stdout.write(f'- Registros: {len(registros)}')
+        self.stdout.write(f'- Tempo: {time.perf_counter() - inicio:.2f}s')
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Medicamento
+from core.services_medicamentos import ARQUIVO_MEDICAMENTOS, ler_catalogo_medicamentos, sincronizar_catalogo
+
+
+class Command(BaseCommand):
+    help = 'Sincroniza o catálogo de medicamentos com um arquivo versionado (CSV ";" ou JSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--arquivo', default=ARQUIVO_MEDICAMENTOS,
+                            help='Arquivo do catálogo (padrão: DBH 2025 empacotado em core/data)')
+        parser.add_argument('--desativar-ausentes', action='store_true',
+                            help='Marca como inativos os medicamentos que não estão no arquivo')
+        parser.add_argument('--simular', action='store_true', help='Mostra as mudanças sem gravar')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        self.stdout.write(f"Lendo {options['arquivo']}...")
+        try:
+            registros = list(ler_catalogo_medicamentos(options['arquivo']))
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'Não foi possível ler o catálogo: {e}')
+
+        resumo = sincronizar_catalogo(
+            registros, desativar_ausentes=options['desativar_ausentes'], simular=options['simular']
+        )
+
+        for erro in resumo['erros']:
+            self.stdout.write(self.style.WARNING(f'Ignorado: {erro}'))
+        titulo = 'Simulação concluída (nada gravado)' if options['simular'] else 'Catálogo sincronizado!'
+        self.stdout.write(self.style.SUCCESS(titulo))
+        self.stdout.write(f'- Linhas no arquivo: {len(registros)}')
+        self.stdout.write(f"- Novos: {resumo['novos']}")
+        self.stdout.write(f"- Atualizados: {resumo['atualizados']}")
+        for campo, total in sorted(resumo['campos'].items()):
+            self.stdout.write(f'    {campo}: {total}')
+        self.stdout.write(f"- Sem alteração: {resumo['inalterados']}")
+        self.stdout.write(f"- Desativados: {resumo['desativados']}")
+        self.stdout.write(f"- Ignorados (inválidos): {len(resumo['erros'])}")
+        self.stdout.write(f'- Total na base: {Medicamento.objects.count()}')
+        self.stdout.write(f'- Tempo: {time.perf_counter() - inicio:.2f}s')
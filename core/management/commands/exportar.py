@@ -0,0 +1,56 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.exportacao import CONJUNTOS, FORMATOS, consultar, gerar
+
+
+def _data(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f'Data inválida: {valor} (use AAAA-MM-DD).')
+
+
+class Command(BaseCommand):
+    help = ('Exporta pacientes, aferições ou atendimentos para CSV (";", UTF-8 com BOM) ou XLSX, em fluxo e '
+            'em memória constante (mesmo conteúdo dos downloads em Índices). Sem o limite de linhas do XLSX '
+            'pelo navegador; acima de 1.048.576 linhas o XLSX continua em abas novas')
+
+    def add_arguments(self, parser):
+        parser.add_argument('conjunto', choices=sorted(CONJUNTOS))
+        parser.add_argument('--formato', choices=FORMATOS, default='csv')
+        parser.add_argument('--saida', help='Arquivo de destino (padrão: <conjunto>_<data>.<formato>)')
+        parser.add_argument('--municipio', action='append', default=[], help='Pode ser repetido')
+        parser.add_argument('--inicio', type=_data, help='Data inicial (AAAA-MM-DD), inclusive')
+        parser.add_argument('--fim', type=_data, help='Data final (AAAA-MM-DD), inclusive')
+        situacao = parser.add_mutually_exclusive_group()
+        situacao.add_argument('--ativos', dest='ativo', action='store_const', const=True,
+                              help='Só pacientes ativos')
+        situacao.add_argument('--inativos', dest='ativo', action='store_const', const=False,
+                              help='Só pacientes com alta')
+
+    def handle(self, *args, **options):
+        conjunto, formato = options['conjunto'], options['formato']
+        if options['inicio'] and options['fim'] and options['inicio'] > options['fim']:
+            raise CommandError('A data inicial é posterior à final.')
+        saida = options['saida'] or f'{conjunto}_{date.today():%Y%m%d}.{formato}'
+
+        total = [0]
+
+        def contar(linhas):
+            for linha in linhas:
+                total[0] += 1
+                yield linha
+
+        inicio = time.perf_counter()
+        linhas = consultar(conjunto, municipios=options['municipio'], inicio=options['inicio'],
+                           fim=options['fim'], ativo=options['ativo'])
+        with open(saida, 'wb') as arquivo:
+            for pedaco in gerar(conjunto, formato, contar(linhas)):
+                arquivo.write(pedaco)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total[0]} linhas exportadas para {saida} em {time.perf_counter() - inicio:.1f}s.'
+        ))
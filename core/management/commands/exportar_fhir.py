@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import fhir
+from core.models import ExportacaoFHIR
+
+
+class Command(BaseCommand):
+    help = ('Exportação em massa FHIR R4 em NDJSON (Patient, Observation, Condition, MedicationRequest), '
+            'no próprio processo; os arquivos ficam disponíveis no manifesto de /fhir/exportacoes/<id>/')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tipos', help=f"Recursos separados por vírgula (padrão: {','.join(fhir.TIPOS)})")
+        desde = parser.add_mutually_exclusive_group()
+        desde.add_argument('--desde', help='Só o alterado depois do instante (_since, AAAA-MM-DDThh:mm:ss)')
+        desde.add_argument('--incremental', action='store_true',
+                           help='Desde o transactionTime da última exportação concluída dos mesmos recursos')
+
+    def handle(self, *args, **options):
+        try:
+            tipos = ','.join(fhir.ler_tipos(options['tipos']))
+            desde = fhir.ler_desde(options['desde'])
+        except ValueError as erro:
+            raise CommandError(str(erro))
+        if options['incremental']:
+            anterior = ExportacaoFHIR.objects.filter(status='CONCLUIDA', tipos=tipos).first()
+            desde = anterior.data_transacao if anterior else None
+            self.stdout.write(f"Incremental desde {timezone.localtime(desde):%d/%m/%Y %H:%M:%S}." if desde
+                              else 'Nenhuma exportação anterior: exportando tudo.')
+
+        fhir.apagar_antigas()
+        inicio = time.perf_counter()
+        exportacao = fhir.executar(ExportacaoFHIR.objects.create(tipos=tipos, desde=desde))
+        if exportacao.status == 'ERRO':
+            raise CommandError(f'Exportação {exportacao.id} falhou: {exportacao.erro}')
+
+        pasta = fhir.pasta_exportacao(exportacao.id)
+        for item in exportacao.arquivos:
+            self.stdout.write(f"{item['type']:<18} {item['count']:>10}  {pasta}/{item['arquivo']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Exportação {exportacao.id} concluída em {time.perf_counter() - inicio:.1f}s.'
+        ))
@@ -0,0 +1,383 @@
+import resource
+import time
+from datetime import date, datetime, timezone as tz
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from core import estatisticas_pa
+from core.models import (
+    Afericao, AtendimentoMedico, AtendimentoMultidisciplinar, AvaliacaoPrevent, ItemPrescricao,
+    Medicamento, Paciente, PrescricaoMedica, Usuario,
+)
+from core.prevent import FAIXAS, IDADE_MAX, IDADE_MIN, calcular_risco_prevent_lote, classificar_risco, entradas_validas_lote
+from core.services_cid import converter_lote
+
+# Municípios atendidos pelo AME (Litoral Norte), com peso proporcional à população (IBGE 2022)
+MUNICIPIOS = ('Caraguatatuba', 'São Sebastião', 'Ubatuba', 'Ilhabela')
+PESOS_MUNICIPIOS = (134_873, 81_595, 92_981, 34_934)
+
+ETNIAS = ('Branca', 'Parda', 'Negra', 'Indígena')
+PESOS_ETNIAS = (0.57, 0.33, 0.09, 0.01)
+
+NOMES_F = ('Maria', 'Ana', 'Francisca', 'Antônia', 'Adriana', 'Juliana', 'Márcia', 'Fernanda', 'Patrícia',
+           'Aline', 'Sandra', 'Camila', 'Luzia', 'Vera', 'Sônia', 'Rosângela', 'Cláudia', 'Tereza',
+           'Aparecida', 'Helena', 'Lúcia', 'Regina', 'Marlene', 'Rita')
+NOMES_M = ('José', 'João', 'Antônio', 'Francisco', 'Carlos', 'Paulo', 'Pedro', 'Lucas', 'Luiz', 'Marcos',
+           'Luís', 'Gabriel', 'Rafael', 'Daniel', 'Marcelo', 'Bruno', 'Eduardo', 'Sebastião', 'Benedito',
+           'Roberto', 'Geraldo', 'Jorge', 'Manoel', 'Sérgio')
+SOBRENOMES = ('Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira', 'Lima',
+              'Gomes', 'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Almeida', 'Lopes', 'Soares', 'Fernandes',
+              'Vieira', 'Barbosa', 'Rocha', 'Dias', 'Nascimento', 'Andrade', 'Moreira', 'Nunes', 'Marques',
+              'Machado', 'Mendes', 'Freitas', 'Cardoso', 'Ramos', 'Teixeira', 'Moraes')
+
+# Diagnóstico principal do atendimento médico
+CIDS_PRINCIPAIS = ('I10', 'I11.9', 'I12.9', 'I15.9')
+PESOS_CIDS = (0.82, 0.10, 0.05, 0.03)
+
+# Usados quando a tabela Medicamento ainda não foi carregada (setup_db)
+MEDICAMENTOS_PADRAO = (
+    ('Losartana Potássica', '50mg'), ('Hidroclorotiazida', '25mg'), ('Anlodipino', '5mg'),
+    ('Enalapril', '10mg'), ('Atenolol', '50mg'), ('Clortalidona', '25mg'), ('Espironolactona', '25mg'),
+)
+POSOLOGIAS = ('1 comprimido via oral 1x ao dia', '1 comprimido via oral 12/12h', '1 comprimido via oral pela manhã')
+
+# Base dos CPFs sintéticos (9 primeiros dígitos = base + id do paciente): nunca colidem entre execuções
+CPF_BASE_SINTETICO = 900_000_000
+
+
+def _cpfs(bases):
+    """CPFs válidos (com dígitos verificadores) a partir de bases numéricas de 9 dígitos."""
+    digitos = (bases[:, None] // 10 ** np.arange(8, -1, -1)) % 10
+    dv1 = (digitos @ np.arange(10, 1, -1)) * 10 % 11 % 10
+    dv2 = (np.column_stack((digitos, dv1)) @ np.arange(11, 1, -1)) * 10 % 11 % 10
+    return [f'{b:09d}{a}{c}' for b, a, c in zip(bases.tolist(), dv1.tolist(), dv2.tolist())]
+
+
+def _datas(dias):
+    """Dias desde 1970-01-01 -> 'AAAA-MM-DD'."""
+    return np.datetime_as_string(dias.astype('datetime64[D]')).tolist()
+
+
+def _datas_hora(segundos):
+    """Segundos (UTC) desde 1970-01-01 -> 'AAAA-MM-DD HH:MM:SS', formato gravado pelo Django (USE_TZ)."""
+    return np.char.replace(np.datetime_as_string(segundos.astype('datetime64[s]')), 'T', ' ').tolist()
+
+
+def _ou_nulo(valores, mascara):
+    return [v if m else None for v, m in zip(valores, mascara.tolist())]
+
+
+class Command(BaseCommand):
+    help = ('Gera uma coorte sintética reprodutível (pacientes, aferições, atendimentos, avaliações PREVENT '
+            'e prescrições) para testes de escala e carga. Inserção em lotes com memória constante')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=10_000, help='Quantidade de pacientes')
+        parser.add_argument('--afericoes', type=float, default=20,
+                            help='Média de aferições por paciente (distribuição de Poisson)')
+        parser.add_argument('--anos', type=int, default=5, help='Anos de histórico (datas de inserção)')
+        parser.add_argument('--seed', type=int, default=42, help='Semente (mesma semente e lote = mesmos dados)')
+        parser.add_argument('--lote', type=int, default=5_000, help='Pacientes por lote/transação')
+        parser.add_argument('--forcar', action='store_true', help='Permite executar com DEBUG=False')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['forcar']:
+            raise CommandError('DEBUG=False: confirme com --forcar para gerar dados sintéticos neste banco.')
+
+        inicio = time.perf_counter()
+        self.hoje = date.today()
+        self.agora = int(datetime.now(tz.utc).timestamp())
+        self.opcoes = options
+        self.proximo_id = {
+            modelo: (modelo.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+            for modelo in (Paciente, Afericao, AtendimentoMultidisciplinar, AvaliacaoPrevent,
+                           AtendimentoMedico, PrescricaoMedica, ItemPrescricao)
+        }
+        self.enfermagem = self._profissionais('ENF')
+        self.medicos = self._profissionais('MED')
+        self.medicamentos = (
+            list(Medicamento.objects.filter(ativo=True).values_list('principio_ativo', 'dose_padrao'))
+            or list(MEDICAMENTOS_PADRAO)
+        )
+        self.cid11 = converter_lote(CIDS_PRINCIPAIS + ('E11.9', 'E78.5'))
+        self.totais = dict.fromkeys(self.proximo_id, 0)
+
+        gerados = 0
+        numero_lote = 0
+        while gerados < options['pacientes']:
+            n = min(options['lote'], options['pacientes'] - gerados)
+            # Um gerador por lote: o resultado não depende de quantos lotes já foram gravados
+            rng = np.random.default_rng([options['seed'], numero_lote])
+            # atualizado_em (auto_now, ignorado no INSERT direto): _since da exportação FHIR
+            self.gravado_em = _datas_hora(np.array([int(datetime.now(tz.utc).timestamp())]))[0]
+            tabelas = self._gerar_lote(rng, n)
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for modelo, (colunas, linhas) in tabelas.items():
+                        self._inserir(cursor, modelo, colunas, linhas)
+                        self.totais[modelo] += len(linhas)
+            del tabelas
+
+            gerados += n
+            numero_lote += 1
+            decorrido = time.perf_counter() - inicio
+            self.stdout.write(
+                f'  {gerados:,}/{options["pacientes"]:,} pacientes | '
+                f'{self.totais[Afericao]:,} aferições | {decorrido:.0f}s'
+            )
+
+        # PostgreSQL: as sequências precisam acompanhar os ids gravados explicitamente
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), list(self.proximo_id)):
+                cursor.execute(sql)
+
+        # Estatísticas de PA (Afericao.save as manteria): refeitas a partir das aferições gravadas
+        self.stdout.write('  recalculando estatísticas de PA...')
+        estatisticas_pa.recalcular()
+
+        duracao = time.perf_counter() - inicio
+        linhas = sum(self.totais.values())
+        memoria = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(self.style.SUCCESS('Dados sintéticos gerados!'))
+        for modelo, total in self.totais.items():
+            self.stdout.write(f'- {modelo.__name__}: {total:,}')
+        self.stdout.write(f'- Tempo: {duracao:.1f}s ({linhas / duracao if duracao else 0:,.0f} linhas/s)')
+        self.stdout.write(f'- Memória máxima do processo: {memoria:.0f} MB')
+
+    def _profissionais(self, tipo):
+        ids = list(Usuario.objects.filter(tipo_profissional=tipo, is_active=True).values_list('id', flat=True)[:20])
+        if not ids:
+            usuario, _ = Usuario.objects.get_or_create(
+                username=f'sintetico_{tipo.lower()}',
+                defaults={'first_name': 'Profissional', 'last_name': 'Sintético', 'tipo_profissional': tipo},
+            )
+            ids = [usuario.id]
+        return np.array(ids)
+
+    def _ids(self, modelo, n):
+        inicio = self.proximo_id[modelo]
+        self.proximo_id[modelo] += n
+        return np.arange(inicio, inicio + n)
+
+    def _inserir(self, cursor, modelo, colunas, linhas):
+        if not linhas:
+            return
+        quote = connection.ops.quote_name
+        cursor.executemany(
+            f'INSERT INTO {quote(modelo._meta.db_table)} ({", ".join(quote(c) for c in colunas)}) '
+            f'VALUES ({", ".join(["%s"] * len(colunas))})',
+            linhas,
+        )
+
+    def _gerar_lote(self, rng, n):
+        """Gera as linhas de todas as tabelas para n pacientes (ordem de inserção respeita as FKs)."""
+        hoje = np.datetime64(self.hoje, 'D').astype(np.int64)
+        pid = self._ids(Paciente, n)
+
+        # --- Perfil do paciente (população hipertensa: mais mulheres, idade concentrada após os 50) ---
+        feminino = rng.random(n) < 0.56
+        idade = np.clip(rng.normal(61, 12, n), 30, 95).astype(int)
+        nascimento = hoje - (idade * 365.25).astype(int) - rng.integers(0, 365, n)
+        dias_historico = self.opcoes['anos'] * 365
+        insercao = hoje - rng.integers(0, dias_historico, n)
+        ativo = rng.random(n) < 0.88
+        alta = insercao + (rng.random(n) * (hoje - insercao)).astype(int)
+        altura = np.round(np.where(feminino, rng.normal(1.60, 0.07, n), rng.normal(1.73, 0.07, n)), 2)
+
+        # Fatores de risco latentes, compartilhados pelas tabelas do paciente
+        pas_base = np.clip(rng.normal(150, 16, n), 115, 200)
+        queda_pas = np.clip(rng.normal(12, 8, n), -5, 35)  # efeito do tratamento ao longo do seguimento
+        diabetes = rng.random(n) < 0.27
+        fumante = rng.random(n) < 0.12
+        lesao_orgao = rng.random(n) < 0.18
+        estatina = rng.random(n) < np.where(diabetes, 0.6, 0.3)
+
+        # Seguimento: da inserção até a alta (inativos) ou hoje, em segundos UTC
+        ini_s = insercao * 86400
+        fim_s = np.where(ativo, self.agora, alta * 86400 + 86399)
+        fim_s = np.maximum(fim_s, ini_s + 3600)
+
+        def instantes(indice):
+            """Instante aleatório dentro do seguimento e a fração do seguimento decorrida."""
+            fracao = rng.random(len(indice))
+            return (ini_s[indice] + fracao * (fim_s[indice] - ini_s[indice])).astype(np.int64), fracao
+
+        # --- Aferições ---
+        qtd = np.maximum(rng.poisson(self.opcoes['afericoes'], n), 1)
+        idx = np.repeat(np.arange(n), qtd)
+        momento, fracao = instantes(idx)
+        ordem = np.lexsort((momento, idx))  # por paciente e cronológica
+        idx, momento, fracao = idx[ordem], momento[ordem], fracao[ordem]
+        total = len(idx)
+        pas = np.clip(np.round(pas_base[idx] - queda_pas[idx] * fracao + rng.normal(0, 9, total)), 90, 230).astype(int)
+        pad = np.clip(np.round(0.52 * pas + 14 + rng.normal(0, 6, total)), 50, 130).astype(int)
+        pad = np.minimum(pad, pas - 20)
+        fc = np.clip(np.round(rng.normal(74, 10, total)), 45, 130).astype(int)
+        com_peso = rng.random(total) < 0.1
+        peso_af = np.round(np.where(feminino[idx], rng.normal(72, 13, total), rng.normal(82, 14, total)).clip(40, 180), 1)
+        imc_af = np.round(peso_af / altura[idx] ** 2, 2)
+
+        ultima = np.cumsum(qtd) - 1  # última aferição de cada paciente (ordenadas por paciente/data)
+        afericoes = (
+            ['id', 'paciente_id', 'usuario_id', 'data_afericao', 'pressao_sistolica', 'pressao_diastolica',
+             'frequencia_cardiaca', 'peso', 'altura', 'imc', 'observacao', 'atualizado_em'],
+            list(zip(
+                self._ids(Afericao, total).tolist(), pid[idx].tolist(),
+                rng.choice(self.enfermagem, total).tolist(), _datas_hora(momento),
+                pas.tolist(), pad.tolist(), fc.tolist(),
+                _ou_nulo(peso_af.tolist(), com_peso), [None] * total, _ou_nulo(imc_af.tolist(), com_peso),
+                [''] * total, [self.gravado_em] * total,
+            )),
+        )
+
+        # --- Atendimentos multidisciplinares (1 a 3 por paciente) ---
+        qtd_multi = 1 + rng.binomial(2, 0.3, n)
+        im = np.repeat(np.arange(n), qtd_multi)
+        tm = len(im)
+        momento_m, _ = instantes(im)
+        peso_m = peso_af[ultima][im] + rng.normal(0, 1.5, tm)
+        altura_m = altura[im]
+        macos = np.round(np.clip(rng.normal(1, 0.5, tm), 0.5, 3), 1)
+        anos_fumo = rng.integers(5, 40, tm)
+        fuma = fumante[im]
+        loa = lesao_orgao[im]
+        orgaos = rng.random((tm, 5)) < 0.35
+        orgaos[loa & ~orgaos.any(axis=1), 0] = True  # com LOA: ao menos um órgão marcado
+        orgaos &= loa[:, None]
+        multi = (
+            ['id', 'paciente_id', 'profissional_id', 'data_atendimento', 'peso', 'altura', 'imc',
+             'circunferencia_abdominal', 'tem_diabetes', 'tipo_diabetes', 'fumante', 'macos_por_dia',
+             'anos_fumando', 'carga_tabagica', 'tem_lesao_orgao', 'loa_coracao', 'loa_cerebro', 'loa_rins',
+             'loa_arterias', 'loa_olhos', 'observacoes'],
+            list(zip(
+                self._ids(AtendimentoMultidisciplinar, tm).tolist(), pid[im].tolist(),
+                rng.choice(self.enfermagem, tm).tolist(), _datas_hora(momento_m),
+                np.round(peso_m, 2).tolist(), altura_m.tolist(), np.round(peso_m / altura_m ** 2, 2).tolist(),
+                np.round(0.75 * peso_m + 30 + rng.normal(0, 6, tm), 1).tolist(),
+                diabetes[im].tolist(), _ou_nulo(['2'] * tm, diabetes[im]),
+                fuma.tolist(), _ou_nulo(macos.tolist(), fuma), _ou_nulo(anos_fumo.tolist(), fuma),
+                np.where(fuma, np.round(macos * anos_fumo, 1), 0).tolist(),
+                loa.tolist(), *(orgaos[:, j].tolist() for j in range(5)), [None] * tm,
+            )),
+        )
+
+        # --- Avaliação PREVENT (75% dos pacientes na faixa etária das equações) ---
+        pas_atual = pas[ultima]
+        pas_prevent = np.clip(pas_atual, *FAIXAS['pressao_sistolica'])
+        colesterol = np.clip(rng.normal(200, 38, n), 130, 320).astype(int)
+        hdl = np.clip(rng.normal(np.where(feminino, 55, 45), 12), 20, 100).astype(int)
+        tfg = np.round(np.clip(rng.normal(85 - (idade - 60) * 0.8, 15), 15, 140), 2)
+        anti_has = rng.random(n) < 0.85
+        sexo = np.where(feminino, 'F', 'M')
+        avaliados = (
+            (rng.random(n) < 0.75) & (idade >= IDADE_MIN) & (idade <= IDADE_MAX)
+            & entradas_validas_lote(idade, colesterol, hdl, pas_prevent, tfg)
+        )
+        risco_10, risco_30 = calcular_risco_prevent_lote(
+            idade, sexo, colesterol, hdl, pas_prevent, tfg, anti_has, diabetes, fumante, estatina
+        )
+        risco_10 = np.round(risco_10, 1)
+        risco_30 = np.round(risco_30, 1)
+        ip = np.flatnonzero(avaliados)
+        data_prevent = (fim_s[ip] - rng.integers(0, 30 * 86400, len(ip))).clip(min=ini_s[ip])
+        prevent = (
+            ['id', 'paciente_id', 'data_avaliacao', 'idade', 'sexo', 'colesterol_total', 'hdl',
+             'pressao_sistolica', 'em_tratamento_has', 'tem_diabetes', 'fumante', 'em_uso_estatina', 'tfg',
+             'risco_10_anos', 'risco_30_anos'],
+            list(zip(
+                self._ids(AvaliacaoPrevent, len(ip)).tolist(), pid[ip].tolist(), _datas_hora(data_prevent),
+                idade[ip].tolist(), sexo[ip].tolist(), colesterol[ip].tolist(), hdl[ip].tolist(),
+                pas_prevent[ip].tolist(), anti_has[ip].tolist(), diabetes[ip].tolist(),
+                fumante[ip].tolist(), estatina[ip].tolist(), tfg[ip].tolist(), risco_10[ip].tolist(),
+                _ou_nulo(risco_30[ip].tolist(), ~np.isnan(risco_30[ip])),
+            )),
+        )
+
+        # Resumo gravado no próprio paciente (o que os saves de Afericao/AvaliacaoPrevent manteriam)
+        nivel = np.zeros(n, dtype=int)
+        nivel[ip] = [classificar_risco(r)[0] for r in risco_10[ip].tolist()]
+        pacientes = (
+            ['id', 'nome', 'cpf', 'sexo', 'etnia', 'data_nascimento', 'data_insercao', 'data_alta', 'municipio',
+             'telefone', 'ativo', 'siresp', 'altura_ultima', 'nivel_risco', 'risco_prevent_atual', 'ultima_pas',
+             'ultima_pad', 'data_ultima_afericao', 'atualizado_em'],
+            list(zip(
+                pid.tolist(), self._nomes(rng, feminino), _cpfs(CPF_BASE_SINTETICO + pid), sexo.tolist(),
+                rng.choice(ETNIAS, n, p=PESOS_ETNIAS).tolist(), _datas(nascimento), _datas(insercao),
+                _ou_nulo(_datas(alta), ~ativo), rng.choice(MUNICIPIOS, n, p=np.array(PESOS_MUNICIPIOS) / sum(PESOS_MUNICIPIOS)).tolist(),
+                [f'(12) 9{t:08d}' for t in rng.integers(0, 10 ** 8, n).tolist()], ativo.tolist(),
+                [str(s) for s in rng.integers(10 ** 8, 10 ** 9, n).tolist()], altura.tolist(), nivel.tolist(),
+                _ou_nulo(risco_10.tolist(), avaliados), pas_atual.tolist(), pad[ultima].tolist(),
+                _datas_hora(momento[ultima]), [self.gravado_em] * n,
+            )),
+        )
+
+        # --- Atendimento médico (60%), prescrição (85% deles) e itens (1 a 4) ---
+        imed = np.flatnonzero(rng.random(n) < 0.6)
+        nm = len(imed)
+        momento_med, _ = instantes(imed)
+        pas_med = pas[ultima][imed]
+        pad_med = pad[ultima][imed]
+        cid_principal = rng.choice(CIDS_PRINCIPAIS, nm, p=PESOS_CIDS).tolist()
+        dislipidemia = rng.random(nm) < 0.35
+        id_medico = self._ids(AtendimentoMedico, nm)
+        medico = (
+            ['id', 'paciente_id', 'medico_id', 'data_atendimento', 'score_prevent_valor', 'subjetivo', 'objetivo',
+             'avaliacao', 'plano', 'cid10_1', 'cid10_2', 'cid10_3', 'cid11_correspondente', 'cid11_nao_encontrado',
+             'atualizado_em'],
+            list(zip(
+                id_medico.tolist(), pid[imed].tolist(), rng.choice(self.medicos, nm).tolist(),
+                _datas_hora(momento_med), np.where(avaliados[imed], risco_10[imed], 0).tolist(),
+                ['Hipertenso em acompanhamento no AME. Refere boa adesão ao tratamento.'] * nm,
+                [f'PA {s}x{d} mmHg.' for s, d in zip(pas_med.tolist(), pad_med.tolist())],
+                ['HAS em seguimento na linha de cuidado.'] * nm,
+                ['Manter esquema terapêutico. Retorno com exames.'] * nm,
+                cid_principal, _ou_nulo(['E11.9'] * nm, diabetes[imed]), _ou_nulo(['E78.5'] * nm, dislipidemia),
+                [self.cid11[c] for c in cid_principal], [False] * nm, [self.gravado_em] * nm,
+            )),
+        )
+
+        iprescr = np.flatnonzero(rng.random(nm) < 0.85)
+        npr = len(iprescr)
+        id_prescricao = self._ids(PrescricaoMedica, npr)
+        prescricoes = (
+            ['id', 'atendimento_id', 'data_prescricao', 'observacoes_gerais'],
+            list(zip(id_prescricao.tolist(), id_medico[iprescr].tolist(), _datas_hora(momento_med[iprescr]),
+                     [''] * npr)),
+        )
+        qtd_itens = rng.integers(1, 5, npr)
+        ii = np.repeat(np.arange(npr), qtd_itens)
+        ti = len(ii)
+        escolhidos = rng.integers(0, len(self.medicamentos), ti)
+        itens = (
+            ['id', 'prescricao_id', 'medicamento_nome', 'concentracao', 'posologia', 'quantidade', 'tipo',
+             'atualizado_em'],
+            list(zip(
+                self._ids(ItemPrescricao, ti).tolist(), id_prescricao[ii].tolist(),
+                [self.medicamentos[m][0] for m in escolhidos.tolist()],
+                [self.medicamentos[m][1] for m in escolhidos.tolist()],
+                rng.choice(POSOLOGIAS, ti).tolist(), ['30 comprimidos'] * ti, ['CONTINUO'] * ti,
+                [self.gravado_em] * ti,
+            )),
+        )
+
+        return {
+            Paciente: pacientes,
+            Afericao: afericoes,
+            AtendimentoMultidisciplinar: multi,
+            AvaliacaoPrevent: prevent,
+            AtendimentoMedico: medico,
+            PrescricaoMedica: prescricoes,
+            ItemPrescricao: itens,
+        }
+
+    def _nomes(self, rng, feminino):
+        n = len(feminino)
+        primeiros = np.where(feminino, rng.choice(NOMES_F, n), rng.choice(NOMES_M, n)).tolist()
+        meio = rng.choice(SOBRENOMES, n).tolist()
+        ultimo = rng.choice(SOBRENOMES, n).tolist()
+        return [f'{p} {m} {u}' for p, m, u in zip(primeiros, meio, ultimo)]
@@ -0,0 +1,51 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacao import importar_afericoes
+from core.models import Usuario
+
+
+class Command(BaseCommand):
+    help = ('Importa leituras de monitores de pressão domiciliares (CSV/XLSX exportado do aparelho) '
+            'como aferições, mantendo o horário registrado pelo aparelho')
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Exportação do aparelho (CSV ou XLSX)')
+        parser.add_argument('--usuario', required=True, help='Username do profissional responsável pela importação')
+        parser.add_argument('--cpf', help='CPF do paciente, quando o arquivo não tem coluna de CPF')
+        parser.add_argument('--medicamentos', default='',
+                            help='Princípios ativos em uso, separados por vírgula (vinculados a todas as leituras)')
+        parser.add_argument('--lote', type=int, default=2000, help='Linhas por lote/transação')
+        parser.add_argument('--rejeitados', help='CSV de saída com as linhas rejeitadas (padrão: <arquivo>_rejeitados.csv)')
+        parser.add_argument('--encoding', default='utf-8-sig', help='Codificação do CSV (ex.: latin-1)')
+
+    def handle(self, *args, **options):
+        arquivo = options['arquivo']
+        if not os.path.exists(arquivo):
+            raise CommandError(f'Arquivo não encontrado: {arquivo}')
+        try:
+            usuario = Usuario.objects.get(username=options['usuario'])
+        except Usuario.DoesNotExist:
+            raise CommandError(f"Usuário não encontrado: {options['usuario']}")
+        rejeitados = options['rejeitados'] or f'{os.path.splitext(arquivo)[0]}_rejeitados.csv'
+
+        self.stdout.write(f'Importando {arquivo}...')
+        try:
+            resultado = importar_afericoes(
+                arquivo, usuario, cpf=options['cpf'], medicamentos=options['medicamentos'].split(','),
+                arquivo_rejeitados=rejeitados, lote=options['lote'], encoding=options['encoding'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not resultado['rejeitados'] and os.path.exists(rejeitados):
+            os.remove(rejeitados)
+
+        self.stdout.write(self.style.SUCCESS('Importação concluída!'))
+        self.stdout.write(f"- Linhas lidas: {resultado['lidos']}")
+        self.stdout.write(f"- Aferições inseridas: {resultado['inseridos']}")
+        self.stdout.write(f"- Já registradas (ignoradas): {resultado['duplicados']}")
+        self.stdout.write(f"- Rejeitadas: {resultado['rejeitados']}")
+        if resultado['rejeitados']:
+            self.stdout.write(f'  (detalhes em {rejeitados})')
+        self.stdout.write(f"- Tempo: {resultado['segundos']:.2f}s ({resultado['linhas_por_segundo']:,} linhas/s)")
@@ -0,0 +1,37 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importacao import importar_pacientes
+
+
+class Command(BaseCommand):
+    help = ('Importa pacientes de uma planilha CSV/XLSX (exportação da CROSS). '
+            'CPFs já cadastrados são atualizados; linhas inválidas vão para o arquivo de rejeitados')
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help='Planilha CSV (; ou ,) ou XLSX')
+        parser.add_argument('--lote', type=int, default=1000, help='Linhas por lote/transação')
+        parser.add_argument('--rejeitados', help='CSV de saída com as linhas rejeitadas (padrão: <arquivo>_rejeitados.csv)')
+        parser.add_argument('--encoding', default='utf-8-sig', help='Codificação do CSV (ex.: latin-1)')
+
+    def handle(self, *args, **options):
+        arquivo = options['arquivo']
+        if not os.path.exists(arquivo):
+            raise CommandError(f'Arquivo não encontrado: {arquivo}')
+        rejeitados = options['rejeitados'] or f'{os.path.splitext(arquivo)[0]}_rejeitados.csv'
+
+        self.stdout.write(f'Importando {arquivo}...')
+        resultado = importar_pacientes(arquivo, rejeitados, lote=options['lote'], encoding=options['encoding'])
+        if not resultado['rejeitados'] and os.path.exists(rejeitados):
+            os.remove(rejeitados)
+
+        self.stdout.write(self.style.SUCCESS('Importação concluída!'))
+        self.stdout.write(f"- Linhas lidas: {resultado['lidos']}")
+        self.stdout.write(f"- Inseridos: {resultado['inseridos']}")
+        self.stdout.write(f"- Atualizados: {resultado['atualizados']}")
+        self.stdout.write(f"- Sem alteração: {resultado['inalterados']}")
+        self.stdout.write(f"- Rejeitados: {resultado['rejeitados']}")
+        if resultado['rejeitados']:
+            self.stdout.write(f'  (detalhes em {rejeitados})')
+        self.stdout.write(f"- Tempo: {resultado['segundos']:.2f}s ({resultado['linhas_por_segundo']:,} linhas/s)")
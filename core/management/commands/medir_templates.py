@@ -0,0 +1,84 @@
+import statistics
+import time
+
+from django.contrib.sessions.backends.cache import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.template import RequestContext, engines
+from django.template.engine import Engine
+from django.test import RequestFactory
+
+from core import cache
+from core.models import AtendimentoMedico, Paciente, Usuario
+from core.services_medicamentos import autocomplete_medicamentos
+from core.views import calcular_idade
+
+
+class Command(BaseCommand):
+    help = ('Mede o tempo de renderização dos templates mais pesados (ficha de enfermagem, prescrição e a '
+            'página inicial) em três situações: template relido e compilado a cada vez (sem o carregador '
+            'em cache), compilado uma vez com os fragmentos de menu frios e com os fragmentos em cache')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=50, help='Renderizações por situação')
+        parser.add_argument('--usuario', help='Usuário do contexto (padrão: o primeiro superusuário)')
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 1:
+            raise CommandError('--repeticoes deve ser ao menos 1.')
+        usuarios = Usuario.objects.filter(username=options['usuario']) if options['usuario'] \
+            else Usuario.objects.filter(is_superuser=True)
+        usuario = usuarios.first()
+        if usuario is None:
+            raise CommandError('Usuário não encontrado.')
+        atendimento = AtendimentoMedico.objects.select_related('paciente', 'prescricao').filter(
+            prescricao__isnull=False).first()
+        paciente = atendimento.paciente if atendimento else Paciente.objects.first()
+        if paciente is None:
+            raise CommandError('Base sem pacientes (python manage.py gerar_dados_sinteticos).')
+
+        paginas = {
+            'atendimento/ficha_enf_aval_inicial.html': {
+                'paciente': paciente, 'idade': calcular_idade(paciente.data_nascimento)},
+            'index.html': {},
+        }
+        if atendimento:
+            paginas['prescricao_form.html'] = {
+                'atendimento': atendimento, 'paciente': paciente, 'prescricao': atendimento.prescricao,
+                # lista materializada: mede o template, não a consulta dos itens
+                'itens': list(atendimento.prescricao.itens.all()), 'db_medicamentos': autocomplete_medicamentos(),
+            }
+        else:
+            self.stdout.write(self.style.WARNING('Sem atendimento com prescrição: prescricao_form.html não será medido.'))
+
+        em_cache = engines['django'].engine
+        sem_cache = Engine(
+            dirs=em_cache.dirs, context_processors=em_cache.context_processors, debug=em_cache.debug,
+            libraries=em_cache.libraries,
+            loaders=['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader'],
+        )
+
+        self.stdout.write(f"{'template':<42} {'situação':<24} {'média (ms)':>10} {'p95 (ms)':>10} {'KB':>6}")
+        for nome, contexto in paginas.items():
+            situacoes = [
+                ('sem carregador em cache', lambda: sem_cache.get_template(nome), True),
+                ('fragmentos frios', lambda: em_cache.get_template(nome), True),
+                ('fragmentos em cache', lambda: em_cache.get_template(nome), False),
+            ]
+            for situacao, obter_template, fragmentos_frios in situacoes:
+                tempos = []
+                for _ in range(options['repeticoes']):
+                    request = self._request(usuario)
+                    if fragmentos_frios:
+                        cache.invalidar('menu')
+                    inicio = time.perf_counter()
+                    html = obter_template().render(RequestContext(request, contexto))
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+                p95 = statistics.quantiles(tempos, n=20)[-1] if len(tempos) > 1 else tempos[0]
+                self.stdout.write(f"{nome:<42} {situacao:<24} {statistics.mean(tempos):>10.2f} {p95:>10.2f} "
+                                  f"{len(html) / 1024:>6.0f}")
+
+    def _request(self, usuario):
+        request = RequestFactory().get('/')
+        request.user = usuario
+        request.session = SessionStore()
+        return request
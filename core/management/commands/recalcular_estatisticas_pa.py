@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.estatisticas_pa import parametros, recalcular
+
+
+class Command(BaseCommand):
+    help = ('Refaz as estatísticas de PA por paciente (média, desvio-padrão, ARV, % no alvo e os resumos '
+            'diários da janela) a partir das aferições. Necessário após mudar settings.ESTATISTICAS_PA ou '
+            'excluir aferições em massa; no dia a dia elas são mantidas a cada aferição')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paciente', type=int, action='append', help='Só o paciente (id); pode ser repetido')
+
+    def handle(self, *args, **options):
+        alvo = parametros()
+        inicio = time.perf_counter()
+        total = recalcular(options['paciente'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} pacientes recalculados (alvo < {alvo['alvo_pas']}/{alvo['alvo_pad']} mmHg) "
+            f"em {time.perf_counter() - inicio:.1f}s."
+        ))
@@ -0,0 +1,149 @@
+import time
+import tracemalloc
+from datetime import date
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.coorte import idades_em, ultimos_por_paciente
+from core.models import Afericao, AtendimentoMultidisciplinar, AvaliacaoPrevent, Paciente
+from core.prevent import calcular_risco_prevent_lote, classificar_risco, entradas_validas_lote
+
+
+class Command(BaseCommand):
+    help = ('Recalcula o risco PREVENT de todos os pacientes ativos com os dados mais recentes '
+            '(diabetes/tabagismo da última avaliação multi, PAS da última aferição, lipídios/eGFR '
+            'da última avaliação PREVENT)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Pacientes por lote')
+        parser.add_argument('--no-lugar', action='store_true',
+                            help='Atualiza a última avaliação (bulk_update) em vez de registrar uma nova')
+        parser.add_argument('--simular', action='store_true', help='Calcula sem gravar')
+
+    def handle(self, *args, **options):
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        hoje = date.today()
+        totais = {'pacientes': 0, 'calculados': 0, 'gravados': 0, 'sem_dados': 0, 'fora_faixa': 0}
+
+        ultimo_id = 0
+        while True:
+            # Paginação por chave (id) para manter a memória constante
+            pacientes = list(
+                Paciente.objects.filter(ativo=True, id__gt=ultimo_id)
+                .order_by('id')
+                .values_list('id', 'sexo', 'data_nascimento')[:options['lote']]
+            )
+            if not pacientes:
+                break
+            ultimo_id = pacientes[-1][0]
+            totais['pacientes'] += len(pacientes)
+
+            with transaction.atomic():
+                self._processar_lote(pacientes, hoje, options, totais)
+
+        duracao = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.stdout.write(self.style.SUCCESS('Reprocessamento PREVENT concluído!'))
+        self.stdout.write(f"- Pacientes ativos: {totais['pacientes']}")
+        self.stdout.write(f"- Sem lipídios/eGFR (nunca avaliados): {totais['sem_dados']}")
+        self.stdout.write(f"- Fora das faixas validadas: {totais['fora_faixa']}")
+        self.stdout.write(f"- Calculados: {totais['calculados']}")
+        self.stdout.write(f"- Gravados (risco ou dados alterados): {totais['gravados']}")
+        self.stdout.write(f"- Tempo: {duracao:.2f}s ({totais['pacientes'] / duracao if duracao else 0:,.0f} pacientes/s)")
+        self.stdout.write(f"- Pico de memória: {pico / 1024 / 1024:.1f} MB")
+
+    def _processar_lote(self, pacientes, hoje, options, totais):
+        ids = [p[0] for p in pacientes]
+
+        # Uma consulta por fonte de dados para o lote inteiro
+        prevent = ultimos_por_paciente(
+            AvaliacaoPrevent.objects.filter(paciente_id__in=ids), 'data_avaliacao',
+            'id', 'colesterol_total', 'hdl', 'tfg', 'em_tratamento_has', 'em_uso_estatina',
+            'pressao_sistolica', 'tem_diabetes', 'fumante', 'risco_10_anos', 'risco_30_anos',
+        )
+        multi = ultimos_por_paciente(
+            AtendimentoMultidisciplinar.objects.filter(paciente_id__in=ids), 'data_atendimento',
+            'tem_diabetes', 'fumante',
+        )
+        afericoes = ultimos_por_paciente(
+            Afericao.objects.filter(paciente_id__in=ids), 'data_afericao', 'pressao_sistolica',
+        )
+
+        candidatos = [p for p in pacientes if p[0] in prevent]
+        totais['sem_dados'] += len(pacientes) - len(candidatos)
+        if not candidatos:
+            return
+
+        ultimas = [prevent[p[0]] for p in candidatos]
+        idade = np.array(idades_em([p[2] for p in candidatos], hoje))
+        sexo = np.array([p[1] for p in candidatos])
+        colesterol = np.array([u[1] for u in ultimas])
+        hdl = np.array([u[2] for u in ultimas])
+        tfg = np.array([float(u[3]) for u in ultimas])
+        anti_has = np.array([u[4] for u in ultimas])
+        estatina = np.array([u[5] for u in ultimas])
+        # Dados mais recentes têm prioridade; sem eles, mantém o que foi usado na última avaliação
+        pas = np.array([afericoes[p[0]][0] if p[0] in afericoes else u[6] for p, u in zip(candidatos, ultimas)])
+        diabetes = np.array([multi[p[0]][0] if p[0] in multi else u[7] for p, u in zip(candidatos, ultimas)])
+        fumante = np.array([multi[p[0]][1] if p[0] in multi else u[8] for p, u in zip(candidatos, ultimas)])
+
+        validos = entradas_validas_lote(idade, colesterol, hdl, pas, tfg)
+        totais['fora_faixa'] += int((~validos).sum())
+        totais['calculados'] += int(validos.sum())
+
+        risco_10, risco_30 = calcular_risco_prevent_lote(
+            idade, sexo, colesterol, hdl, pas, tfg, anti_has, diabetes, fumante, estatina
+        )
+        risco_10 = np.round(risco_10, 1)
+        risco_30 = np.round(risco_30, 1)
+
+        novos, alterados, resumos = [], [], []
+        for i in np.flatnonzero(validos):
+            p, u = candidatos[i], ultimas[i]
+            r30 = None if np.isnan(risco_30[i]) else float(risco_30[i])
+            anterior_30 = float(u[10]) if u[10] is not None else None
+            sem_mudanca = (
+                float(u[9]) == risco_10[i] and anterior_30 == r30
+                and u[6] == pas[i] and u[7] == diabetes[i] and u[8] == fumante[i]
+            )
+            if sem_mudanca:
+                continue
+
+            campos = {
+                'idade': int(idade[i]),
+                'pressao_sistolica': int(pas[i]),
+                'tem_diabetes': bool(diabetes[i]),
+                'fumante': bool(fumante[i]),
+                'risco_10_anos': float(risco_10[i]),
+                'risco_30_anos': r30,
+            }
+            # bulk_create/bulk_update não passam pelo save(): o resumo do paciente é gravado aqui
+            resumos.append(Paciente(
+                id=p[0], nivel_risco=classificar_risco(risco_10[i])[0], risco_prevent_atual=float(risco_10[i])
+            ))
+            if options['no_lugar']:
+                alterados.append(AvaliacaoPrevent(id=u[0], **campos))
+            else:
+                novos.append(AvaliacaoPrevent(
+                    paciente_id=p[0], sexo=p[1], colesterol_total=int(colesterol[i]), hdl=int(hdl[i]),
+                    tfg=u[3], em_tratamento_has=bool(anti_has[i]), em_uso_estatina=bool(estatina[i]),
+                    **campos
+                ))
+
+        totais['gravados'] += len(novos) + len(alterados)
+        if options['simular']:
+            return
+        if novos:
+            AvaliacaoPrevent.objects.bulk_create(novos, batch_size=1000)
+        if alterados:
+            AvaliacaoPrevent.objects.bulk_update(
+                alterados,
+                ['idade', 'pressao_sistolica', 'tem_diabetes', 'fumante', 'risco_10_anos', 'risco_30_anos'],
+                batch_size=1000,
+            )
+        Paciente.objects.bulk_update(resumos, ['nivel_risco', 'risco_prevent_atual'], batch_size=1000)
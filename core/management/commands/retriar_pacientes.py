@@ -0,0 +1,94 @@
+import csv
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from core.coorte import ultimos_por_paciente
+from core.models import AtendimentoMultidisciplinar, Paciente
+from core.triagem import (
+    anotar_fatores_risco, avaliar_elegibilidade_lote, contar_elegibilidade, protocolo_vigente, q_elegivel
+)
+
+
+class Command(BaseCommand):
+    help = 'Re-triagem de todos os pacientes ativos (elegível x contrarreferência) após mudança de protocolo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modo', choices=['sql', 'vetorizado'], default='sql',
+                            help='sql: agregação no banco; vetorizado: NumPy sobre as últimas leituras')
+        parser.add_argument('--pas-estagio-2', type=int)
+        parser.add_argument('--pad-estagio-2', type=int)
+        parser.add_argument('--pas-estagio-1', type=int)
+        parser.add_argument('--pad-estagio-1', type=int)
+        parser.add_argument('--municipio', action='append', help='Filtra por município (pode repetir)')
+        parser.add_argument('--csv', help='Grava id, nome, município e desfecho de cada paciente neste arquivo')
+        parser.add_argument('--lote', type=int, default=20000, help='Pacientes por lote (modo vetorizado)')
+
+    def handle(self, *args, **options):
+        protocolo = protocolo_vigente(
+            pas_estagio_2=options['pas_estagio_2'], pad_estagio_2=options['pad_estagio_2'],
+            pas_estagio_1=options['pas_estagio_1'], pad_estagio_1=options['pad_estagio_1'],
+        )
+        pacientes = Paciente.objects.filter(ativo=True)
+        if options['municipio']:
+            pacientes = pacientes.filter(municipio__in=options['municipio'])
+
+        inicio = time.perf_counter()
+        if options['csv']:
+            resultado = self._exportar_csv(pacientes, protocolo, options['csv'])
+        elif options['modo'] == 'sql':
+            resultado = contar_elegibilidade(pacientes, protocolo)
+        else:
+            resultado = self._contar_vetorizado(pacientes, protocolo, options['lote'])
+        duracao = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS('Re-triagem concluída!'))
+        self.stdout.write(f'- Protocolo: {protocolo}')
+        self.stdout.write(f"- Pacientes ativos: {resultado['total']}")
+        self.stdout.write(f"- Elegíveis: {resultado['elegiveis']}")
+        self.stdout.write(f"- Contrarreferência: {resultado['contrarreferencia']}")
+        self.stdout.write(f"- Tempo: {duracao:.2f}s")
+
+    def _contar_vetorizado(self, pacientes, protocolo, lote):
+        total = elegiveis = 0
+        ultimo_id = 0
+        while True:
+            linhas = list(
+                pacientes.filter(id__gt=ultimo_id).order_by('id')
+                .values_list('id', 'ultima_pas', 'ultima_pad')[:lote]
+            )
+            if not linhas:
+                break
+            ultimo_id = linhas[-1][0]
+            ids = [linha[0] for linha in linhas]
+            multi = ultimos_por_paciente(
+                AtendimentoMultidisciplinar.objects.filter(paciente_id__in=ids), 'data_atendimento',
+                'tem_diabetes', 'tem_lesao_orgao',
+            )
+
+            pas = np.array([linha[1] or np.nan for linha in linhas], dtype=float)
+            pad = np.array([linha[2] for linha in linhas], dtype=float)
+            diabetes = np.array([multi.get(i, (False, False))[0] for i in ids])
+            loa = np.array([multi.get(i, (False, False))[1] for i in ids])
+
+            total += len(linhas)
+            elegiveis += int(avaliar_elegibilidade_lote(pas, pad, diabetes, loa, protocolo).sum())
+        return {'total': total, 'elegiveis': elegiveis, 'contrarreferencia': total - elegiveis}
+
+    def _exportar_csv(self, pacientes, protocolo, caminho):
+        total = elegiveis = 0
+        linhas = (
+            anotar_fatores_risco(pacientes)
+            .annotate(elegivel=q_elegivel(protocolo))
+            .order_by('id')
+            .values_list('id', 'nome', 'municipio', 'elegivel')
+        )
+        with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+            saida = csv.writer(arquivo, delimiter=';')
+            saida.writerow(['id', 'nome', 'municipio', 'desfecho'])
+            for pid, nome, municipio, elegivel in linhas.iterator(chunk_size=5000):
+                total += 1
+                elegiveis += bool(elegivel)
+                saida.writerow([pid, nome, municipio, 'ELEGIVEL' if elegivel else 'CONTRARREFERENCIA'])
+        return {'total': total, 'elegiveis': elegiveis, 'contrarreferencia': total - elegiveis}
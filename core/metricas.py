@@ -0,0 +1,272 @@
+"""
+Métricas no formato de texto do Prometheus, agregadas entre os workers do gunicorn.
+
+Cada processo acumula contadores, histogramas e gauges em memória (custo de um dict por
+observação) e grava um retrato em PASTA_METRICAS/<pid>-<início>.json no máximo a cada
+METRICAS_INTERVALO segundos (o instante de início distingue um PID reaproveitado pelo sistema).
+O endpoint /metrics soma os retratos de todos os processos. Retratos de processos que já
+terminaram (como o mark_process_dead do prometheus_client) têm contadores e histogramas somados
+em PASTA_METRICAS/mortos.json, que continua entrando na soma (contador não pode diminuir), e são
+apagados: a pasta não cresce a cada reinício de worker. Gauges só valem para retratos recentes
+de processos vivos e são agregados pelo máximo.
+"""
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+PASTA_METRICAS = os.path.join(tempfile.gettempdir(), 'hipertensao_metricas')
+
+# Limites (segundos) dos histogramas de latência
+BALDES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# nome -> (tipo, descrição)
+METRICAS = {
+    'http_requisicao_segundos': ('histogram', 'Latência das requisições por rota (nome em core/urls.py).'),
+    'http_respostas_total': ('counter', 'Respostas por rota e código de status.'),
+    'db_consultas_total': ('counter', 'Consultas SQL executadas pelas requisições, por rota.'),
+    'pdf_gerados_total': ('counter', 'PDFs gerados (xhtml2pdf), por template.'),
+    'pdf_erros_total': ('counter', 'PDFs com erro de geração, por template.'),
+    'pdf_render_segundos': ('histogram', 'Tempo de renderização dos PDFs (template + pisa), por template.'),
+    'api_externa_segundos': ('histogram', 'Latência das chamadas às APIs externas (laboratório, OMS).'),
+    'api_externa_erros_total': ('counter', 'Chamadas às APIs externas com erro (exceção ou status 5xx).'),
+    'api_externa_bloqueadas_total': ('counter', 'Chamadas não feitas porque o disjuntor estava aberto.'),
+    'cache_consultas_total': ('counter', 'Leituras de core.cache por namespace: acerto, falta, renovacao (antecipada) ou espera.'),
+    'cache_calculo_segundos': ('histogram', 'Tempo de cálculo dos valores do core.cache, por namespace.'),
+    'disjuntor_estado': ('gauge', 'Estado do disjuntor da API: 0 fechado, 1 meio-aberto, 2 aberto (máximo entre workers).'),
+}
+
+_lock = threading.Lock()
+_contadores = defaultdict(float)
+_histogramas = {}
+_gauges = {}
+_pid = os.getpid()
+_inicio = time.time_ns()
+_ultima_gravacao = 0.0
+ARQUIVO_MORTOS = 'mortos.json'
+
+
+def _chave(nome, rotulos):
+    return nome, tuple(sorted(rotulos.items()))
+
+
+def _conferir_processo():
+    # Depois de um fork (gunicorn --preload) o filho não herda as contagens do pai
+    global _pid, _inicio, _ultima_gravacao
+    if os.getpid() != _pid:
+        _pid = os.getpid()
+        _inicio = time.time_ns()
+        _contadores.clear()
+        _histogramas.clear()
+        _gauges.clear()
+        _ultima_gravacao = 0.0
+
+
+def incrementar(nome, valor=1, **rotulos):
+    with _lock:
+        _conferir_processo()
+        _contadores[_chave(nome, rotulos)] += valor
+
+
+def observar(nome, segundos, **rotulos):
+    chave = _chave(nome, rotulos)
+    with _lock:
+        _conferir_processo()
+        histograma = _histogramas.get(chave)
+        if histograma is None:
+            histograma = _histogramas[chave] = [0] * (len(BALDES) + 2)  # baldes..., soma, total
+        for i, limite in enumerate(BALDES):
+            if segundos <= limite:
+                histograma[i] += 1
+                break
+        histograma[-2] += segundos
+        histograma[-1] += 1
+
+
+def definir(nome, valor, **rotulos):
+    with _lock:
+        _conferir_processo()
+        _gauges[_chave(nome, rotulos)] = valor
+    gravar()  # mudanças de gauge são raras e precisam aparecer logo
+
+
+def _retrato():
+    with _lock:
+        return {
+            'contadores': [[n, r, v] for (n, r), v in _contadores.items()],
+            'histogramas': [[n, r, h] for (n, r), h in _histogramas.items()],
+            'gauges': [[n, r, v] for (n, r), v in _gauges.items()],
+        }
+
+
+def gravar():
+    global _ultima_gravacao
+    _ultima_gravacao = time.monotonic()
+    os.makedirs(PASTA_METRICAS, exist_ok=True)
+    with _lock:
+        _conferir_processo()
+        nome = f'{_pid}-{_inicio}.json'
+    destino = os.path.join(PASTA_METRICAS, nome)
+    temporario = f'{destino}.tmp'
+    with open(temporario, 'w', encoding='utf-8') as arquivo:
+        json.dump(_retrato(), arquivo)
+    os.replace(temporario, destino)  # leitores nunca veem um arquivo pela metade
+
+
+def talvez_gravar():
+    """Chamado ao fim de cada requisição: grava o retrato se o último tiver mais de METRICAS_INTERVALO s."""
+    if time.monotonic() - _ultima_gravacao >= getattr(settings, 'METRICAS_INTERVALO', 5):
+        gravar()
+
+
+def _processo(nome_arquivo):
+    """(pid, início) de um retrato '<pid>-<início>.json'; None para outros arquivos."""
+    pid, _, inicio = nome_arquivo[:-len('.json')].partition('-')
+    return (int(pid), int(inicio)) if pid.isdigit() and inicio.isdigit() else None
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # existe, de outro usuário
+        return True
+    return True
+
+
+def _ler(caminho):
+    with open(caminho, encoding='utf-8') as arquivo:
+        return json.load(arquivo)
+
+
+def _somar(contadores, histogramas, retrato):
+    for nome, rotulos, valor in retrato['contadores']:
+        contadores[nome, tuple(map(tuple, rotulos))] += valor
+    for nome, rotulos, valores in retrato['histogramas']:
+        chave = (nome, tuple(map(tuple, rotulos)))
+        atual = histogramas.setdefault(chave, [0] * len(valores))
+        histogramas[chave] = [a + v for a, v in zip(atual, valores)]
+
+
+def _recolher_mortos():
+    """
+    Soma os retratos de processos encerrados em mortos.json e os apaga. Um retrato é de processo
+    encerrado se o PID não existe mais ou se o mesmo PID já tem retrato de um início posterior.
+    O mortos.json lista os retratos que já incorporou: se o processo cair entre a gravação e a
+    remoção, a próxima coleta só termina de apagá-los, sem somar de novo.
+    """
+    with open(os.path.join(PASTA_METRICAS, 'mortos.lock'), 'w') as trava:
+        fcntl.flock(trava, fcntl.LOCK_EX)  # um /metrics por vez, entre os workers
+        caminho_mortos = os.path.join(PASTA_METRICAS, ARQUIVO_MORTOS)
+        try:
+            mortos = _ler(caminho_mortos)
+        except (OSError, ValueError):
+            mortos = {'contadores': [], 'histogramas': [], 'gauges': [], 'incorporados': []}
+        for nome_arquivo in mortos['incorporados']:
+            try:
+                os.remove(os.path.join(PASTA_METRICAS, nome_arquivo))
+            except FileNotFoundError:
+                pass
+
+        processos = {nome: _processo(nome) for nome in os.listdir(PASTA_METRICAS) if nome.endswith('.json')}
+        processos = {nome: processo for nome, processo in processos.items() if processo}
+        ultimo_inicio = {}
+        for pid, inicio in processos.values():
+            ultimo_inicio[pid] = max(inicio, ultimo_inicio.get(pid, inicio))
+        encerrados = [nome for nome, (pid, inicio) in processos.items()
+                      if inicio < ultimo_inicio[pid] or not _vivo(pid)]
+        if not encerrados:
+            return
+
+        contadores, histogramas = defaultdict(float), {}
+        _somar(contadores, histogramas, mortos)
+        incorporados = []
+        for nome_arquivo in encerrados:
+            try:
+                _somar(contadores, histogramas, _ler(os.path.join(PASTA_METRICAS, nome_arquivo)))
+            except (OSError, ValueError):
+                continue
+            incorporados.append(nome_arquivo)
+        temporario = f'{caminho_mortos}.tmp'
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump({
+                'contadores': [[n, r, v] for (n, r), v in contadores.items()],
+                'histogramas': [[n, r, h] for (n, r), h in histogramas.items()],
+                'gauges': [],
+                'incorporados': incorporados,
+            }, arquivo)
+        os.replace(temporario, caminho_mortos)
+        for nome_arquivo in incorporados:
+            os.remove(os.path.join(PASTA_METRICAS, nome_arquivo))
+
+
+def _agregar():
+    _recolher_mortos()
+    contadores = defaultdict(float)
+    histogramas = {}
+    gauges = {}
+    validade_gauges = time.time() - getattr(settings, 'METRICAS_VALIDADE_GAUGES', 300)
+    for nome_arquivo in os.listdir(PASTA_METRICAS):
+        if not nome_arquivo.endswith('.json'):
+            continue
+        caminho = os.path.join(PASTA_METRICAS, nome_arquivo)
+        try:
+            retrato = _ler(caminho)
+            recente = os.path.getmtime(caminho) >= validade_gauges
+        except (OSError, ValueError):
+            continue
+        _somar(contadores, histogramas, retrato)
+        if recente:
+            for nome, rotulos, valor in retrato['gauges']:
+                chave = (nome, tuple(map(tuple, rotulos)))
+                gauges[chave] = max(valor, gauges.get(chave, valor))
+    return contadores, histogramas, gauges
+
+
+def _rotulos(rotulos, extra=()):
+    pares = list(rotulos) + list(extra)
+    if not pares:
+        return ''
+    texto = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pares)
+    return '{' + texto + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) and not valor.is_integer() else str(int(valor))
+
+
+def exportar():
+    """Texto no formato de exposição do Prometheus (0.0.4) com a soma de todos os workers."""
+    gravar()
+    contadores, histogramas, gauges = _agregar()
+    por_metrica = defaultdict(list)
+    for (nome, rotulos), valor in contadores.items():
+        por_metrica[nome].append((rotulos, valor))
+    for (nome, rotulos), valor in gauges.items():
+        por_metrica[nome].append((rotulos, valor))
+    for (nome, rotulos), valores in histogramas.items():
+        por_metrica[nome].append((rotulos, valores))
+
+    linhas = []
+    for nome in sorted(por_metrica):
+        tipo, descricao = METRICAS.get(nome, ('untyped', ''))
+        linhas.append(f'# HELP {nome} {descricao}')
+        linhas.append(f'# TYPE {nome} {tipo}')
+        for rotulos, valor in sorted(por_metrica[nome]):
+            if tipo != 'histogram':
+                linhas.append(f'{nome}{_rotulos(rotulos)} {_numero(valor)}')
+                continue
+            acumulado = 0
+            for limite, quantidade in zip(BALDES, valor):
+                acumulado += quantidade
+                linhas.append(f'{nome}_bucket{_rotulos(rotulos, [("le", limite)])} {acumulado}')
+            linhas.append(f'{nome}_bucket{_rotulos(rotulos, [("le", "+Inf")])} {valor[-1]}')
+            linhas.append(f'{nome}_sum{_rotulos(rotulos)} {_numero(valor[-2])}')
+            linhas.append(f'{nome}_count{_rotulos(rotulos)} {valor[-1]}')
+    return '\n'.join(linhas) + '\n'
@@ -0,0 +1,154 @@
+import cProfile
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metricas, replica
+from .autenticacao import papeis
+from .instrumentacao import CATEGORIAS, instalar, medindo, medir_sql
+from .perfilamento import salvar_perfil
+
+logger = logging.getLogger('core.instrumentacao')
+
+
+class InstrumentacaoMiddleware:
+    """
+    Mede cada requisição (consultas e tempo de SQL, templates, PDFs e HTTP externo) e publica o
+    resultado no cabeçalho Server-Timing (visível no DevTools do navegador) e em uma linha JSON no
+    logger 'core.instrumentacao'. Opcional: sem INSTRUMENTACAO_HABILITADA o Django descarta o
+    middleware na inicialização e nada é envolvido.
+    Obs.: o tempo de template inclui as consultas feitas durante a renderização.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTACAO_HABILITADA', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instalar()
+
+    def __call__(self, request):
+        with medindo() as medicao, ExitStack() as pilha:
+            for alias in connections:
+                pilha.enter_context(connections[alias].execute_wrapper(medir_sql))
+            response = self.get_response(request)
+
+        total_ms = medicao.total * 1000
+        partes = [
+            f'{categoria};dur={medicao.segundos[categoria] * 1000:.1f};desc="{medicao.chamadas[categoria]}x"'
+            for categoria in CATEGORIAS if medicao.chamadas[categoria]
+        ]
+        partes.append(f'total;dur={total_ms:.1f}')
+        response['Server-Timing'] = ', '.join(partes)
+
+        registro = {
+            'metodo': request.method,
+            'caminho': request.path,
+            'rota': request.resolver_match.url_name if request.resolver_match else None,
+            'status': response.status_code,
+            'usuario': request.user.pk if getattr(request, 'user', None) and request.user.is_authenticated else None,
+            'total_ms': round(total_ms, 1),
+        }
+        for categoria in CATEGORIAS:
+            registro[f'{categoria}_n'] = medicao.chamadas[categoria]
+            registro[f'{categoria}_ms'] = round(medicao.segundos[categoria] * 1000, 1)
+        logger.info(json.dumps(registro, ensure_ascii=False))
+        return response
+
+
+class MetricasMiddleware:
+    """
+    Alimenta o /metrics (core.metricas): latência e status por rota e número de consultas SQL.
+    Desligável com METRICAS_HABILITADAS = False.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICAS_HABILITADAS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        consultas = [0]
+
+        def contar(execute, sql, params, many, context):
+            consultas[0] += 1
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        with ExitStack() as pilha:
+            for alias in connections:
+                pilha.enter_context(connections[alias].execute_wrapper(contar))
+            response = self.get_response(request)
+        segundos = time.perf_counter() - inicio
+
+        rota = request.resolver_match.url_name if request.resolver_match else 'sem_rota'
+        metricas.observar('http_requisicao_segundos', segundos, rota=rota, metodo=request.method)
+        metricas.incrementar('http_respostas_total', rota=rota, status=response.status_code)
+        if consultas[0]:
+            metricas.incrementar('db_consultas_total', consultas[0], rota=rota)
+        metricas.talvez_gravar()
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Controla o leia-suas-escritas da réplica de leitura (core.replica): marca o início e o fim de
+    cada requisição e, se ela escreveu no banco, devolve o cookie que prende as leituras do
+    navegador ao principal por REPLICA_ATRASO_MAXIMO segundos. Sem réplica configurada o Django
+    descarta o middleware na inicialização.
+    """
+
+    def __init__(self, get_response):
+        if replica.REPLICA not in settings.DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            fixado_ate = float(request.COOKIES.get(replica.COOKIE_PRIMARIO, 0))
+        except ValueError:
+            fixado_ate = 0
+        token = replica.iniciar_requisicao(fixado=fixado_ate > time.time())
+        try:
+            response = self.get_response(request)
+        finally:
+            estado = replica.finalizar_requisicao(token)
+
+        if estado.escreveu:
+            atraso = replica.atraso_maximo()
+            response.set_cookie(replica.COOKIE_PRIMARIO, str(int(time.time()) + atraso),
+                                max_age=atraso, httponly=True, samesite='Lax')
+        return response
+
+
+class PerfilamentoMiddleware:
+    """
+    Executa a view sob cProfile quando um administrador pede: ?_perfil=1 na URL ou o cabeçalho
+    X-Perfilar: 1 (útil para as APIs JSON). O perfil fica na lista de Perfis (tela perfis/) e o
+    nome volta no cabeçalho X-Perfil. Sem o parâmetro/cabeçalho a view é chamada normalmente.
+    Deve ficar por último em MIDDLEWARE (depois da autenticação).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if '_perfil' not in request.GET and 'HTTP_X_PERFILAR' not in request.META:
+            return None
+        # Mesma regra do admin_only
+        if not papeis(request).admin:
+            return None
+
+        perfil = cProfile.Profile()
+        inicio = time.perf_counter()
+        response = perfil.runcall(view_func, request, *view_args, **view_kwargs)
+        segundos = time.perf_counter() - inicio
+        response['X-Perfil'] = salvar_perfil(perfil, request, response, segundos)
+        return response
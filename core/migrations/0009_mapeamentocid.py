@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_atendimentomedico_prescricaomedica_itemprescricao_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapeamentoCid',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cid10', models.CharField(max_length=10, unique=True, verbose_name='CID-10')),
+                ('cid11', models.CharField(max_length=20, verbose_name='CID-11')),
+                ('titulo', models.CharField(blank=True, max_length=255)),
+                ('classe', models.CharField(choices=[('category', 'Categoria'), ('block', 'Agrupamento')], default='category', max_length=10)),
+            ],
+            options={
+                'verbose_name': 'Mapeamento CID-10 / CID-11',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-19 11:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_mapeamentocid'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversaoCidOMS',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cid10', models.CharField(max_length=10, unique=True, verbose_name='CID-10')),
+                ('resultado', models.CharField(max_length=200)),
+                ('encontrado', models.BooleanField(default=True)),
+                ('data_consulta', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Conversão CID (API OMS)',
+            },
+        ),
+    ]
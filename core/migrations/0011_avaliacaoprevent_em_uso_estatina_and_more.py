@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_conversaocidoms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='avaliacaoprevent',
+            name='em_uso_estatina',
+            field=models.BooleanField(default=False, verbose_name='Em uso de Estatina?'),
+        ),
+        migrations.AlterField(
+            model_name='avaliacaoprevent',
+            name='risco_30_anos',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='Risco 30 Anos (%)'),
+        ),
+    ]
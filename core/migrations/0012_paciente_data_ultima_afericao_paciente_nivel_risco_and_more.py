@@ -0,0 +1,75 @@
+# Generated by Django 6.0 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+def preencher_resumo_risco(apps, schema_editor):
+    """Preenche nível de risco e última PA dos pacientes já cadastrados."""
+    from core.prevent import classificar_risco
+
+    Paciente = apps.get_model('core', 'Paciente')
+    AvaliacaoPrevent = apps.get_model('core', 'AvaliacaoPrevent')
+    Afericao = apps.get_model('core', 'Afericao')
+
+    atualizados = {}
+    for paciente_id, risco in AvaliacaoPrevent.objects.order_by('data_avaliacao', 'id').values_list(
+            'paciente_id', 'risco_10_anos'):
+        atualizados.setdefault(paciente_id, {})['risco'] = risco
+    for paciente_id, pas, pad, data in Afericao.objects.order_by('data_afericao', 'id').values_list(
+            'paciente_id', 'pressao_sistolica', 'pressao_diastolica', 'data_afericao'):
+        atualizados.setdefault(paciente_id, {})['pa'] = (pas, pad, data)
+
+    pacientes = []
+    for paciente_id, dados in atualizados.items():
+        p = Paciente(id=paciente_id)
+        if 'risco' in dados:
+            p.risco_prevent_atual = dados['risco']
+            p.nivel_risco = classificar_risco(float(dados['risco']))[0]
+        if 'pa' in dados:
+            p.ultima_pas, p.ultima_pad, p.data_ultima_afericao = dados['pa']
+        pacientes.append(p)
+    Paciente.objects.bulk_update(
+        pacientes,
+        ['nivel_risco', 'risco_prevent_atual', 'ultima_pas', 'ultima_pad', 'data_ultima_afericao'],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_avaliacaoprevent_em_uso_estatina_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paciente',
+            name='data_ultima_afericao',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='nivel_risco',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Sem Avaliação'), (1, 'Risco Baixo'), (2, 'Risco Limítrofe'), (3, 'Risco Intermediário'), (4, 'Alto Risco')], default=0),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='risco_prevent_atual',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='ultima_pad',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='ultima_pas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['nivel_risco', 'ultima_pas', 'id'], name='paciente_lista_risco_idx'),
+        ),
+        migrations.RunPython(preencher_resumo_risco, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-19 17:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_paciente_data_ultima_afericao_paciente_nivel_risco_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='afericao',
+            name='data_afericao',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-19 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_afericao_data_afericao_horario_aparelho'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='afericao',
+            name='paciente',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='afericoes', to='core.paciente'),
+        ),
+        migrations.AddIndex(
+            model_name='afericao',
+            index=models.Index(fields=['paciente', 'data_afericao'], name='afericao_paciente_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='avaliacaoprevent',
+            index=models.Index(fields=['paciente', 'data_avaliacao'], name='prevent_paciente_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['municipio'], name='paciente_ativo_municipio_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-19 19:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_indices_consultas_frequentes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArquivoPaciente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_arquivamento', models.DateTimeField(default=django.utils.timezone.now)),
+                ('total_registros', models.IntegerField(default=0)),
+                ('dados', models.BinaryField()),
+                ('paciente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='arquivo', to='core.paciente')),
+            ],
+            options={
+                'verbose_name': 'Histórico Arquivado',
+            },
+        ),
+    ]
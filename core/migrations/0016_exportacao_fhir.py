@@ -0,0 +1,57 @@
+# Generated by Django 6.0 on 2026-10-19 13:40
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_arquivopaciente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='afericao',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='atendimentomedico',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='itemprescricao',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='paciente',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ExportacaoFHIR',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('tipos', models.CharField(max_length=200)),
+                ('desde', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('PENDENTE', 'Na fila'), ('EXECUTANDO', 'Em execução'), ('CONCLUIDA', 'Concluída'), ('ERRO', 'Erro')], default='PENDENTE', max_length=20)),
+                ('progresso', models.CharField(blank=True, max_length=100)),
+                ('data_solicitacao', models.DateTimeField(default=django.utils.timezone.now)),
+                ('data_transacao', models.DateTimeField(blank=True, null=True)),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True)),
+                ('arquivos', models.JSONField(default=list)),
+                ('erro', models.TextField(blank=True)),
+                ('solicitante', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Exportação FHIR',
+                'ordering': ['-data_solicitacao'],
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 6.0 on 2026-10-19 13:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_estatisticas(apps, schema_editor):
+    """Estatísticas de PA dos pacientes com aferições já registradas."""
+    from core.estatisticas_pa import recalcular
+
+    recalcular(modelos=[apps.get_model('core', nome) for nome in
+                        ('Afericao', 'EstatisticaPressao', 'ResumoPressaoDiario')])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_exportacao_fhir'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticaPressao',
+            fields=[
+                ('n', models.PositiveIntegerField(default=0)),
+                ('media_pas', models.FloatField(default=0)),
+                ('m2_pas', models.FloatField(default=0)),
+                ('media_pad', models.FloatField(default=0)),
+                ('m2_pad', models.FloatField(default=0)),
+                ('no_alvo', models.PositiveIntegerField(default=0)),
+                ('n_variacoes', models.PositiveIntegerField(default=0)),
+                ('soma_variacao_pas', models.PositiveIntegerField(default=0)),
+                ('soma_variacao_pad', models.PositiveIntegerField(default=0)),
+                ('paciente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estatistica_pa', serialize=False, to='core.paciente')),
+                ('ultima_pas', models.IntegerField(null=True)),
+                ('ultima_pad', models.IntegerField(null=True)),
+                ('data_ultima', models.DateTimeField(null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumoPressaoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('n', models.PositiveIntegerField(default=0)),
+                ('media_pas', models.FloatField(default=0)),
+                ('m2_pas', models.FloatField(default=0)),
+                ('media_pad', models.FloatField(default=0)),
+                ('m2_pad', models.FloatField(default=0)),
+                ('no_alvo', models.PositiveIntegerField(default=0)),
+                ('n_variacoes', models.PositiveIntegerField(default=0)),
+                ('soma_variacao_pas', models.PositiveIntegerField(default=0)),
+                ('soma_variacao_pad', models.PositiveIntegerField(default=0)),
+                ('dia', models.DateField()),
+                ('paciente', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='resumos_pa', to='core.paciente')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('paciente', 'dia'), name='resumo_pa_paciente_dia_unico')],
+            },
+        ),
+        migrations.RunPython(preencher_estatisticas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_estatisticas_pa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportacaofhir',
+            name='ultimo_progresso',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-19 16:10
+
+from django.db import migrations, models
+
+
+def limpar_aviso_gravado(apps, schema_editor):
+    # Atendimentos antigos guardavam o aviso da OMS no lugar do código CID-11
+    AtendimentoMedico = apps.get_model('core', 'AtendimentoMedico')
+    AtendimentoMedico.objects.filter(cid11_correspondente='Não encontrado na base CID-11').update(
+        cid11_correspondente='', cid11_nao_encontrado=True)
+    apps.get_model('core', 'ConversaoCidOMS').objects.filter(encontrado=False).update(resultado='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_exportacaofhir_ultimo_progresso'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='atendimentomedico',
+            name='cid11_nao_encontrado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(limpar_aviso_gravado, migrations.RunPython.noop),
+    ]
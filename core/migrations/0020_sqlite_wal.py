@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-19 16:40
+
+from django.db import migrations
+
+
+def ativar_wal(apps, schema_editor):
+    # O modo WAL fica gravado no arquivo do banco: basta ligá-lo uma vez (ver settings.SQLITE_PRAGMAS)
+    if schema_editor.connection.vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+
+
+class Migration(migrations.Migration):
+    # PRAGMA journal_mode não muda dentro de uma transação
+    atomic = False
+
+    dependencies = [
+        ('core', '0019_atendimentomedico_cid11_nao_encontrado'),
+    ]
+
+    operations = [
+        migrations.RunPython(ativar_wal, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from datetime import date
@@ -127,6 +129,28 @@ class Paciente(models.Model):
     # Memória da última altura
     altura_ultima = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True)
 
+    # Resumo para a lista de trabalho por risco (mantido pelos saves de AvaliacaoPrevent e Afericao)
+    NIVEL_RISCO_CHOICES = [
+        (0, 'Sem Avaliação'), (1, 'Risco Baixo'), (2, 'Risco Limítrofe'),
+        (3, 'Risco Intermediário'), (4, 'Alto Risco'),
+    ]
+    nivel_risco = models.PositiveSmallIntegerField(choices=NIVEL_RISCO_CHOICES, default=0)
+    risco_prevent_atual = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    ultima_pas = models.IntegerField(default=0)  # 0 = sem aferição
+    ultima_pad = models.IntegerField(default=0)
+    data_ultima_afericao = models.DateTimeField(null=True, blank=True)
+    # Exportação FHIR incremental (_since, core/fhir.py). Nulo = não alterado desde a criação do campo
+    atualizado_em = models.DateTimeField(auto_now=True, null=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Índice parcial: o filtro ativo=True vira 'WHERE ativo' no SQLite, que só casa com a condição do índice
+            models.Index(fields=['nivel_risco', 'ultima_pas', 'id'], condition=models.Q(ativo=True),
+                         name='paciente_lista_risco_idx'),
+            # Filtros e agrupamentos por município do painel (mesmo motivo: parcial em vez de (ativo, municipio))
+            models.Index(fields=['municipio'], condition=models.Q(ativo=True), name='paciente_ativo_municipio_idx'),
+        ]
+
     def __str__(self):
         return self.nome
 
@@ -139,9 +163,11 @@ class Paciente(models.Model):
 
 
 class Afericao(models.Model):
-    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='afericoes')
+    # Sem índice próprio: o índice (paciente, data_afericao) abaixo já começa por paciente_id
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='afericoes', db_index=False)
     usuario = models.ForeignKey(Usuario, on_delete=models.PROTECT)
-    data_afericao = models.DateTimeField(auto_now_add=True)
+    # default em vez de auto_now_add: a importação de monitores domiciliares grava o horário do aparelho
+    data_afericao = models.DateTimeField(default=timezone.now, editable=False)
 
     pressao_sistolica = models.IntegerField()
     pressao_diastolica = models.IntegerField()
@@ -153,9 +179,111 @@ class Afericao(models.Model):
 
     observacao = models.TextField(blank=True)
     medicamentos = models.ManyToManyField(Medicamento, blank=True)
+    # _since da exportação FHIR (ver Paciente.atualizado_em)
+    atualizado_em = models.DateTimeField(auto_now=True, null=True, db_index=True)
 
     class Meta:
         ordering = ['-data_afericao']
+        indexes = [
+            # Histórico e última aferição do paciente já saem ordenados do índice (sem B-tree temporária)
+            models.Index(fields=['paciente', 'data_afericao'], name='afericao_paciente_data_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        from .estatisticas_pa import recalcular, registrar
+        nova = self._state.adding
+        # Aferição, última PA e estatísticas gravadas juntas: uma falha no meio não deixa as
+        # estatísticas contando (ou deixando de contar) uma aferição
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Atualiza a última PA do paciente, a menos que já exista aferição mais recente
+            Paciente.objects.filter(id=self.paciente_id).filter(
+                models.Q(data_ultima_afericao__isnull=True) | models.Q(data_ultima_afericao__lte=self.data_afericao)
+            ).update(
+                ultima_pas=self.pressao_sistolica,
+                ultima_pad=self.pressao_diastolica,
+                data_ultima_afericao=self.data_afericao,
+            )
+            if nova:
+                registrar([self])
+            else:
+                recalcular([self.paciente_id])
+
+    def delete(self, *args, **kwargs):
+        from .estatisticas_pa import recalcular
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            # A última PA do paciente volta para a aferição mais recente que restou (0/0 se nenhuma)
+            anterior = Afericao.objects.filter(paciente_id=self.paciente_id).order_by('-data_afericao').only(
+                'pressao_sistolica', 'pressao_diastolica', 'data_afericao').first()
+            Paciente.objects.filter(id=self.paciente_id).update(
+                ultima_pas=anterior.pressao_sistolica if anterior else 0,
+                ultima_pad=anterior.pressao_diastolica if anterior else 0,
+                data_ultima_afericao=anterior.data_afericao if anterior else None,
+            )
+            recalcular([self.paciente_id])
+        return resultado
+
+
+class AcumuladorPressao(models.Model):
+    """
+    Acumuladores das estatísticas de PA (core/estatisticas_pa.py): contagem, média e soma dos
+    quadrados dos desvios (Welford), aferições no alvo e soma das variações entre aferições seguidas.
+    """
+    n = models.PositiveIntegerField(default=0)
+    media_pas = models.FloatField(default=0)
+    m2_pas = models.FloatField(default=0)
+    media_pad = models.FloatField(default=0)
+    m2_pad = models.FloatField(default=0)
+    no_alvo = models.PositiveIntegerField(default=0)
+    n_variacoes = models.PositiveIntegerField(default=0)
+    soma_variacao_pas = models.PositiveIntegerField(default=0)  # Σ |PAS - PAS da aferição anterior|
+    soma_variacao_pad = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def desvio_pas(self):
+        return (self.m2_pas / (self.n - 1)) ** 0.5 if self.n > 1 else None
+
+    @property
+    def desvio_pad(self):
+        return (self.m2_pad / (self.n - 1)) ** 0.5 if self.n > 1 else None
+
+    @property
+    def arv_pas(self):
+        return self.soma_variacao_pas / self.n_variacoes if self.n_variacoes else None
+
+    @property
+    def arv_pad(self):
+        return self.soma_variacao_pad / self.n_variacoes if self.n_variacoes else None
+
+    @property
+    def percentual_alvo(self):
+        return 100 * self.no_alvo / self.n if self.n else None
+
+
+class EstatisticaPressao(AcumuladorPressao):
+    """Estatísticas de PA de todo o histórico do paciente, atualizadas a cada aferição nova."""
+    paciente = models.OneToOneField(Paciente, on_delete=models.CASCADE, primary_key=True,
+                                    related_name='estatistica_pa')
+    # Última aferição contada: base da variação (ARV) da próxima
+    ultima_pas = models.IntegerField(null=True)
+    ultima_pad = models.IntegerField(null=True)
+    data_ultima = models.DateTimeField(null=True)
+
+
+class ResumoPressaoDiario(AcumuladorPressao):
+    """Os mesmos acumuladores por paciente e dia (local): a janela dos últimos N dias junta até N linhas."""
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='resumos_pa', db_index=False)
+    dia = models.DateField()
+
+    class Meta:
+        constraints = [
+            # Também o índice da janela (paciente, dia >= início)
+            models.UniqueConstraint(fields=['paciente', 'dia'], name='resumo_pa_paciente_dia_unico'),
+        ]
 
 
 class AtendimentoMultidisciplinar(models.Model):
@@ -217,12 +345,44 @@ class AvaliacaoPrevent(models.Model):
     em_tratamento_has = models.BooleanField(default=True, verbose_name="Em tto Anti-hipertensivo?")
     tem_diabetes = models.BooleanField(default=False)
     fumante = models.BooleanField(default=False)
+    em_uso_estatina = models.BooleanField(default=False, verbose_name="Em uso de Estatina?")
     tfg = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="eGFR (ml/min)")
     risco_10_anos = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Risco 10 Anos (%)")
-    risco_30_anos = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Risco 30 Anos (%)")
+    # Calculado no servidor (core.prevent); o risco em 30 anos só existe até 59 anos
+    risco_30_anos = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True,
+                                        verbose_name="Risco 30 Anos (%)")
 
     class Meta:
         verbose_name = "Avaliação PREVENT"
+        indexes = [
+            models.Index(fields=['paciente', 'data_avaliacao'], name='prevent_paciente_data_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        from .prevent import classificar_risco
+        nivel, _, _ = classificar_risco(float(self.risco_10_anos))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # Atualiza o risco do paciente, a menos que já exista avaliação mais recente (edição de uma antiga)
+            mais_recente = AvaliacaoPrevent.objects.filter(paciente_id=self.paciente_id).filter(
+                models.Q(data_avaliacao__gt=self.data_avaliacao) | models.Q(data_avaliacao=self.data_avaliacao, id__gt=self.id)
+            )
+            Paciente.objects.filter(id=self.paciente_id).filter(~models.Exists(mais_recente)).update(
+                nivel_risco=nivel, risco_prevent_atual=self.risco_10_anos
+            )
+
+    def delete(self, *args, **kwargs):
+        from .prevent import classificar_risco
+        with transaction.atomic():
+            resultado = super().delete(*args, **kwargs)
+            # O risco do paciente volta para a avaliação anterior (ou "Sem Avaliação" se nenhuma restou)
+            anterior = AvaliacaoPrevent.objects.filter(paciente_id=self.paciente_id).order_by(
+                '-data_avaliacao', '-id').only('risco_10_anos').first()
+            Paciente.objects.filter(id=self.paciente_id).update(
+                nivel_risco=classificar_risco(float(anterior.risco_10_anos))[0] if anterior else 0,
+                risco_prevent_atual=anterior.risco_10_anos if anterior else None,
+            )
+        return resultado
 
     def __str__(self):
         return f"Multi - {self.paciente.nome} - {self.data_atendimento}"
@@ -271,13 +431,33 @@ class AtendimentoMedico(models.Model):
     cid10_2 = models.CharField(max_length=10, blank=True, null=True)
     cid10_3 = models.CharField(max_length=10, blank=True, null=True)
     cid11_correspondente = models.CharField(max_length=200, blank=True)
+    # A OMS não tem o CID-10 principal: cid11_correspondente fica vazio e a tela mostra o aviso
+    cid11_nao_encontrado = models.BooleanField(default=False)
+    # _since da exportação FHIR (ver Paciente.atualizado_em)
+    atualizado_em = models.DateTimeField(auto_now=True, null=True, db_index=True)
 
     def save(self, *args, **kwargs):
-        from .services_cid import converter_cid10_para_cid11
+        from .services_cid import converter_cid10_para_cid11, NAO_MAPEADO
+        from .services_cid_oms import WHOConversionService, agendar_resolucao, oms_habilitada
+
+        consultar_oms = False
+        self.cid11_nao_encontrado = False
         if self.cid10_1:
             self.cid11_correspondente = converter_cid10_para_cid11(self.cid10_1)
+            # Sem correspondência local: usa o cache da OMS ou agenda a consulta para depois do commit
+            if self.cid11_correspondente == NAO_MAPEADO and oms_habilitada():
+                em_cache = WHOConversionService.buscar_em_cache(self.cid10_1)
+                if em_cache is not None:
+                    resultado, encontrado = em_cache
+                    self.cid11_correspondente = resultado or ''
+                    self.cid11_nao_encontrado = not encontrado
+                else:
+                    consultar_oms = True
         super().save(*args, **kwargs)
 
+        if consultar_oms:
+            agendar_resolucao(self.pk, self.cid10_1)
+
 
 class PrescricaoMedica(models.Model):
     atendimento = models.OneToOneField(AtendimentoMedico, on_delete=models.CASCADE, related_name='prescricao')
@@ -292,4 +472,79 @@ class ItemPrescricao(models.Model):
     concentracao = models.CharField(max_length=100)
     posologia = models.TextField()
     quantidade = models.CharField(max_length=50)
-    tipo = models.CharField(max_length=20, choices=TIPO_USO, default='CONTINUO')
\ No newline at end of file
+    tipo = models.CharField(max_length=20, choices=TIPO_USO, default='CONTINUO')
+    # _since da exportação FHIR (ver Paciente.atualizado_em)
+    atualizado_em = models.DateTimeField(auto_now=True, null=True, db_index=True)
+
+class ArquivoPaciente(models.Model):
+    """
+    Histórico clínico de paciente com alta antiga, fora das tabelas do dia a dia (ver core/arquivo.py).
+    Somente leitura; volta para as tabelas na readmissão.
+    """
+    paciente = models.OneToOneField(Paciente, on_delete=models.CASCADE, related_name='arquivo')
+    data_arquivamento = models.DateTimeField(default=timezone.now)
+    total_registros = models.IntegerField(default=0)
+    dados = models.BinaryField()  # JSON do serializador do Django, comprimido com zlib
+
+    class Meta:
+        verbose_name = "Histórico Arquivado"
+
+    def __str__(self):
+        return f"{self.paciente} ({self.total_registros} registros)"
+
+
+class MapeamentoCid(models.Model):
+    """Tabela de equivalência CID-10 -> CID-11 (carregada pelo comando carregar_cid)."""
+    CLASSE_CHOICES = [('category', 'Categoria'), ('block', 'Agrupamento')]
+
+    cid10 = models.CharField(max_length=10, unique=True, verbose_name="CID-10")
+    cid11 = models.CharField(max_length=20, verbose_name="CID-11")
+    titulo = models.CharField(max_length=255, blank=True)
+    classe = models.CharField(max_length=10, choices=CLASSE_CHOICES, default='category')
+
+    class Meta:
+        verbose_name = "Mapeamento CID-10 / CID-11"
+
+    def __str__(self):
+        return f"{self.cid10} -> {self.cid11}"
+
+
+class ConversaoCidOMS(models.Model):
+    """Cache compartilhado entre os workers das consultas à API CID-11 da OMS."""
+    cid10 = models.CharField(max_length=10, unique=True, verbose_name="CID-10")
+    resultado = models.CharField(max_length=200)
+    encontrado = models.BooleanField(default=True)
+    data_consulta = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Conversão CID (API OMS)"
+
+    def __str__(self):
+        return f"{self.cid10} -> {self.resultado}"
+
+
+class ExportacaoFHIR(models.Model):
+    """Exportação em massa FHIR ($export) em NDJSON, gerada em segundo plano (ver core/fhir.py)."""
+    STATUS_CHOICES = [
+        ('PENDENTE', 'Na fila'), ('EXECUTANDO', 'Em execução'), ('CONCLUIDA', 'Concluída'), ('ERRO', 'Erro'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    solicitante = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True)
+    tipos = models.CharField(max_length=200)  # recursos separados por vírgula (_type)
+    desde = models.DateTimeField(null=True, blank=True)  # _since
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
+    progresso = models.CharField(max_length=100, blank=True)
+    ultimo_progresso = models.DateTimeField(null=True, blank=True)  # sinal de vida da execução
+    data_solicitacao = models.DateTimeField(default=timezone.now)
+    data_transacao = models.DateTimeField(null=True, blank=True)  # transactionTime do manifesto
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+    arquivos = models.JSONField(default=list)  # [{'type': 'Patient', 'arquivo': 'Patient.ndjson', 'count': 10}]
+    erro = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "Exportação FHIR"
+        ordering = ['-data_solicitacao']
+
+    def __str__(self):
+        return f"$export {self.tipos} ({self.get_status_display()})"
@@ -0,0 +1,82 @@
+"""
+Perfis cProfile sob demanda (ver PerfilamentoMiddleware): cada perfil vira um .prof (abrir com
+snakeviz ou pstats) e um .json com os metadados e o resumo das funções de maior tempo acumulado.
+A pasta é compartilhada entre os workers e guarda só os PERFIS_MAXIMO mais recentes.
+"""
+import io
+import json
+import os
+import pstats
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+PASTA_PERFIS = os.path.join(tempfile.gettempdir(), 'hipertensao_perfis')
+
+
+def _maximo():
+    return getattr(settings, 'PERFIS_MAXIMO', 20)
+
+
+def _resumo(perfil, linhas):
+    saida = io.StringIO()
+    estatisticas = pstats.Stats(perfil, stream=saida)
+    estatisticas.strip_dirs().sort_stats('cumulative').print_stats(linhas)
+    return saida.getvalue()
+
+
+def salvar_perfil(perfil, request, response, segundos, linhas=40):
+    """Grava o perfil da requisição e descarta os mais antigos. Retorna o nome do perfil."""
+    os.makedirs(PASTA_PERFIS, exist_ok=True)
+    agora = timezone.localtime()
+    nome = f"{agora:%Y%m%d-%H%M%S-%f}-{uuid.uuid4().hex[:6]}"  # ordem cronológica pelo nome
+    perfil.dump_stats(os.path.join(PASTA_PERFIS, f'{nome}.prof'))
+    metadados = {
+        'nome': nome,
+        'data': agora.isoformat(),
+        'metodo': request.method,
+        'caminho': request.get_full_path(),
+        'rota': request.resolver_match.url_name if request.resolver_match else None,
+        'usuario': request.user.get_username(),
+        'status': response.status_code,
+        'total_ms': round(segundos * 1000, 1),
+        'resumo': _resumo(perfil, linhas),
+    }
+    with open(os.path.join(PASTA_PERFIS, f'{nome}.json'), 'w', encoding='utf-8') as arquivo:
+        json.dump(metadados, arquivo, ensure_ascii=False)
+    _descartar_antigos()
+    return nome
+
+
+def _descartar_antigos():
+    nomes = sorted(n[:-5] for n in os.listdir(PASTA_PERFIS) if n.endswith('.json'))
+    for nome in nomes[:-_maximo()]:
+        for extensao in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(PASTA_PERFIS, nome + extensao))
+            except FileNotFoundError:
+                pass  # outro worker já removeu
+
+
+def listar_perfis():
+    """Metadados dos perfis guardados, do mais recente para o mais antigo."""
+    if not os.path.isdir(PASTA_PERFIS):
+        return []
+    perfis = []
+    for nome in sorted((n for n in os.listdir(PASTA_PERFIS) if n.endswith('.json')), reverse=True):
+        try:
+            with open(os.path.join(PASTA_PERFIS, nome), encoding='utf-8') as arquivo:
+                perfis.append(json.load(arquivo))
+        except (FileNotFoundError, ValueError):
+            continue  # removido ou ainda sendo gravado por outro worker
+    return perfis
+
+
+def caminho_perfil(nome, extensao):
+    """Caminho do arquivo do perfil, ou None se o nome for inválido ou o arquivo não existir."""
+    if not nome.replace('-', '').isalnum():
+        return None
+    caminho = os.path.join(PASTA_PERFIS, f'{nome}{extensao}')
+    return caminho if os.path.exists(caminho) else None
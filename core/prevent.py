@@ -0,0 +1,186 @@
+"""
+Motor de cálculo AHA PREVENT™ (modelo base, desfecho DCV total).
+
+Implementa as equações publicadas em Khan SS et al., "Development and Validation of
+the American Heart Association's PREVENT Equations", Circulation 2024;149:430-449
+(Tabela Suplementar S12). O mesmo código calcula um paciente (formulário) ou
+vetores inteiros de pacientes (reprocessamento da coorte) com NumPy. Conferido com o exemplo do
+pacote R preventr (mesmas equações, referência da AHA): mulher, 50 anos, CT 200, HDL 45, PAS 160
+tratada, diabetes, não fumante, sem estatina, eGFR 90 -> 14,7% em 10 anos e 53% em 30 anos.
+
+Entradas clínicas em unidades brasileiras (mg/dL); o modelo usa mmol/L.
+"""
+import numpy as np
+
+# Faixas de validade das equações (as do artigo e do preventr). PAS acima de 180 mmHg fica fora:
+# o termo linear de PAS não foi validado além disso, e extrapolá-lo superestimaria o risco
+IDADE_MIN, IDADE_MAX = 30, 79
+IDADE_MAX_30_ANOS = 59  # Risco em 30 anos só é definido até 59 anos
+FAIXAS = {
+    'colesterol_total': (130, 320),
+    'hdl': (20, 100),
+    'pressao_sistolica': (90, 180),
+    'tfg': (15, 140),
+}
+
+MG_DL_PARA_MMOL_L = 0.02586
+
+# Faixas de risco em 10 anos: (limite superior exclusivo, nível, classe CSS, texto)
+# O nível é gravado em Paciente.nivel_risco (0 = sem avaliação) para a lista de trabalho.
+FAIXAS_RISCO = (
+    (5, 1, "bg-success text-white", "Risco Baixo"),
+    (7.5, 2, "bg-warning text-dark", "Risco Limítrofe"),
+    (20, 3, "bg-orange text-white", "Risco Intermediário"),
+    (float('inf'), 4, "bg-danger text-white", "Alto Risco"),
+)
+
+# Ordem dos termos do preditor linear (colunas da matriz de desenho)
+TERMOS = (
+    'intercepto', 'idade', 'idade2', 'nao_hdl', 'hdl', 'pas_baixa', 'pas_alta',
+    'diabetes', 'fumante', 'tfg_baixa', 'tfg_alta', 'anti_has', 'estatina',
+    'anti_has_x_pas_alta', 'estatina_x_nao_hdl', 'idade_x_nao_hdl', 'idade_x_hdl',
+    'idade_x_pas_alta', 'idade_x_diabetes', 'idade_x_fumante', 'idade_x_tfg_baixa',
+)
+
+# Coeficientes por horizonte e sexo, na ordem de TERMOS
+COEFICIENTES = {
+    (10, 'F'): (-3.307728, 0.7939329, 0.0, 0.0305239, -0.1606857, -0.2394003, 0.360078,
+                0.8667604, 0.5360739, 0.6045917, 0.0433769, 0.3151672, -0.1477655,
+                -0.0663612, 0.1197879, -0.0819715, 0.0306769,
+                -0.0946348, -0.27057, -0.078715, -0.1637806),
+    (10, 'M'): (-3.031168, 0.7688528, 0.0, 0.0736174, -0.0954431, -0.4347345, 0.3362658,
+                0.7692857, 0.4386871, 0.5378979, 0.0164827, 0.288879, -0.1337349,
+                -0.0475924, 0.150273, -0.0517874, 0.0191169,
+                -0.1049477, -0.2251948, -0.0895067, -0.1543702),
+    (30, 'F'): (-1.318827, 0.5503079, -0.0928369, 0.0409794, -0.1663306, -0.1628654, 0.3299505,
+                0.6793894, 0.3196112, 0.1857101, 0.0553528, 0.2894, -0.075688,
+                -0.056367, 0.1071019, -0.0751438, 0.0301786,
+                -0.0998776, -0.3206166, -0.1607862, -0.1450788),
+    (30, 'M'): (-1.148204, 0.4627309, -0.0984281, 0.0836088, -0.1029824, -0.2140352, 0.2904325,
+                0.5331276, 0.2141914, 0.1155556, 0.0603775, 0.232714, -0.0272112,
+                -0.0384488, 0.134192, -0.0511759, 0.0165865,
+                -0.1101437, -0.2585943, -0.1566406, -0.1166776),
+}
+_BETA = {chave: np.asarray(valores) for chave, valores in COEFICIENTES.items()}
+
+
+def classificar_risco(risco_10_anos):
+    """Retorna (nivel, classe_css, texto) da faixa do risco em 10 anos (%)."""
+    for limite, nivel, css, texto in FAIXAS_RISCO:
+        if risco_10_anos < limite:
+            return nivel, css, texto
+
+
+class ErroPrevent(ValueError):
+    """Entrada fora das faixas de validade das equações PREVENT."""
+
+
+def validar_entradas(idade, sexo, colesterol_total, hdl, pressao_sistolica, tfg):
+    """Retorna a lista de problemas encontrados (vazia se tudo estiver dentro das faixas)."""
+    erros = []
+    if sexo not in ('M', 'F'):
+        erros.append("Sexo deve ser 'M' ou 'F'.")
+    if not IDADE_MIN <= idade <= IDADE_MAX:
+        erros.append(f"Idade fora da faixa validada ({IDADE_MIN}-{IDADE_MAX} anos).")
+    valores = {
+        'colesterol_total': colesterol_total, 'hdl': hdl,
+        'pressao_sistolica': pressao_sistolica, 'tfg': tfg,
+    }
+    rotulos = {'colesterol_total': 'Colesterol total', 'hdl': 'HDL',
+               'pressao_sistolica': 'PAS', 'tfg': 'eGFR'}
+    for campo, valor in valores.items():
+        minimo, maximo = FAIXAS[campo]
+        if not minimo <= valor <= maximo:
+            erros.append(f"{rotulos[campo]} fora da faixa validada ({minimo}-{maximo}).")
+    if hdl >= colesterol_total:
+        erros.append("HDL deve ser menor que o colesterol total.")
+    return erros
+
+
+def entradas_validas_lote(idade, colesterol_total, hdl, pressao_sistolica, tfg):
+    """Versão vetorizada de validar_entradas: máscara booleana das linhas dentro das faixas."""
+    idade = np.asarray(idade)
+    colesterol_total = np.asarray(colesterol_total)
+    hdl = np.asarray(hdl)
+    valores = {
+        'colesterol_total': colesterol_total, 'hdl': hdl,
+        'pressao_sistolica': np.asarray(pressao_sistolica), 'tfg': np.asarray(tfg, dtype=float),
+    }
+    mascara = (idade >= IDADE_MIN) & (idade <= IDADE_MAX) & (hdl < colesterol_total)
+    for campo, valor in valores.items():
+        minimo, maximo = FAIXAS[campo]
+        mascara &= (valor >= minimo) & (valor <= maximo)
+    return mascara
+
+
+def _matriz_desenho(idade, colesterol_total, hdl, pas, tfg, anti_has, diabetes, fumante, estatina):
+    """Monta a matriz (n, len(TERMOS)) com as variáveis centradas/escaladas do PREVENT."""
+    idade_c = (idade - 55) / 10
+    nao_hdl = (colesterol_total - hdl) * MG_DL_PARA_MMOL_L - 3.5
+    hdl_c = (hdl * MG_DL_PARA_MMOL_L - 1.3) / 0.3
+    pas_baixa = (np.minimum(pas, 110) - 110) / 20
+    pas_alta = (np.maximum(pas, 110) - 130) / 20
+    tfg_baixa = (np.minimum(tfg, 60) - 60) / -15
+    tfg_alta = (np.maximum(tfg, 60) - 90) / -15
+
+    return np.column_stack((
+        np.ones_like(idade_c), idade_c, idade_c ** 2, nao_hdl, hdl_c, pas_baixa, pas_alta,
+        diabetes, fumante, tfg_baixa, tfg_alta, anti_has, estatina,
+        anti_has * pas_alta, estatina * nao_hdl, idade_c * nao_hdl, idade_c * hdl_c,
+        idade_c * pas_alta, idade_c * diabetes, idade_c * fumante, idade_c * tfg_baixa,
+    ))
+
+
+def _risco(x, feminino, horizonte):
+    logito = np.where(feminino, x @ _BETA[(horizonte, 'F')], x @ _BETA[(horizonte, 'M')])
+    return 100.0 / (1.0 + np.exp(-logito))
+
+
+def calcular_risco_prevent_lote(idade, sexo, colesterol_total, hdl, pressao_sistolica, tfg,
+                                em_tratamento_has, tem_diabetes, fumante, em_uso_estatina=None):
+    """
+    Calcula o risco de DCV (%) para vetores de pacientes.
+    Todos os argumentos são sequências de mesmo tamanho; `sexo` contém 'M'/'F'.
+    Retorna (risco_10_anos, risco_30_anos) como arrays float; risco_30_anos é NaN
+    acima de 59 anos. Não valida faixas: use validar_entradas/filtre antes.
+    """
+    idade = np.asarray(idade, dtype=float)
+    feminino = np.asarray(sexo) == 'F'
+    if em_uso_estatina is None:
+        em_uso_estatina = np.zeros_like(idade)
+
+    x = _matriz_desenho(
+        idade,
+        np.asarray(colesterol_total, dtype=float),
+        np.asarray(hdl, dtype=float),
+        np.asarray(pressao_sistolica, dtype=float),
+        np.asarray(tfg, dtype=float),
+        np.asarray(em_tratamento_has, dtype=float),
+        np.asarray(tem_diabetes, dtype=float),
+        np.asarray(fumante, dtype=float),
+        np.asarray(em_uso_estatina, dtype=float),
+    )
+    risco_10 = _risco(x, feminino, 10)
+    risco_30 = np.where(idade <= IDADE_MAX_30_ANOS, _risco(x, feminino, 30), np.nan)
+    return risco_10, risco_30
+
+
+def calcular_risco_prevent(idade, sexo, colesterol_total, hdl, pressao_sistolica, tfg,
+                           em_tratamento_has, tem_diabetes, fumante, em_uso_estatina=False):
+    """
+    Calcula o risco de um paciente, validando as entradas.
+    Retorna {'risco_10_anos': float, 'risco_30_anos': float ou None} em %, com 1 casa decimal.
+    Lança ErroPrevent se alguma entrada estiver fora das faixas validadas.
+    """
+    erros = validar_entradas(idade, sexo, colesterol_total, hdl, pressao_sistolica, tfg)
+    if erros:
+        raise ErroPrevent(' '.join(erros))
+
+    risco_10, risco_30 = calcular_risco_prevent_lote(
+        [idade], [sexo], [colesterol_total], [hdl], [pressao_sistolica], [tfg],
+        [em_tratamento_has], [tem_diabetes], [fumante], [em_uso_estatina]
+    )
+    return {
+        'risco_10_anos': round(float(risco_10[0]), 1),
+        'risco_30_anos': None if np.isnan(risco_30[0]) else round(float(risco_30[0]), 1),
+    }
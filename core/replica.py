@@ -0,0 +1,101 @@
+"""
+Réplica de leitura para painéis, relatórios e exportações.
+
+Só as views marcadas com @usa_replica (core.decorators) leem da conexão 'replica'; todo o resto,
+os comandos e qualquer escrita continuam no banco principal. Leia-suas-escritas:
+- depois de uma escrita, o restante da requisição volta a ler do principal;
+- a requisição que escreveu marca o navegador (cookie) por REPLICA_ATRASO_MAXIMO segundos, para
+  que o painel aberto logo depois de salvar já mostre o dado novo;
+- se a réplica estiver mais atrasada que REPLICA_ATRASO_MAXIMO (marcador gravado pelo comando
+  atualizar_replica), as leituras voltam ao principal até ela ser atualizada.
+Sem 'replica' em DATABASES o roteador não faz nada.
+"""
+import contextvars
+import os
+import time
+
+from django.conf import settings
+
+REPLICA = 'replica'
+COOKIE_PRIMARIO = 'hipertensao_primario'
+# Escritas que não mudam o que os painéis mostram
+APPS_SEM_FIXACAO = {'sessions'}
+
+
+class EstadoRequisicao:
+    def __init__(self, fixado=False):
+        self.usa_replica = False
+        self.fixado = fixado   # leituras presas ao principal
+        self.escreveu = False
+
+
+_estado = contextvars.ContextVar('replica_estado', default=None)
+_marcador_cache = [0.0, 0.0]  # [verificado_em (monotonic), atualizada_em (epoch)]
+
+
+def iniciar_requisicao(fixado=False):
+    return _estado.set(EstadoRequisicao(fixado))
+
+
+def finalizar_requisicao(token):
+    estado = _estado.get()
+    _estado.reset(token)
+    return estado
+
+
+def estado_atual():
+    return _estado.get()
+
+
+def atraso_maximo():
+    return getattr(settings, 'REPLICA_ATRASO_MAXIMO', 30)
+
+
+def caminho_marcador():
+    """Arquivo com a hora da última cópia (só para a réplica SQLite local)."""
+    replica = settings.DATABASES.get(REPLICA)
+    if not replica or replica['ENGINE'] != 'django.db.backends.sqlite3':
+        return None
+    return f"{replica['NAME']}.atualizada"
+
+
+def _replica_em_dia():
+    caminho = caminho_marcador()
+    if caminho is None:
+        return True  # réplica de verdade: o atraso é responsabilidade da replicação do banco
+    agora = time.monotonic()
+    if agora - _marcador_cache[0] > 1:  # relê o marcador no máximo uma vez por segundo
+        _marcador_cache[0] = agora
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                _marcador_cache[1] = float(arquivo.read())
+        except (OSError, ValueError):
+            _marcador_cache[1] = 0.0
+    return time.time() - _marcador_cache[1] <= atraso_maximo()
+
+
+class RoteadorReplica:
+    def db_for_read(self, model, **hints):
+        estado = _estado.get()
+        if estado is None or not estado.usa_replica or estado.fixado:
+            return None
+        if REPLICA not in settings.DATABASES or model._meta.app_label in APPS_SEM_FIXACAO:
+            return None
+        if model._meta.label == settings.AUTH_USER_MODEL:
+            return None  # usuário recém-criado ainda não está na réplica
+        return REPLICA if _replica_em_dia() else None
+
+    def db_for_write(self, model, **hints):
+        estado = _estado.get()
+        if estado is not None and model._meta.app_label not in APPS_SEM_FIXACAO:
+            estado.fixado = True
+            estado.escreveu = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # mesmos dados nos dois bancos
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA:
+            return False  # a réplica recebe o esquema junto com os dados
+        return None
@@ -1,33 +1,242 @@
+import bisect
+import csv
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from types import MappingProxyType
+
+from django.db import DatabaseError
+
+NAO_MAPEADO = "Não Mapeado Automaticamente"
+# Sufixo do resultado por agrupamento (só para exibição, nunca gravado no atendimento)
+APROXIMADO = " (aproximado: agrupamento)"
+
+# Tabela de equivalência empacotada com o sistema (formato das tabelas de
+# mapeamento da OMS: colunas 10ClassKind, icd10Code, icd10Title, icd11Code...).
+# Para usar a tabela oficial completa basta apontar o comando `carregar_cid`
+# para o arquivo baixado de https://icd.who.int/browse11/Downloads
+ARQUIVO_MAPEAMENTO = os.path.join(os.path.dirname(__file__), 'data', 'cid10_cid11.tsv')
+
+
+def normalizar_cid10(cid10_codigo):
+    """Padroniza o código: maiúsculas, sem espaços e com ponto (I100 -> I10.0)."""
+    codigo = (cid10_codigo or '').upper().strip().rstrip('.')
+    if len(codigo) > 3 and '.' not in codigo and '-' not in codigo:
+        codigo = f"{codigo[:3]}.{codigo[3:]}"
+    return codigo
+
+
+def ler_arquivo_mapeamento(caminho=ARQUIVO_MAPEAMENTO):
+    """Gera tuplas (cid10, cid11, titulo, classe) a partir do arquivo TSV da OMS."""
+    with open(caminho, encoding='utf-8-sig', newline='') as arquivo:
+        for linha in csv.DictReader(arquivo, delimiter='\t'):
+            cid10 = normalizar_cid10(linha.get('icd10Code'))
+            cid11 = (linha.get('icd11Code') or '').strip()
+            classe = (linha.get('10ClassKind') or 'category').strip()
+            # Capítulos e linhas sem destino não entram no índice
+            if not cid10 or not cid11 or classe not in ('category', 'block'):
+                continue
+            yield cid10, cid11, (linha.get('icd11Title') or '').strip(), classe
+
+
+@lru_cache(maxsize=None)
+def _indice():
+    """
+    Monta (uma única vez por processo) o índice imutável de conversão:
+    - dicionário somente-leitura {cid10: cid11} para categorias/subcategorias;
+    - agrupamentos (blocos I10-I15 etc.) ordenados pelo código inicial, para busca binária.
+    A fonte é a tabela MapeamentoCid; se ela ainda não foi carregada, usa o arquivo empacotado.
+    """
+    from .models import MapeamentoCid
+
+    try:
+        linhas = list(MapeamentoCid.objects.values_list('cid10', 'cid11', 'classe'))
+    except DatabaseError:
+        linhas = []
+    if not linhas:
+        linhas = [(cid10, cid11, classe) for cid10, cid11, _, classe in ler_arquivo_mapeamento()]
+
+    categorias = {}
+    blocos = []
+    for cid10, cid11, classe in linhas:
+        if classe == 'block':
+            inicio, _, fim = cid10.partition('-')
+            blocos.append((inicio, fim or inicio, cid11))
+        else:
+            categorias[cid10] = cid11
+
+    blocos.sort()
+    return (
+        MappingProxyType(categorias),
+        tuple(b[0] for b in blocos),
+        tuple(blocos),
+    )
+
+
+def recarregar_indice():
+    """Descarta o índice em memória (usar após recarregar a tabela MapeamentoCid)."""
+    _indice.cache_clear()
+
+
+def _buscar_bloco(categoria, inicios, blocos):
+    pos = bisect.bisect_right(inicios, categoria) - 1
+    if pos >= 0:
+        inicio, fim, cid11 = blocos[pos]
+        if inicio <= categoria <= fim:
+            return cid11
+    return None
+
+
+def _converter(codigo, categorias, inicios, blocos, agrupamento=False):
+    if not codigo:
+        return NAO_MAPEADO
+
+    # 1. Subcategoria exata (I10.0) ou categoria (I10)
+    cid11 = categorias.get(codigo)
+    if cid11:
+        return cid11
+
+    # 2. Subcategoria sem mapeamento próprio -> categoria de 3 caracteres
+    categoria = codigo[:3]
+    cid11 = categorias.get(categoria)
+    if cid11:
+        return cid11
+
+    # 3. Categoria sem mapeamento -> agrupamento (bloco) que a contém. É uma faixa (5A10-5A14), não um
+    # código: só aparece marcada como aproximação, e o atendimento fica sem mapeamento (resolvido pela OMS)
+    if agrupamento:
+        bloco = _buscar_bloco(categoria, inicios, blocos)
+        if bloco:
+            return bloco + APROXIMADO
+    return NAO_MAPEADO
+
+
 def converter_cid10_para_cid11(cid10_codigo):
     """
-    Mapeia os principais CIDs-10 usados no AME para CID-11.
-    Nota: Em produção, isso pode ser substituído por uma chamada à API da WHO.
+    Converte um CID-10 para CID-11 usando a tabela de equivalência da OMS.
+    Busca em cascata: subcategoria (E11.9) -> categoria (E11). Código só coberto por um
+    agrupamento (E10-E14) -> NAO_MAPEADO: uma faixa não serve como CID-11 do atendimento.
     """
-    codigo = cid10_codigo.upper().strip()
+    return _converter(normalizar_cid10(cid10_codigo), *_indice())
 
-    mapeamento = {
-        # Hipertensão
-        'I10': 'BA00',  # Hipertensão essencial
-        'I11': 'BA01',  # Doença cardíaca hipertensiva
-        'I12': 'GB61',  # Doença renal hipertensiva
-        'I15': 'BA04',  # Hipertensão secundária
 
-        # Diabetes (Comorbidade comum)
-        'E11': '5A11',  # Diabetes Mellitus Tipo 2
-        'E10': '5A10',  # Diabetes Mellitus Tipo 1
+def converter_lote(codigos, agrupamento=False):
+    """
+    Conversão em lote para relatórios: recebe uma lista de CIDs-10 e devolve
+    {codigo_original: cid11}, consultando cada código distinto uma única vez.
+    `agrupamento`: sem categoria, devolve a faixa do agrupamento com o sufixo APROXIMADO
+    (autocomplete); não usar para valores gravados.
+    """
+    categorias, inicios, blocos = _indice()
+    resultado = {}
+    for codigo in codigos:
+        if codigo not in resultado:
+            resultado[codigo] = _converter(normalizar_cid10(codigo), categorias, inicios, blocos, agrupamento)
+    return resultado
+
+
+# --- Catálogo CID-10 (autocomplete da ficha médica) ---
+
+# O arquivo empacotado (CODIGO;DESCRICAO em UTF-8) é um recorte de 158 códigos da linha de cuidado
+# (hipertensão, diabetes, dislipidemia, doença cardiovascular e renal, tabagismo): outros códigos não
+# aparecem no autocomplete. Para a CID-10 completa, use os CSVs do DATASUS (CID-10-CATEGORIAS /
+# CID-10-SUBCATEGORIAS, colunas CAT/SUBCAT;...;DESCRICAO em latin-1) em settings.CID10_ARQUIVO /
+# CID10_ARQUIVO_ENCODING.
+ARQUIVO_CID10 = os.path.join(os.path.dirname(__file__), 'data', 'cid10.csv')
+
+
+def _termo_busca(texto):
+    """Minúsculas e sem acentos, para casar 'cefaleia' com 'Cefaléia'."""
+    sem_acento = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in sem_acento if not unicodedata.combining(c))
+
+
+def _palavras(texto):
+    return [p for p in re.split(r'[^0-9a-z]+', _termo_busca(texto)) if p]
+
+
+def _ler_catalogo_cid10():
+    from django.conf import settings
+
+    caminho = getattr(settings, 'CID10_ARQUIVO', ARQUIVO_CID10)
+    encoding = getattr(settings, 'CID10_ARQUIVO_ENCODING', 'utf-8-sig')
+    with open(caminho, encoding=encoding, newline='') as arquivo:
+        for linha in csv.DictReader(arquivo, delimiter=';'):
+            codigo = linha.get('CODIGO') or linha.get('SUBCAT') or linha.get('CAT')
+            descricao = (linha.get('DESCRICAO') or '').strip()
+            if codigo and descricao:
+                yield normalizar_cid10(codigo), descricao
+
+
+@lru_cache(maxsize=None)
+def _catalogo_cid10():
+    """
+    Índice em memória do catálogo CID-10, montado uma vez por processo:
+    - códigos ordenados (busca binária por prefixo);
+    - vocabulário ordenado + índice invertido palavra -> posições (busca por descrição).
+    """
+    itens = sorted(dict(_ler_catalogo_cid10()).items())
+    codigos = tuple(c for c, _ in itens)
+    descricoes = tuple(d for _, d in itens)
+
+    invertido = {}
+    for pos, descricao in enumerate(descricoes):
+        for palavra in set(_palavras(descricao)):
+            invertido.setdefault(palavra, []).append(pos)
+
+    vocabulario = tuple(sorted(invertido))
+    invertido = MappingProxyType({p: frozenset(pos) for p, pos in invertido.items()})
+    return codigos, descricoes, vocabulario, invertido
+
+
+def _posicoes_por_prefixo_codigo(codigos, prefixo):
+    inicio = bisect.bisect_left(codigos, prefixo)
+    fim = bisect.bisect_left(codigos, prefixo + '\uffff')
+    return range(inicio, fim)
+
+
+def _posicoes_por_palavra(vocabulario, invertido, palavra):
+    """Posições das descrições com alguma palavra iniciada por `palavra`."""
+    inicio = bisect.bisect_left(vocabulario, palavra)
+    fim = bisect.bisect_left(vocabulario, palavra + '\uffff')
+    if fim - inicio == 1:
+        return invertido[vocabulario[inicio]]
+    posicoes = set()
+    for termo in vocabulario[inicio:fim]:
+        posicoes |= invertido[termo]
+    return posicoes
+
+
+def buscar_cid10(termo, limite=15):
+    """
+    Autocomplete de CID-10: se o termo parece um código (I1, I10, E119) busca por prefixo
+    de código; caso contrário, busca as descrições que contêm todas as palavras digitadas
+    (cada palavra pode estar incompleta: 'insuf card'). Retorna [{'codigo': ..., 'descricao': ...}].
+    Só encontra o que está no catálogo (por padrão o recorte empacotado; ver ARQUIVO_CID10).
+    """
+    codigos, descricoes, vocabulario, invertido = _catalogo_cid10()
+    termo = (termo or '').strip()
+    if not termo:
+        return []
 
-        # Dislipidemias
-        'E78': '5C80',  # Distúrbios do metabolismo de lipoproteínas
+    if re.fullmatch(r'[A-Za-z]\d{0,2}(\.?\d{0,2})?', termo):
+        posicoes = _posicoes_por_prefixo_codigo(codigos, normalizar_cid10(termo))
+    else:
+        palavras = _palavras(termo)
+        if not palavras:
+            return []
+        conjuntos = [_posicoes_por_palavra(vocabulario, invertido, p) for p in palavras]
+        conjuntos.sort(key=len)
+        posicoes = set(conjuntos[0]).intersection(*conjuntos[1:])
+        posicoes = sorted(posicoes)
 
-        # Cardiopatias
-        'I50': 'BD10',  # Insuficiência cardíaca
-        'I20': 'BA40',  # Angina pectoris
-        'I21': 'BA41',  # Infarto agudo do miocárdio
-        'I25': 'BA42',  # Doença isquêmica crônica do coração
+    return [{'codigo': codigos[p], 'descricao': descricoes[p]} for p in posicoes[:limite]]
 
-        # Outros
-        'R07': 'MB23',  # Dor na garganta e no peito (Dor torácica)
-        'Z00': 'QA00',  # Exame geral
-    }
 
-    return mapeamento.get(codigo, "Não Mapeado Automaticamente")
\ No newline at end of file
+def descricao_cid10(cid10_codigo):
+    """Descrição do código no catálogo CID-10 ('' se não estiver no catálogo)."""
+    codigos, descricoes, _, _ = _catalogo_cid10()
+    codigo = normalizar_cid10(cid10_codigo)
+    posicao = bisect.bisect_left(codigos, codigo)
+    return descricoes[posicao] if posicao < len(codigos) and codigos[posicao] == codigo else ''
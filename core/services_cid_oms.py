@@ -0,0 +1,225 @@
+import requests
+import base64
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .disjuntor import OMS
+from .services_cid import normalizar_cid10
+
+logger = logging.getLogger(__name__)
+
+# Você deve colocar estas chaves no seu settings.py ou variáveis de ambiente
+# Cadastre-se em: https://icd.who.int/icdapi/
+# Demais opções (todas opcionais):
+#   WHO_API_HABILITADA            -> consulta a OMS quando a tabela local não mapeia o CID (padrão: False)
+#   WHO_API_TOKEN_URL / WHO_API_SEARCH_URL -> endpoints (permite apontar para um servidor de testes)
+#   WHO_API_CACHE_NEGATIVO_HORAS  -> validade do cache de "não encontrado" (padrão: 24h)
+
+
+def _config(nome, padrao):
+    return getattr(settings, nome, padrao)
+
+
+def oms_habilitada():
+    return _config('WHO_API_HABILITADA', False)
+
+
+class ErroOMS(Exception):
+    """Consulta à API da OMS sem resposta válida (pode ser repetida depois)."""
+
+
+class WHOConversionService:
+    _token = None
+    _token_expiry = 0
+    # Vários threads/requests podem pedir token ao mesmo tempo; só um renova
+    _token_lock = threading.Lock()
+
+    @classmethod
+    def _token_valido(cls):
+        return cls._token and time.time() < cls._token_expiry
+
+    @classmethod
+    def _get_token(cls):
+        """Obtém ou renova o token OAuth2 da OMS"""
+        if cls._token_valido():
+            return cls._token
+
+        with cls._token_lock:
+            # Outro thread pode ter renovado enquanto esperávamos o lock
+            if cls._token_valido():
+                return cls._token
+
+            token_url = _config('WHO_API_TOKEN_URL', 'https://icdaccessmanagement.who.int/connect/token')
+            payload = {'grant_type': 'client_credentials', 'scope': 'icdapi_access'}
+            client_id = _config('WHO_API_CLIENT_ID', 'SEU_CLIENT_ID_AQUI')
+            client_secret = _config('WHO_API_CLIENT_SECRET', 'SEU_CLIENT_SECRET_AQUI')
+            auth_str = f"{client_id}:{client_secret}"
+            b64_auth = base64.b64encode(auth_str.encode()).decode()
+
+            headers = {
+                'Authorization': f'Basic {b64_auth}',
+                'Content-Type': 'application/x-www-form-urlencoded'
+            }
+
+            try:
+                response = OMS.chamar(requests.post, token_url, data=payload, headers=headers, timeout=5)
+                response.raise_for_status()
+                data = response.json()
+                cls._token = data['access_token']
+                cls._token_expiry = time.time() + data['expires_in'] - 60  # Margem de segurança
+                return cls._token
+            except Exception as e:
+                logger.warning("Erro ao obter token OMS: %s", e)
+                return None
+
+    @classmethod
+    def _consultar_api(cls, cid10_codigo):
+        """
+        Busca o CID-10 na API da OMS.
+        Retorna (texto, encontrado, pode_cachear): texto é None quando a OMS não tem o código;
+        erros de rede/autenticação não entram no cache.
+        """
+        token = cls._get_token()
+        if not token:
+            return "Erro de Conexão API", False, False
+
+        # Endpoint de pesquisa da versão mais recente (2024-01)
+        # A estratégia é pesquisar o código CID-10 como termo
+        base_url = _config('WHO_API_SEARCH_URL', "https://id.who.int/icd/release/11/2024-01/mms/search")
+
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/json',
+            'Accept-Language': 'en'  # A API responde melhor em inglês para mapeamento técnico, mas pode usar 'pt'
+        }
+
+        params = {
+            'q': cid10_codigo,
+            'useFlexisearch': 'false',  # Busca exata
+            'flatResults': 'true'
+        }
+
+        try:
+            response = OMS.chamar(requests.get, base_url, headers=headers, params=params, timeout=5)
+            if response.status_code == 200:
+                data = response.json()
+                results = data.get('destinationEntities', [])
+
+                if results:
+                    # Pega o primeiro resultado (match mais provável)
+                    match = results[0]
+                    cid11_code = match.get('theCode', 'Sem Código')
+                    title = match.get('title', '')
+                    return f"{cid11_code} ({title})", True, True
+                else:
+                    return None, False, True
+            else:
+                return f"Erro API: {response.status_code}", False, False
+        except Exception as e:
+            return f"Falha na requisição: {str(e)}", False, False
+
+    @classmethod
+    def buscar_em_cache(cls, cid10_codigo):
+        """
+        Consulta o cache compartilhado (tabela ConversaoCidOMS) sem tocar na rede.
+        Resultados positivos valem para sempre; os "não encontrado" expiram após
+        WHO_API_CACHE_NEGATIVO_HORAS. Retorna (cid11, encontrado), com cid11 None se a
+        OMS não tem o código, ou None quando é preciso consultar a OMS.
+        """
+        from .models import ConversaoCidOMS
+
+        item = ConversaoCidOMS.objects.filter(cid10=normalizar_cid10(cid10_codigo)).first()
+        if item is None:
+            return None
+        if not item.encontrado:
+            validade = timedelta(hours=_config('WHO_API_CACHE_NEGATIVO_HORAS', 24))
+            if item.data_consulta < timezone.now() - validade:
+                return None
+            return None, False
+        return item.resultado, True
+
+    @classmethod
+    def converter_cid10_para_cid11(cls, cid10_codigo):
+        """
+        Retorna (cid11, encontrado), consultando primeiro o cache e só depois a API da OMS;
+        cid11 é None quando a OMS não tem o código (quem exibe escreve a mensagem). ErroOMS
+        se a consulta falhou (rede, token, status diferente de 200): a mensagem de erro não
+        é um código e não deve ser gravada.
+        """
+        from .models import ConversaoCidOMS
+
+        codigo = normalizar_cid10(cid10_codigo)
+        em_cache = cls.buscar_em_cache(codigo)
+        if em_cache is not None:
+            return em_cache
+
+        resultado, encontrado, pode_cachear = cls._consultar_api(codigo)
+        if not pode_cachear:
+            raise ErroOMS(resultado)
+        ConversaoCidOMS.objects.update_or_create(
+            cid10=codigo,
+            defaults={'resultado': (resultado or '')[:200], 'encontrado': encontrado, 'data_consulta': timezone.now()}
+        )
+        return resultado, encontrado
+
+
+# --- Resolução em segundo plano ---
+# A consulta à OMS nunca acontece dentro do save() do atendimento: o código é
+# enfileirado após o commit e o campo cid11_correspondente é preenchido depois.
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='oms-cid')
+_pendentes = set()
+_pendentes_lock = threading.Lock()
+
+
+def _resolver_atendimento(atendimento_id, cid10_codigo):
+    from .models import AtendimentoMedico
+
+    try:
+        resultado, encontrado = WHOConversionService.converter_cid10_para_cid11(cid10_codigo)
+        # Só atualiza se o CID não foi alterado nesse meio-tempo
+        AtendimentoMedico.objects.filter(id=atendimento_id, cid10_1=cid10_codigo).update(
+            cid11_correspondente=(resultado or '')[:200], cid11_nao_encontrado=not encontrado
+        )
+    except ErroOMS as e:
+        # O campo continua "Não Mapeado": a consulta é agendada de novo no próximo save do atendimento
+        logger.warning("CID-11 do atendimento %s não resolvido (%s): %s", atendimento_id, cid10_codigo, e)
+    except Exception:
+        logger.exception("Erro ao resolver CID-11 do atendimento %s", atendimento_id)
+    finally:
+        connection.close()
+
+
+def _enfileirar(atendimento_id, cid10_codigo):
+    futuro = _executor.submit(_resolver_atendimento, atendimento_id, cid10_codigo)
+    with _pendentes_lock:
+        _pendentes.add(futuro)
+    futuro.add_done_callback(_descartar_pendente)
+
+
+def _descartar_pendente(futuro):
+    with _pendentes_lock:
+        _pendentes.discard(futuro)
+
+
+def agendar_resolucao(atendimento_id, cid10_codigo):
+    """Agenda a consulta à OMS para depois do commit da transação atual."""
+    transaction.on_commit(lambda: _enfileirar(atendimento_id, cid10_codigo))
+
+
+def aguardar_pendentes(timeout=None):
+    """Espera as resoluções em andamento (útil em testes e no desligamento do servidor)."""
+    with _pendentes_lock:
+        futuros = list(_pendentes)
+    wait(futuros, timeout=timeout)
+
+
+# Wrapper para usar no models.py facilmente
+def converter_cid10_para_cid11(cid10):
+    return WHOConversionService.converter_cid10_para_cid11(cid10)
@@ -0,0 +1,158 @@
+import csv
+import json
+import os
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache
+from .models import Medicamento
+
+# Catálogo versionado: um arquivo por edição da diretriz/formulário (ex.: medicamentos_dbh2025.csv).
+# Para uma nova edição, adicionar o arquivo e apontar o comando `carregar_medicamentos` para ele.
+ARQUIVO_MEDICAMENTOS = os.path.join(os.path.dirname(__file__), 'data', 'medicamentos_dbh2025.csv')
+
+CAMPOS = ('classe', 'dose_padrao', 'nomes_comerciais', 'ativo')
+
+
+def _ativo(valor):
+    if isinstance(valor, bool):
+        return valor
+    return str(valor).strip().lower() not in ('0', 'false', 'nao', 'não', 'n', 'inativo')
+
+
+def _linhas_arquivo(caminho):
+    if caminho.lower().endswith('.json'):
+        with open(caminho, encoding='utf-8') as arquivo:
+            dados = json.load(arquivo)
+        yield from (dados['medicamentos'] if isinstance(dados, dict) else dados)
+    else:
+        with open(caminho, encoding='utf-8-sig', newline='') as arquivo:
+            yield from csv.DictReader(arquivo, delimiter=';')
+
+
+def ler_catalogo_medicamentos(caminho=ARQUIVO_MEDICAMENTOS):
+    """
+    Gera dicionários {principio_ativo, classe, dose_padrao, nomes_comerciais, ativo} a partir de
+    um CSV (';', UTF-8) ou JSON (lista de objetos ou {"versao": ..., "medicamentos": [...]}).
+    """
+    for linha in _linhas_arquivo(caminho):
+        principio = (linha.get('principio_ativo') or '').strip()
+        if not principio:
+            continue
+        yield {
+            'principio_ativo': principio,
+            'classe': (linha.get('classe') or '').strip(),
+            'dose_padrao': (linha.get('dose_padrao') or '').strip(),
+            'nomes_comerciais': (linha.get('nomes_comerciais') or '').strip(),
+            'ativo': _ativo(linha.get('ativo', True)),
+        }
+
+
+def _erros_tamanho(registro):
+    erros = []
+    for campo in ('principio_ativo', 'classe', 'dose_padrao', 'nomes_comerciais'):
+        limite = Medicamento._meta.get_field(campo).max_length
+        if len(registro[campo]) > limite:
+            erros.append(f'{campo} excede {limite} caracteres')
+    if not registro['classe'] or not registro['dose_padrao']:
+        erros.append('classe e dose_padrao são obrigatórios')
+    return erros
+
+
+def sincronizar_catalogo(registros, desativar_ausentes=False, simular=False):
+    """
+    Aplica o catálogo ao banco: lê os medicamentos existentes em uma única consulta, compara
+    campo a campo e grava só a diferença (bulk_create dos novos, bulk_update apenas dos campos
+    alterados) em uma transação. Com desativar_ausentes, o que não está no arquivo fica ativo=False
+    (nunca é apagado: prescrições antigas continuam referenciando o nome).
+    Retorna o resumo {'novos', 'atualizados', 'inalterados', 'desativados', 'campos', 'erros'}.
+    """
+    existentes = Medicamento.objects.in_bulk(field_name='principio_ativo')
+
+    catalogo = {}
+    erros = []
+    for registro in registros:
+        problemas = _erros_tamanho(registro)
+        if problemas:
+            erros.append(f"{registro['principio_ativo'][:60]}: {'; '.join(problemas)}")
+            continue
+        catalogo[registro['principio_ativo']] = registro  # repetido no arquivo: vale a última linha
+
+    novos = []
+    alterados = []
+    campos_alterados = {}
+    for principio, registro in catalogo.items():
+        medicamento = existentes.get(principio)
+        if medicamento is None:
+            novos.append(Medicamento(**registro))
+            continue
+        mudou = False
+        for campo in CAMPOS:
+            if getattr(medicamento, campo) != registro[campo]:
+                setattr(medicamento, campo, registro[campo])
+                campos_alterados[campo] = campos_alterados.get(campo, 0) + 1
+                mudou = True
+        if mudou:
+            alterados.append(medicamento)
+
+    desativados = []
+    if desativar_ausentes:
+        for principio, medicamento in existentes.items():
+            if principio not in catalogo and medicamento.ativo:
+                medicamento.ativo = False
+                desativados.append(medicamento)
+        if desativados:
+            campos_alterados['ativo'] = campos_alterados.get('ativo', 0) + len(desativados)
+
+    if not simular:
+        with transaction.atomic():
+            Medicamento.objects.bulk_create(novos, batch_size=1000)
+            if alterados or desativados:
+                Medicamento.objects.bulk_update(alterados + desativados, sorted(campos_alterados), batch_size=1000)
+            if novos or alterados or desativados:
+                _invalidar_catalogo(Medicamento)  # bulk_create/bulk_update não disparam os sinais
+
+    return {
+        'novos': len(novos),
+        'atualizados': len(alterados),
+        'inalterados': len(catalogo) - len(novos) - len(alterados),
+        'desativados': len(desativados),
+        'campos': campos_alterados,
+        'erros': erros,
+    }
+
+
+def _montar_autocomplete():
+    lista = []
+    for med in Medicamento.objects.filter(ativo=True):
+        lista.append({
+            'id': med.id,
+            'label': f"{med.principio_ativo} {med.dose_padrao} (Genérico)",
+            'dose': med.dose_padrao,
+            'tipo': 'DCB'
+        })
+        for nome in (med.nomes_comerciais or '').split(','):
+            nome = nome.strip()
+            if nome:
+                lista.append({
+                    'id': med.id,
+                    'label': f"{nome} -> {med.principio_ativo}",
+                    'dose': med.dose_padrao,
+                    'tipo': 'COMERCIAL'
+                })
+    lista.sort(key=lambda x: x['label'])
+    return json.dumps(lista)
+
+
+def autocomplete_medicamentos():
+    """JSON do autocomplete da prescrição (DCB + nomes comerciais), em cache até o catálogo mudar."""
+    return cache.obter('medicamentos', 'autocomplete', _montar_autocomplete, 24 * 60 * 60)
+
+
+@receiver(post_save, sender=Medicamento)
+@receiver(post_delete, sender=Medicamento)
+def _invalidar_catalogo(sender, **kwargs):
+    # Depois do commit: antes dele, outra requisição recalcularia com o catálogo antigo
+    transaction.on_commit(lambda: cache.invalidar('medicamentos'))
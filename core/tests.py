@@ -1,3 +1,1192 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from unittest import mock
+
+import openpyxl
+import requests
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from . import cache, estatisticas_pa, exportacao, fhir, metricas, replica, services_cid, services_cid_oms, urls
+from .decorators import usa_replica
+from .disjuntor import ABERTO, FECHADO, CircuitoAberto, Disjuntor
+from .importacao import importar_afericoes, importar_pacientes
+from .middleware import ReplicaMiddleware
+from .perfilamento import listar_perfis
+from .models import (
+    Afericao, ArquivoPaciente, AtendimentoMedico, AtendimentoMultidisciplinar, AvaliacaoPrevent, ConversaoCidOMS, EstatisticaPressao,
+    ExportacaoFHIR, ItemPrescricao, MapeamentoCid, Medicamento, Paciente, PrescricaoMedica, ResumoPressaoDiario, Usuario,
+)
+from .coorte import idades_em
+from .prevent import ErroPrevent, calcular_risco_prevent, calcular_risco_prevent_lote, classificar_risco
+from .triagem import avaliar_elegibilidade, avaliar_elegibilidade_lote, contar_elegibilidade
+from .services_cid_oms import WHOConversionService
+from .services_medicamentos import ler_catalogo_medicamentos, sincronizar_catalogo
+
+
+# --- Servidor falso da API CID-11 da OMS ---
+
+class _FakeOMSHandler(BaseHTTPRequestHandler):
+    # Respostas da busca por código CID-10; códigos ausentes retornam lista vazia
+    respostas = {
+        'I27.0': [{'theCode': 'BB01.0', 'title': 'Primary pulmonary hypertension'}],
+        'I26.9': [{'theCode': 'BB00.Z', 'title': 'Pulmonary thromboembolism, unspecified'}],
+    }
+    falhas = {'Q21.1'}  # respondem 500
+
+    def do_POST(self):
+        self.server.chamadas_token += 1
+        self._responder({'access_token': 'token-falso', 'expires_in': 3600})
+
+    def do_GET(self):
+        self.server.chamadas_busca += 1
+        codigo = parse_qs(urlparse(self.path).query)['q'][0]
+        if codigo in self.falhas:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._responder({'destinationEntities': self.respostas.get(codigo, [])})
+
+    def _responder(self, dados):
+        corpo = json.dumps(dados).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeOMSMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.servidor = ThreadingHTTPServer(('127.0.0.1', 0), _FakeOMSHandler)
+        cls.servidor.chamadas_token = 0
+        cls.servidor.chamadas_busca = 0
+        threading.Thread(target=cls.servidor.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{cls.servidor.server_port}"
+        cls.configuracao = override_settings(
+            WHO_API_HABILITADA=True,
+            WHO_API_TOKEN_URL=f"{base}/connect/token",
+            WHO_API_SEARCH_URL=f"{base}/search",
+        )
+        cls.configuracao.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.configuracao.disable()
+        cls.servidor.shutdown()
+        cls.servidor.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        WHOConversionService._token = None
+        WHOConversionService._token_expiry = 0
+        self.servidor.chamadas_token = 0
+        self.servidor.chamadas_busca = 0
+
+
+class WHOConversionServiceTests(FakeOMSMixin, TestCase):
+
+    def test_resultado_fica_em_cache(self):
+        primeiro = WHOConversionService.converter_cid10_para_cid11('i27.0')
+        segundo = WHOConversionService.converter_cid10_para_cid11('I27.0')
+
+        self.assertEqual(primeiro, ('BB01.0 (Primary pulmonary hypertension)', True))
+        self.assertEqual(segundo, primeiro)
+        self.assertEqual(self.servidor.chamadas_busca, 1)
+        self.assertTrue(ConversaoCidOMS.objects.get(cid10='I27.0').encontrado)
+
+    def test_cache_negativo_expira(self):
+        self.assertEqual(WHOConversionService.converter_cid10_para_cid11('Q99.9'), (None, False))
+        self.assertEqual(WHOConversionService.converter_cid10_para_cid11('Q99.9'), (None, False))
+        self.assertEqual(self.servidor.chamadas_busca, 1)
+        self.assertFalse(ConversaoCidOMS.objects.get(cid10='Q99.9').encontrado)
+
+        ConversaoCidOMS.objects.filter(cid10='Q99.9').update(data_consulta=timezone.now() - timedelta(days=2))
+        WHOConversionService.converter_cid10_para_cid11('Q99.9')
+        self.assertEqual(self.servidor.chamadas_busca, 2)
+
+    def test_token_renovado_uma_vez_com_concorrencia(self):
+        threads = [threading.Thread(target=WHOConversionService._get_token) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.servidor.chamadas_token, 1)
+
+
+class ResolucaoSegundoPlanoTests(FakeOMSMixin, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.medico = Usuario.objects.create_user(username='medico', password='x', tipo_profissional='MED')
+        self.paciente = Paciente.objects.create(
+            nome='Paciente Teste', cpf='00000000000', sexo='F', etnia='Parda',
+            data_nascimento=date(1960, 1, 1)
+        )
+
+    def _criar_atendimento(self, cid10):
+        return AtendimentoMedico.objects.create(
+            paciente=self.paciente, medico=self.medico, score_prevent_valor=0,
+            subjetivo='-', objetivo='-', avaliacao='-', plano='-', cid10_1=cid10
+        )
+
+    def test_save_nao_consulta_oms_e_preenche_depois(self):
+        atendimento = self._criar_atendimento('I26.9')
+        self.assertEqual(atendimento.cid11_correspondente, 'Não Mapeado Automaticamente')
+
+        services_cid_oms.aguardar_pendentes(timeout=5)
+        atendimento.refresh_from_db()
+        self.assertEqual(atendimento.cid11_correspondente, 'BB00.Z (Pulmonary thromboembolism, unspecified)')
+
+        # Segundo atendimento com o mesmo CID sai direto do cache, sem nova chamada
+        outro = self._criar_atendimento('I26.9')
+        self.assertEqual(outro.cid11_correspondente, atendimento.cid11_correspondente)
+        self.assertEqual(self.servidor.chamadas_busca, 1)
+
+    def test_falha_da_api_nao_grava_mensagem_de_erro(self):
+        atendimento = self._criar_atendimento('Q21.1')
+        with self.assertLogs('core.services_cid_oms', 'WARNING'):
+            services_cid_oms.aguardar_pendentes(timeout=5)
+        atendimento.refresh_from_db()
+        self.assertEqual(atendimento.cid11_correspondente, 'Não Mapeado Automaticamente')
+        self.assertFalse(ConversaoCidOMS.objects.filter(cid10='Q21.1').exists())
+
+    def test_nao_encontrado_nao_vira_codigo(self):
+        # O aviso é da tela: nada de texto no lugar do código (exportações, FHIR)
+        admin = Usuario.objects.create_superuser(username='admin', password='x')
+        atendimento = self._criar_atendimento('Q99.9')
+        services_cid_oms.aguardar_pendentes(timeout=5)
+        atendimento.refresh_from_db()
+        self.assertEqual((atendimento.cid11_correspondente, atendimento.cid11_nao_encontrado), ('', True))
+        outro = self._criar_atendimento('Q99.9')  # do cache negativo
+        self.assertEqual((outro.cid11_correspondente, outro.cid11_nao_encontrado), ('', True))
+        self.client.force_login(admin)
+        resposta = self.client.get(reverse('detalhe_paciente', args=[self.paciente.id]))
+        self.assertContains(resposta, 'CID-11: não encontrado na base da OMS')
+
+    def test_cid_mapeado_localmente_nao_usa_oms(self):
+        atendimento = self._criar_atendimento('I10')
+        services_cid_oms.aguardar_pendentes(timeout=5)
+        self.assertEqual(atendimento.cid11_correspondente, 'BA00')
+        self.assertEqual(self.servidor.chamadas_busca, 0)
+
+
+class ConversaoCidTests(TestCase):
+    def setUp(self):
+        services_cid.recarregar_indice()
+        self.addCleanup(services_cid.recarregar_indice)
+
+    def test_cascata_subcategoria_categoria_agrupamento(self):
+        converter = services_cid.converter_cid10_para_cid11
+        self.assertEqual(converter('I50.1'), 'BD11')  # subcategoria
+        self.assertEqual(converter('i500'), 'BD10')  # sem ponto
+        self.assertEqual(converter('I50.3'), 'BD1Z')  # subcategoria sem linha própria -> categoria
+        # Só o agrupamento E10-E14: a faixa 5A10-5A14 não é gravada como CID-11
+        self.assertEqual(converter('E12'), services_cid.NAO_MAPEADO)
+        self.assertEqual(converter('Q99'), services_cid.NAO_MAPEADO)
+        self.assertEqual(converter(''), services_cid.NAO_MAPEADO)
+
+    def test_lote(self):
+        self.assertEqual(services_cid.converter_lote(['I10', 'i10', 'E12', 'I10']),
+                         {'I10': 'BA00', 'i10': 'BA00', 'E12': services_cid.NAO_MAPEADO})
+        self.assertEqual(services_cid.converter_lote(['E12', 'E11'], agrupamento=True),
+                         {'E12': '5A10-5A14' + services_cid.APROXIMADO, 'E11': '5A11'})
+
+    def test_tabela_vazia_usa_arquivo_e_carregada_usa_o_banco(self):
+        self.assertFalse(MapeamentoCid.objects.exists())
+        self.assertEqual(services_cid.converter_cid10_para_cid11('I10'), 'BA00')
+
+        MapeamentoCid.objects.create(cid10='I10', cid11='BA00.Z')
+        self.assertEqual(services_cid.converter_cid10_para_cid11('I10'), 'BA00')  # índice do processo
+        services_cid.recarregar_indice()
+        self.assertEqual(services_cid.converter_cid10_para_cid11('I10'), 'BA00.Z')
+        self.assertEqual(services_cid.converter_cid10_para_cid11('I11'), services_cid.NAO_MAPEADO)
+
+
+class BuscaCid10Tests(TestCase):
+    def test_prefixo_de_codigo(self):
+        codigos = [r['codigo'] for r in services_cid.buscar_cid10('i1', limite=100)]
+        self.assertIn('I10', codigos)
+        self.assertTrue(all(c.startswith('I1') for c in codigos))
+        self.assertEqual(codigos, sorted(codigos))
+        self.assertEqual(len(services_cid.buscar_cid10('i1', limite=3)), 3)
+
+    def test_codigo_sem_ponto(self):
+        self.assertEqual([r['codigo'] for r in services_cid.buscar_cid10('E119')], ['E11.9'])
+        self.assertEqual(services_cid.descricao_cid10('e119'), 'Diabetes mellitus não-insulino-dependente - sem complicações')
+
+    def test_descricao_sem_acento_e_palavras_incompletas(self):
+        resultados = services_cid.buscar_cid10('insuf card', limite=100)
+        self.assertIn('I50', [r['codigo'] for r in resultados])
+        self.assertTrue(all('insuficiência' in r['descricao'].lower() and 'card' in r['descricao'].lower()
+                            for r in resultados))
+        self.assertEqual(services_cid.buscar_cid10('INSUFICIENCIA CARDIACA'), services_cid.buscar_cid10('insuficiência cardíaca'))
+        self.assertEqual(services_cid.buscar_cid10('xyzabc'), [])
+        self.assertEqual(services_cid.buscar_cid10('  '), [])
+
+    def test_api_cid10(self):
+        self.client.force_login(Usuario.objects.create_user(username='medico', password='x', tipo_profissional='MED'))
+        resultados = self.client.get(reverse('api_cid10'), {'q': 'I10'}).json()['resultados']
+        self.assertEqual(resultados[0], {'codigo': 'I10', 'descricao': resultados[0]['descricao'], 'cid11': 'BA00'})
+        # Sem categoria no mapeamento: a faixa do agrupamento aparece marcada como aproximada
+        resultados = self.client.get(reverse('api_cid10'), {'q': 'E04'}).json()['resultados']
+        self.assertEqual(resultados[0]['cid11'], '5A00-5A0Z' + services_cid.APROXIMADO)
+        self.assertEqual(self.client.get(reverse('api_cid10')).json(), {'resultados': []})
+
+
+class PreventTests(TestCase):
+
+    def test_lote_igual_ao_individual(self):
+        individual = [
+            calcular_risco_prevent(50, 'M', 200, 50, 140, 90, True, False, False),
+            calcular_risco_prevent(65, 'F', 240, 40, 160, 50, True, True, True),
+        ]
+        risco_10, risco_30 = calcular_risco_prevent_lote(
+            [50, 65], ['M', 'F'], [200, 240], [50, 40], [140, 160], [90, 50],
+            [True, True], [False, True], [False, True]
+        )
+        self.assertEqual([round(r, 1) for r in risco_10], [i['risco_10_anos'] for i in individual])
+        self.assertEqual(round(risco_30[0], 1), individual[0]['risco_30_anos'])
+        self.assertIsNone(individual[1]['risco_30_anos'])
+
+    def test_entrada_fora_da_faixa(self):
+        with self.assertRaises(ErroPrevent):
+            calcular_risco_prevent(25, 'M', 200, 50, 140, 90, True, False, False)
+        with self.assertRaises(ErroPrevent):
+            calcular_risco_prevent(50, 'M', 200, 50, 181, 90, True, False, False)
+
+    def test_caso_de_referencia_publicado(self):
+        # Exemplo do pacote preventr (AHA PREVENT, modelo base, DCV total)
+        risco = calcular_risco_prevent(50, 'F', 200, 45, 160, 90, True, True, False, False)
+        self.assertEqual(risco, {'risco_10_anos': 14.7, 'risco_30_anos': 53.0})
+
+    def test_benchmark_prevent(self):
+        # As entradas sorteadas precisam continuar dentro de FAIXAS quando elas mudarem
+        saida = io.StringIO()
+        call_command('benchmark_prevent', pacientes=2000, repeticoes=1, stdout=saida)
+        self.assertIn('Individual: 2000 pacientes', saida.getvalue())
+
+    def test_view_ignora_risco_enviado_pelo_navegador(self):
+        usuario = Usuario.objects.create_user(username='enf', password='x', tipo_profissional='ENF')
+        paciente = Paciente.objects.create(
+            nome='Paciente Prevent', cpf='11111111111', sexo='M', etnia='Branca',
+            data_nascimento=date.today().replace(year=date.today().year - 50) - timedelta(days=1)
+        )
+        self.client.force_login(usuario)
+        self.client.post(f'/atendimento/prevent/{paciente.id}/', {
+            'col_total': '200', 'hdl': '50', 'pas': '140', 'tfg': '90', 'em_tto': 'on',
+            'risco_10': '99', 'risco_30': '99',
+        })
+        avaliacao = AvaliacaoPrevent.objects.get(paciente=paciente)
+        esperado = calcular_risco_prevent(50, 'M', 200, 50, 140, 90, True, False, False)
+        self.assertEqual(float(avaliacao.risco_10_anos), esperado['risco_10_anos'])
+
+
+class ListaRiscoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_superuser(username='admin', password='x')
+        # Empates de propósito: vários pacientes com o mesmo nível e a mesma última PAS
+        for i, (nivel, pas, municipio) in enumerate([
+            (3, 180, 'Ubatuba'), (3, 180, 'Ilhabela'), (3, 180, 'Ubatuba'), (3, 150, 'Ubatuba'),
+            (2, 160, 'Ilhabela'), (2, 160, 'Ubatuba'), (1, 0, 'Ubatuba'), (0, 0, 'Ilhabela'),
+        ]):
+            Paciente.objects.create(nome=f'P{i}', cpf=f'{i:011d}', sexo='F', etnia='Parda',
+                                    data_nascimento=date(1960, 1, 1), municipio=municipio,
+                                    nivel_risco=nivel, ultima_pas=pas)
+        Paciente.objects.create(nome='Alta', cpf='99999999999', sexo='F', etnia='Parda',
+                                data_nascimento=date(1960, 1, 1), nivel_risco=3, ultima_pas=200, ativo=False)
+
+    def _percorrer(self, **filtros):
+        self.client.force_login(self.admin)
+        ids, cursores, cursor = [], [], None
+        with mock.patch('core.views.LISTA_RISCO_POR_PAGINA', 2):
+            while True:
+                dados = self.client.get(reverse('api_lista_risco'), {**filtros, **({'cursor': cursor} if cursor else {})}).json()
+                self.assertLessEqual(len(dados['pacientes']), 2)
+                ids += [p['id'] for p in dados['pacientes']]
+                cursor = dados['proximo_cursor']
+                if cursor is None:
+                    return ids, cursores
+                cursores.append(cursor)
+
+    def test_paginas_seguem_a_ordem_sem_repetir_nos_empates(self):
+        ids, cursores = self._percorrer()
+        esperado = list(Paciente.objects.filter(ativo=True).order_by('-nivel_risco', '-ultima_pas', '-id')
+                        .values_list('id', flat=True))
+        self.assertEqual(ids, esperado)
+        # Cursor da 1ª página: nível.pas.id do 2º paciente (empate em nível e PAS com o seguinte)
+        self.assertEqual(cursores[0], f'3.180.{esperado[1]}')
+        self.assertEqual(len(cursores), 3)
+
+    def test_paginas_com_filtros(self):
+        ids, _ = self._percorrer(municipio='Ubatuba', nivel=['2', '3'])
+        esperado = list(Paciente.objects.filter(ativo=True, municipio='Ubatuba', nivel_risco__gte=2)
+                        .order_by('-nivel_risco', '-ultima_pas', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, esperado)
+        self.assertEqual(len(ids), 4)
+
+    def test_cursor_invalido_volta_para_a_primeira_pagina(self):
+        self.client.force_login(self.admin)
+        dados = self.client.get(reverse('api_lista_risco'), {'cursor': 'x.y'}).json()
+        self.assertEqual(dados['pacientes'][0]['nome'], 'P2')
+
+    def test_avaliacao_antiga_editada_nao_sobrescreve_o_risco_atual(self):
+        paciente = Paciente.objects.get(nome='P7')
+        dados = dict(idade=60, sexo='F', colesterol_total=200, hdl=50, pressao_sistolica=140, tfg=90)
+        antiga = AvaliacaoPrevent.objects.create(paciente=paciente, risco_10_anos=Decimal('25'), **dados)
+        AvaliacaoPrevent.objects.create(paciente=paciente, risco_10_anos=Decimal('3'), **dados)
+        antiga.risco_10_anos = Decimal('26')
+        antiga.save()
+        paciente.refresh_from_db()
+        self.assertEqual(paciente.risco_prevent_atual, Decimal('3'))
+        self.assertEqual(paciente.nivel_risco, 1)
+
+    def test_exclusao_volta_para_a_avaliacao_anterior(self):
+        paciente = Paciente.objects.get(nome='P7')
+        dados = dict(idade=60, sexo='F', colesterol_total=200, hdl=50, pressao_sistolica=140, tfg=90)
+        anterior = AvaliacaoPrevent.objects.create(paciente=paciente, risco_10_anos=Decimal('25'), **dados)
+        AvaliacaoPrevent.objects.create(paciente=paciente, risco_10_anos=Decimal('3'), **dados).delete()
+        paciente.refresh_from_db()
+        self.assertEqual((paciente.nivel_risco, paciente.risco_prevent_atual), (4, Decimal('25')))
+        anterior.delete()
+        paciente.refresh_from_db()
+        self.assertEqual((paciente.nivel_risco, paciente.risco_prevent_atual), (0, None))
+
+
+class RecalcularPreventTests(TestCase):
+    def setUp(self):
+        self.admin = Usuario.objects.create_superuser(username='admin', password='x')
+        hoje = date.today()
+
+        def paciente(nome, anos):
+            return Paciente.objects.create(nome=nome, cpf=f'{Paciente.objects.count():011d}', sexo='F',
+                                           etnia='Parda', data_nascimento=date(hoje.year - anos, 1, 1))
+
+        self.atualizar = paciente('Com dados novos', 61)
+        self.sem_prevent = paciente('Nunca avaliado', 61)  # sem lipídios/eGFR: não há o que recalcular
+        self.fora_faixa = paciente('Fora da faixa', 85)  # idade acima da validada pelas equações
+        for p in (self.atualizar, self.fora_faixa):
+            AvaliacaoPrevent.objects.create(paciente=p, idade=60, sexo='F', colesterol_total=210, hdl=45,
+                                            pressao_sistolica=130, tfg=80, risco_10_anos=Decimal('4.0'))
+        # Dados mais recentes que a avaliação: PAS da aferição, tabagismo/diabetes da avaliação multi
+        Afericao.objects.create(paciente=self.atualizar, usuario=self.admin, pressao_sistolica=168,
+                                pressao_diastolica=95)
+        AtendimentoMultidisciplinar.objects.create(paciente=self.atualizar, profissional=self.admin, peso=70,
+                                                   altura=Decimal('1.60'), circunferencia_abdominal=90,
+                                                   fumante=True, tem_diabetes=True)
+        Afericao.objects.create(paciente=self.sem_prevent, usuario=self.admin, pressao_sistolica=170,
+                                pressao_diastolica=100)
+
+    def test_grava_nova_avaliacao_e_faixa_do_paciente(self):
+        call_command('recalcular_prevent', stdout=open(os.devnull, 'w'))
+
+        nova = AvaliacaoPrevent.objects.filter(paciente=self.atualizar).latest('id')
+        idade = idades_em([self.atualizar.data_nascimento], date.today())[0]
+        esperado = calcular_risco_prevent(idade, 'F', 210, 45, 168, 80, True, True, True)
+        self.assertEqual((nova.idade, nova.pressao_sistolica, nova.fumante, nova.tem_diabetes), (idade, 168, True, True))
+        self.assertEqual(float(nova.risco_10_anos), esperado['risco_10_anos'])
+        self.assertEqual(AvaliacaoPrevent.objects.filter(paciente=self.atualizar).count(), 2)
+        self.atualizar.refresh_from_db()
+        self.assertEqual(float(self.atualizar.risco_prevent_atual), esperado['risco_10_anos'])
+        self.assertEqual(self.atualizar.nivel_risco, classificar_risco(esperado['risco_10_anos'])[0])
+
+        # Sem avaliação PREVENT ou fora das faixas: nada gravado, faixa do paciente intacta
+        self.assertFalse(AvaliacaoPrevent.objects.filter(paciente=self.sem_prevent).exists())
+        self.assertEqual(AvaliacaoPrevent.objects.filter(paciente=self.fora_faixa).count(), 1)
+        self.sem_prevent.refresh_from_db()
+        self.fora_faixa.refresh_from_db()
+        self.assertEqual((self.sem_prevent.nivel_risco, self.sem_prevent.risco_prevent_atual), (0, None))
+        self.assertEqual(self.fora_faixa.risco_prevent_atual, Decimal('4.0'))
+
+        # Segunda execução sem dados novos: nenhuma avaliação a mais
+        call_command('recalcular_prevent', stdout=open(os.devnull, 'w'))
+        self.assertEqual(AvaliacaoPrevent.objects.count(), 3)
+
+    def test_no_lugar_e_simular(self):
+        call_command('recalcular_prevent', simular=True, stdout=open(os.devnull, 'w'))
+        self.assertEqual(AvaliacaoPrevent.objects.count(), 2)
+        self.atualizar.refresh_from_db()
+        self.assertEqual(self.atualizar.risco_prevent_atual, Decimal('4.0'))
+
+        call_command('recalcular_prevent', no_lugar=True, stdout=open(os.devnull, 'w'))
+        avaliacao = AvaliacaoPrevent.objects.get(paciente=self.atualizar)
+        self.assertEqual(avaliacao.pressao_sistolica, 168)
+        self.atualizar.refresh_from_db()
+        self.assertEqual(self.atualizar.risco_prevent_atual, avaliacao.risco_10_anos)
+
+
+class TriagemTests(TestCase):
+    # (PAS, PAD, diabetes, LOA) -> elegível
+    CASOS = [
+        ((None, None, False, False), True),
+        ((150, 80, False, False), True),
+        ((125, 92, False, False), True),
+        ((135, 75, False, False), False),
+        ((135, 75, True, False), True),
+        ((120, 85, False, True), True),
+        ((120, 70, True, True), False),
+    ]
+
+    def test_regra_individual_vetorizada_e_sql_concordam(self):
+        esperado = [e for _, e in self.CASOS]
+        self.assertEqual([avaliar_elegibilidade(*c) for c, _ in self.CASOS], esperado)
+
+        pas = [c[0] if c[0] is not None else float('nan') for c, _ in self.CASOS]
+        pad = [c[1] if c[1] is not None else float('nan') for c, _ in self.CASOS]
+        lote = avaliar_elegibilidade_lote(pas, pad, [c[2] for c, _ in self.CASOS], [c[3] for c, _ in self.CASOS])
+        self.assertEqual(lote.tolist(), esperado)
+
+        usuario = Usuario.objects.create_user(username='enf', password='x', tipo_profissional='ENF')
+        for i, (caso, _) in enumerate(self.CASOS):
+            paciente = Paciente.objects.create(
+                nome=f'P{i}', cpf=f'{i:011d}', sexo='F', etnia='Parda', data_nascimento=date(1960, 1, 1),
+                ultima_pas=caso[0] or 0, ultima_pad=caso[1] or 0,
+            )
+            paciente.atendimentos_multi.create(
+                profissional=usuario, peso=70, altura=1.6, circunferencia_abdominal=90,
+                tem_diabetes=caso[2], tem_lesao_orgao=caso[3],
+            )
+        self.assertEqual(contar_elegibilidade(Paciente.objects.all()), {
+            'total': len(esperado), 'elegiveis': sum(esperado), 'contrarreferencia': esperado.count(False),
+        })
+
+
+class ImportacaoTests(TestCase):
+    def _planilha(self, linhas):
+        arquivo = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8', newline='')
+        with arquivo:
+            csv.writer(arquivo, delimiter=';').writerows(linhas)
+        self.addCleanup(os.remove, arquivo.name)
+        return arquivo.name
+
+    def test_upsert_por_cpf_e_rejeitados(self):
+        Paciente.objects.create(nome='Antigo', cpf='52998224725', sexo='F', etnia='Parda',
+                                data_nascimento=date(1960, 1, 1), telefone='1234')
+        caminho = self._planilha([
+            ['Nome', 'CPF', 'Sexo', 'Raça/Cor', 'Data de Nascimento', 'Nº CROSS'],
+            ['Atualizado', '529.982.247-25', 'f', 'parda', '01/01/1960', '12.345-6'],
+            ['Novo', '111.444.777-35', 'M', 'Preta', '1955-03-02', ''],
+            ['CPF errado', '111.444.777-36', 'M', 'Branca', '1955-03-02', ''],
+            ['Sem data', '', 'M', 'Branca', '', ''],
+        ])
+        rejeitados = caminho + '.rej'
+        self.addCleanup(os.remove, rejeitados)
+
+        resultado = importar_pacientes(caminho, rejeitados, lote=2)
+
+        self.assertEqual((resultado['lidos'], resultado['inseridos'], resultado['atualizados'],
+                          resultado['rejeitados']), (4, 1, 1, 2))
+        atualizado = Paciente.objects.get(cpf='52998224725')
+        self.assertEqual((atualizado.nome, atualizado.siresp, atualizado.telefone), ('Atualizado', '123456', '1234'))
+        self.assertEqual(Paciente.objects.get(cpf='11144477735').etnia, 'Negra')
+        with open(rejeitados, encoding='utf-8-sig') as f:
+            self.assertEqual([l['Nome'] for l in csv.DictReader(f, delimiter=';')], ['CPF errado', 'Sem data'])
+
+    def test_afericoes_do_aparelho(self):
+        usuario = Usuario.objects.create_user(username='enf', password='x', tipo_profissional='ENF')
+        paciente = Paciente.objects.create(nome='MRPA', cpf='52998224725', sexo='F', etnia='Parda',
+                                           data_nascimento=date(1960, 1, 1), altura_ultima=Decimal('1.60'))
+        losartana = Medicamento.objects.create(classe='BRA', principio_ativo='Losartana', dose_padrao='50mg')
+        caminho = self._planilha([
+            ['Data', 'Hora', 'SYS (mmHg)', 'DIA (mmHg)', 'Pulso', 'Peso', 'Medicamentos'],
+            ['01/09/2026', '07:30', '150', '95', '70', '64', 'losartana'],
+            ['02/09/2026', '07:30', '142', '91', '', '', ''],
+            ['02/09/2026', '07:30', '142', '91', '', '', ''],
+            ['03/09/2026', '07:30', '90', '95', '', '', ''],
+        ])
+
+        resultado = importar_afericoes(caminho, usuario, cpf='529.982.247-25')
+        self.assertEqual((resultado['inseridos'], resultado['duplicados'], resultado['rejeitados']), (2, 1, 1))
+        self.assertEqual(importar_afericoes(caminho, usuario, cpf='52998224725')['duplicados'], 3)
+
+        primeira, segunda = Afericao.objects.filter(paciente=paciente).order_by('data_afericao')
+        self.assertEqual(timezone.localtime(primeira.data_afericao).strftime('%d/%m/%Y %H:%M'), '01/09/2026 07:30')
+        self.assertEqual(primeira.imc, Decimal('25.00'))
+        self.assertEqual(list(primeira.medicamentos.all()), [losartana])
+        paciente.refresh_from_db()
+        self.assertEqual((paciente.ultima_pas, paciente.data_ultima_afericao), (142, segunda.data_afericao))
+
+
+class ExportacaoTests(TestCase):
+    def test_csv_e_xlsx_com_filtros(self):
+        admin = Usuario.objects.create_superuser(username='admin', password='x')
+        for i, (municipio, ativo) in enumerate([('Ubatuba', True), ('Ubatuba', False), ('Ilhabela', True)]):
+            paciente = Paciente.objects.create(nome=f'P{i}', cpf=f'{i:011d}', sexo='F', etnia='Parda',
+                                               data_nascimento=date(1960, 1, 1), municipio=municipio, ativo=ativo)
+            for dia in (1, 15):
+                Afericao.objects.create(paciente=paciente, usuario=admin, pressao_sistolica=150, pressao_diastolica=90,
+                                        data_afericao=timezone.make_aware(datetime(2026, 3, dia, 23, 30)))
+        self.client.force_login(admin)
+        filtros = {'municipios[]': ['Ubatuba'], 'inicio': '2026-03-01', 'fim': '2026-03-01', 'ativo': '1'}
+
+        resposta = self.client.get(reverse('exportar', args=['afericoes']), filtros)
+        linhas = list(csv.reader(b''.join(resposta.streaming_content).decode('utf-8-sig').splitlines(), delimiter=';'))
+        self.assertEqual(linhas[0][:4], ['ID', 'CPF', 'Paciente', 'Município'])
+        self.assertEqual([(l[2], l[4]) for l in linhas[1:]], [('P0', '01/03/2026 23:30')])
+
+        resposta = self.client.get(reverse('exportar', args=['pacientes']), {**filtros, 'formato': 'xlsx', 'inicio': '', 'fim': ''})
+        planilha = openpyxl.load_workbook(io.BytesIO(b''.join(resposta.streaming_content)), read_only=True)
+        self.assertEqual([linha[1] for linha in planilha.active.iter_rows(min_row=2, values_only=True)], ['P0'])
+
+        resposta = self.client.get(reverse('exportar', args=['afericoes']), {'inicio': '01/03/2026'})
+        self.assertRedirects(resposta, reverse('indices'), fetch_redirect_response=False)
+
+    def test_xlsx_em_varias_abas_e_limite_web(self):
+        admin = Usuario.objects.create_superuser(username='admin', password='x')
+        for i in range(5):
+            Paciente.objects.create(nome=f'P{i}', cpf=f'{i:011d}', sexo='F', etnia='Parda',
+                                    data_nascimento=date(1960, 1, 1))
+        with mock.patch.object(exportacao, 'LINHAS_POR_ABA', 2):
+            conteudo = b''.join(exportacao.gerar_xlsx('pacientes', exportacao.consultar('pacientes')))
+        planilha = openpyxl.load_workbook(io.BytesIO(conteudo), read_only=True)
+        self.assertEqual(planilha.sheetnames, ['Pacientes', 'Pacientes (2)', 'Pacientes (3)'])
+        linhas = [list(aba.iter_rows(values_only=True)) for aba in planilha.worksheets]
+        self.assertEqual([len(l) for l in linhas], [3, 3, 2])
+        self.assertTrue(all(l[0][0] == 'ID' for l in linhas))
+
+        self.client.force_login(admin)
+        with override_settings(EXPORTACAO_XLSX_LIMITE_WEB=4):
+            resposta = self.client.get(reverse('exportar', args=['pacientes']), {'formato': 'xlsx'})
+            self.assertRedirects(resposta, reverse('indices'), fetch_redirect_response=False)
+            resposta = self.client.get(reverse('exportar', args=['pacientes']), {'formato': 'xlsx', 'ativo': '0'})
+            self.assertEqual(resposta.status_code, 200)
+
+    def test_consultas_sem_ordenacao_em_memoria(self):
+        # A 1ª linha sai antes de o SQLite ler a tabela inteira (sem B-tree temporária para o ORDER BY)
+        for nome in exportacao.CONJUNTOS:
+            plano = exportacao.filtrar(nome, municipios=['Ubatuba'], ativo=True, inicio=date(2026, 1, 1)).explain()
+            with self.subTest(conjunto=nome):
+                self.assertNotIn('USE TEMP B-TREE', plano)
+
+
+class ExportacaoFHIRTests(TestCase):
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+
+    def test_export_ndjson_e_incremental(self):
+        admin = Usuario.objects.create_superuser(username='admin', password='x')
+        paciente = Paciente.objects.create(nome='P', cpf='123.456.789-09', sexo='F', etnia='Parda',
+                                           data_nascimento=date(1960, 1, 1), municipio='Ubatuba')
+        Afericao.objects.create(paciente=paciente, usuario=admin, pressao_sistolica=150, pressao_diastolica=90,
+                                frequencia_cardiaca=72)
+        atendimento = AtendimentoMedico.objects.create(paciente=paciente, medico=admin, score_prevent_valor=0, subjetivo='-',
+                                                       objetivo='-', avaliacao='-', plano='-', cid10_1='I10')
+        ItemPrescricao.objects.create(prescricao=PrescricaoMedica.objects.create(atendimento=atendimento),
+                                      medicamento_nome='Losartana', concentracao='50mg', posologia='1x ao dia',
+                                      quantidade='30')
+        self.client.force_login(admin)
+
+        self.assertEqual(self.client.get('/fhir/$export', {'_type': 'Encounter'}).status_code, 400)
+        with self.settings(FHIR_EXPORTACAO_PASTA=self.pasta):
+            with self.captureOnCommitCallbacks() as agendadas:
+                resposta = self.client.get('/fhir/$export', {'_type': 'Patient,Observation,Condition,MedicationRequest'})
+            self.assertEqual((resposta.status_code, len(agendadas)), (202, 1))
+            status = resposta['Content-Location']
+            self.assertEqual(self.client.get(status)['X-Progress'], 'Na fila')
+
+            fhir.executar(ExportacaoFHIR.objects.get())  # o que o agendamento faria em segundo plano
+            manifesto = self.client.get(status).json()
+            self.assertEqual({item['type']: item['count'] for item in manifesto['output']},
+                             {'Patient': 1, 'Observation': 2, 'Condition': 1, 'MedicationRequest': 1})
+            arquivo = next(item['url'] for item in manifesto['output'] if item['type'] == 'Observation')
+            resposta = self.client.get(arquivo)
+            observacoes = [json.loads(linha) for linha in b''.join(resposta.streaming_content).splitlines()]
+        self.assertEqual(resposta['Content-Type'], 'application/fhir+ndjson')
+        painel = next(o for o in observacoes if o['id'].startswith('pa-'))
+        self.assertEqual([c['valueQuantity']['value'] for c in painel['component']], [150, 90])
+        self.assertEqual(painel['subject'], {'reference': f'Patient/{paciente.id}'})
+        condicao = next(fhir.recursos('Condition'))
+        self.assertEqual(condicao['code']['coding'][0]['display'], 'Hipertensão essencial (primária)')
+
+        # _since: só o que mudou depois do transactionTime da exportação anterior
+        desde = ExportacaoFHIR.objects.get().data_transacao
+        nova = Afericao.objects.create(paciente=paciente, usuario=admin, pressao_sistolica=130, pressao_diastolica=80)
+        self.assertEqual([o['id'] for o in fhir.recursos('Observation', desde)], [f'pa-{nova.id}'])
+        self.assertEqual(list(fhir.recursos('Patient', desde)), [])
+
+
+    def test_interrompida_delete_e_retencao(self):
+        admin = Usuario.objects.create_superuser(username='admin', password='x')
+        self.client.force_login(admin)
+        antes = timezone.now() - timedelta(hours=1)
+
+        def status(pedido):
+            return self.client.get(reverse('fhir_status', args=[pedido.id]))
+
+        with self.settings(FHIR_EXPORTACAO_PASTA=self.pasta, FHIR_EXPORTACAO_SEM_PROGRESSO=600):
+            # Em execução sem progresso há 1 h (worker reiniciado): vira erro na consulta
+            orfa = ExportacaoFHIR.objects.create(tipos='Patient', status='EXECUTANDO', data_solicitacao=antes,
+                                                 ultimo_progresso=antes)
+            with self.assertLogs('core.fhir', 'WARNING'):
+                resposta = status(orfa)
+            self.assertEqual(resposta.status_code, 500)
+            self.assertIn('interrompida', resposta.json()['issue'][0]['diagnostics'])
+            orfa.refresh_from_db()
+            self.assertEqual(orfa.status, 'ERRO')
+
+            # Na fila há 1 h atrás de uma exportação que progride: continua esperando
+            fila = ExportacaoFHIR.objects.create(tipos='Patient', data_solicitacao=antes)
+            ExportacaoFHIR.objects.create(tipos='Patient', status='EXECUTANDO', ultimo_progresso=timezone.now())
+            self.assertEqual(status(fila).status_code, 202)
+
+            # DELETE (Bulk Data): arquivos e registro removidos
+            pronta = fhir.executar(ExportacaoFHIR.objects.create(tipos='Patient'))
+            self.assertTrue(os.path.isdir(fhir.pasta_exportacao(pronta.id)))
+            self.assertEqual(self.client.delete(reverse('fhir_status', args=[pronta.id])).status_code, 202)
+            self.assertFalse(os.path.exists(fhir.pasta_exportacao(pronta.id)))
+            self.assertEqual(status(pronta).status_code, 404)
+
+            # Retenção: a cada nova exportação saem as terminadas há mais de FHIR_EXPORTACAO_RETENCAO_DIAS
+            ExportacaoFHIR.objects.filter(pk=orfa.pk).update(data_solicitacao=timezone.now() - timedelta(days=8))
+            fhir.solicitar_exportacao(admin)
+            self.assertFalse(ExportacaoFHIR.objects.filter(pk=orfa.pk).exists())
+            self.assertTrue(ExportacaoFHIR.objects.filter(pk=fila.pk).exists())
+
+        # Falha em segundo plano vai para o log (a conexão do teste não pode ser fechada)
+        with self.assertLogs('core.fhir', 'ERROR'), mock.patch('core.fhir.connection'):
+            fhir._executar_em_segundo_plano(uuid.uuid4())
+
+
+class EstatisticasPressaoTests(TestCase):
+    def test_incremental_janela_e_coorte(self):
+        admin = Usuario.objects.create_superuser(username='admin', password='x')
+        paciente = Paciente.objects.create(nome='P', cpf='00000000000', sexo='F', etnia='Parda',
+                                           data_nascimento=date(1960, 1, 1))
+        agora = timezone.now()
+
+        def aferir(pas, pad, dias):
+            return Afericao.objects.create(paciente=paciente, usuario=admin, pressao_sistolica=pas,
+                                           pressao_diastolica=pad, data_afericao=agora - timedelta(days=dias))
+
+        for pas, pad, dias in [(150, 95, 100), (138, 85, 60), (160, 100, 30), (128, 80, 10), (135, 88, 2)]:
+            aferir(pas, pad, dias)
+        historico = EstatisticaPressao.objects.get(paciente=paciente)
+        self.assertAlmostEqual(historico.media_pas, 142.2)
+        self.assertAlmostEqual(historico.desvio_pas, statistics.stdev([150, 138, 160, 128, 135]))
+        self.assertEqual((historico.arv_pas, historico.percentual_alvo), ((12 + 22 + 32 + 7) / 4, 60))
+
+        janela = estatisticas_pa.janela(paciente.id, dias=90)  # sem a aferição de 100 dias atrás
+        self.assertEqual((janela.n, janela.n_variacoes), (4, 4))
+        self.assertAlmostEqual(janela.desvio_pad, statistics.stdev([85, 100, 80, 88]))
+        coorte = estatisticas_pa.coorte(dias=90, percentual_alvo__lte=75).get()
+        self.assertAlmostEqual(coorte['desvio_sistolica'], janela.desvio_pas)
+        self.assertFalse(estatisticas_pa.coorte(dias=90, arv_sistolica__gte=20))
+
+        # Fora de ordem e exclusão recalculam o paciente: mesmo resultado do recálculo completo
+        aferir(145, 92, 45)
+        aferir(130, 82, 1).delete()
+        campos = ['n', 'media_pas', 'm2_pas', 'no_alvo', 'n_variacoes', 'soma_variacao_pas', 'data_ultima']
+        antes = EstatisticaPressao.objects.values(*campos).get()
+        resumos = list(ResumoPressaoDiario.objects.order_by('dia').values('dia', 'n', 'soma_variacao_pas'))
+        estatisticas_pa.recalcular()
+        self.assertEqual(EstatisticaPressao.objects.values(*campos).get(), antes)
+        self.assertEqual(list(ResumoPressaoDiario.objects.order_by('dia').values('dia', 'n', 'soma_variacao_pas')),
+                         resumos)
+        self.assertEqual(antes['n'], 6)
+
+        # Falha nas estatísticas desfaz a aferição: nunca uma sem a outra
+        with mock.patch('core.estatisticas_pa.registrar', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            aferir(170, 100, 0)
+        with mock.patch('core.estatisticas_pa.recalcular', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            Afericao.objects.filter(paciente=paciente).first().delete()
+        self.assertEqual(Afericao.objects.filter(paciente=paciente).count(), 6)
+        self.assertEqual(EstatisticaPressao.objects.values(*campos).get(), antes)
+
+    def test_exclusao_volta_a_ultima_pa(self):
+        admin = Usuario.objects.create_superuser(username='admin', password='x')
+        paciente = Paciente.objects.create(nome='P', cpf='00000000000', sexo='F', etnia='Parda',
+                                           data_nascimento=date(1960, 1, 1))
+        agora = timezone.now()
+        afericoes = [Afericao.objects.create(paciente=paciente, usuario=admin, pressao_sistolica=pas,
+                                             pressao_diastolica=pad, data_afericao=agora - timedelta(days=dias))
+                     for pas, pad, dias in [(150, 95, 10), (138, 85, 1)]]
+        afericoes[1].delete()
+        paciente.refresh_from_db()
+        self.assertEqual((paciente.ultima_pas, paciente.ultima_pad, paciente.data_ultima_afericao),
+                         (150, 95, afericoes[0].data_afericao))
+        afericoes[0].delete()
+        paciente.refresh_from_db()
+        self.assertEqual((paciente.ultima_pas, paciente.ultima_pad, paciente.data_ultima_afericao), (0, 0, None))
+
+
+class DadosSinteticosTests(TestCase):
+    def test_gera_coorte_pequena(self):
+        antes = timezone.now() - timedelta(seconds=1)
+        call_command('gerar_dados_sinteticos', pacientes=6, afericoes=3, lote=4, forcar=True,
+                     stdout=open(os.devnull, 'w'))
+        self.assertEqual(Paciente.objects.count(), 6)
+        # atualizado_em preenchido: a coorte entra na exportação FHIR incremental (_since)
+        self.assertEqual(len(list(fhir.recursos('Patient', desde=antes))), 6)
+        self.assertFalse(Afericao.objects.filter(atualizado_em__isnull=True).exists())
+        # Estatísticas de PA coerentes com as aferições inseridas direto no banco
+        self.assertEqual(EstatisticaPressao.objects.count(), 6)
+        self.assertEqual(sum(EstatisticaPressao.objects.values_list('n', flat=True)), Afericao.objects.count())
+
+
+class CatalogoMedicamentosTests(TestCase):
+    def test_sincroniza_so_a_diferenca(self):
+        catalogo = list(ler_catalogo_medicamentos())
+        self.assertEqual(sincronizar_catalogo(catalogo)['novos'], len(catalogo))
+
+        Medicamento.objects.filter(principio_ativo='Anlodipino').update(dose_padrao='5mg')
+        Medicamento.objects.create(classe='Outros', principio_ativo='Retirado', dose_padrao='1mg')
+        with self.assertNumQueries(4):  # leitura + transação com um bulk_update
+            resumo = sincronizar_catalogo(catalogo, desativar_ausentes=True)
+        self.assertEqual((resumo['novos'], resumo['atualizados'], resumo['desativados']), (0, 1, 1))
+        self.assertEqual(Medicamento.objects.get(principio_ativo='Anlodipino').dose_padrao, '2,5-10mg')
+        self.assertFalse(Medicamento.objects.get(principio_ativo='Retirado').ativo)
+
+
+class SQLiteProducaoTests(TestCase):
+    def test_pragmas_em_toda_conexao(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_wal_ligado_uma_vez_pela_migracao(self):
+        # Abrir conexões não reescreve o cabeçalho do arquivo; só a migração muda o journal
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta)
+        caminho = os.path.join(pasta, 'db.sqlite3')
+        sqlite3.connect(caminho).close()
+        banco = type(connections['default'])({**connection.settings_dict, 'NAME': caminho})
+        self.addCleanup(banco.close)
+        banco.ensure_connection()
+
+        def modo():
+            with sqlite3.connect(caminho) as conexao:
+                return conexao.execute('PRAGMA journal_mode').fetchone()[0]
+
+        self.assertEqual(modo(), 'delete')
+        migracao = importlib.import_module('core.migrations.0020_sqlite_wal')
+        migracao.ativar_wal(None, mock.Mock(connection=banco))
+        self.assertEqual(modo(), 'wal')
+
+
+class ConsultasPorPaginaTests(TestCase):
+    """
+    Teto de consultas SQL por URL com uma base fixa (15 pacientes com histórico completo): um N+1
+    introduzido em view ou template estoura o teto. Toda rota de core/urls.py precisa ter teto aqui.
+    """
+    # nome da rota -> máximo de consultas. A sessão vem do cache (cached_db: o logout também a apaga
+    # do banco); o usuário é relido do banco uma vez porque o force_login (last_login) invalida o
+    # usuário em cache
+    TETOS = {
+        'index': 1, 'indices': 2, 'api_dashboard': 7, 'api_triagem_coorte': 2, 'exportar': 2,
+        'login': 1, 'logout': 3, 'trocar_senha': 1,
+        'gestao_pacientes': 2, 'salvar_paciente': 1, 'api_paciente': 2,
+        'importar_pacientes': 1, 'baixar_rejeitados_importacao': 1,
+        'lista_risco': 3, 'api_lista_risco': 2,
+        'atendimento_hub': 1, 'atendimento_multidisciplinar': 3, 'atendimento_prevent': 4,
+        'api_prevent_calcular': 2, 'gerar_pedido_exames': 2, 'solicitar_exames': 3, 'gerar_kit_exames': 2,
+        'gerar_contrarreferencia_triagem': 2, 'gestao_usuarios': 2, 'salvar_usuario': 1, 'api_usuario': 2,
+        'gestao_medicamentos': 3, 'salvar_medicamento': 1, 'gerar_alta': 3,
+        'detalhe_paciente': 9, 'importar_afericoes_paciente': 2,  # detalhe: +1 do arquivo (paciente com alta)
+        'monitoramento_busca': 1, 'monitoramento_painel': 5,
+        'atendimento_medico': 3, 'api_cid10': 1, 'prescricao_medica': 6, 'reimprimir_receita': 6,
+        'lista_perfis': 1, 'baixar_perfil': 1, 'metricas': 0,
+        'fhir_export': 3, 'fhir_status': 2, 'fhir_arquivo': 2,  # export: +1 da retenção (apagar_antigas)
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_superuser(username='admin', password='x', first_name='Ana')
+        medico = Usuario.objects.create_user(username='med', password='x', tipo_profissional='MED')
+        for i in range(15):
+            paciente = Paciente.objects.create(
+                nome=f'Paciente {i}', cpf=f'{i:011d}', sexo='MF'[i % 2], etnia='Parda',
+                data_nascimento=date(1950 + i, 1, 1), municipio=('Caraguatatuba', 'Ubatuba', 'Ilhabela')[i % 3],
+            )
+            for dias in (60, 30, 1):
+                Afericao.objects.create(paciente=paciente, usuario=cls.admin, pressao_sistolica=130 + i,
+                                        pressao_diastolica=85, data_afericao=timezone.now() - timedelta(days=dias))
+            AtendimentoMultidisciplinar.objects.create(paciente=paciente, profissional=cls.admin, peso=70,
+                                                       altura=Decimal('1.60'), circunferencia_abdominal=90)
+            AvaliacaoPrevent.objects.create(paciente=paciente, idade=60, sexo=paciente.sexo, colesterol_total=200,
+                                            hdl=50, pressao_sistolica=140, tfg=90, risco_10_anos=Decimal('8.5'))
+            for _ in range(2):
+                atendimento = AtendimentoMedico.objects.create(
+                    paciente=paciente, medico=medico, score_prevent_valor=Decimal('8.5'), subjetivo='-',
+                    objetivo='-', avaliacao='-', plano='-', cid10_1='I10')
+                prescricao = PrescricaoMedica.objects.create(atendimento=atendimento)
+                for tipo in ('CONTINUO', 'CONTROLADO'):
+                    ItemPrescricao.objects.create(prescricao=prescricao, medicamento_nome='Losartana',
+                                                  concentracao='50mg', posologia='1x ao dia', quantidade='30',
+                                                  tipo=tipo)
+            Medicamento.objects.create(classe=f'Classe {i % 4}', principio_ativo=f'Medicamento {i}',
+                                       dose_padrao='10mg', nomes_comerciais='A, B')
+        cls.paciente = Paciente.objects.first()
+        cls.atendimento = AtendimentoMedico.objects.filter(paciente=cls.paciente).first()
+        cls.argumentos = {
+            'paciente_id': cls.paciente.id, 'id': cls.paciente.id, 'atendimento_id': cls.atendimento.id,
+            'prescricao_id': cls.atendimento.prescricao.id, 'token': 'inexistente', 'nome': 'inexistente',
+            'conjunto': 'afericoes', 'exportacao_id': uuid.uuid4(), 'arquivo': 'Patient.ndjson',
+        }
+
+    def _url(self, padrao):
+        argumentos = {nome: self.argumentos[nome] for nome in padrao.pattern.converters}
+        if padrao.name == 'api_usuario':
+            argumentos['id'] = self.admin.id
+        consulta = {'api_cid10': '?q=I10', 'api_prevent_calcular': '?col_total=200&hdl=50&pas=140&tfg=90'}
+        return reverse(padrao.name, kwargs=argumentos) + consulta.get(padrao.name, '')
+
+    def setUp(self):
+        # O cache em arquivo sobrevive entre execuções: mede sempre com o dashboard frio
+        cache.invalidar('dashboard')
+
+    @mock.patch('core.views.requests.get', side_effect=requests.ConnectionError)
+    def test_teto_de_consultas_por_url(self, _api_laboratorio):
+        self.assertEqual(sorted(p.name for p in urls.urlpatterns), sorted(self.TETOS))
+        for padrao in urls.urlpatterns:
+            url = self._url(padrao)
+            self.client.force_login(self.admin)
+            with self.subTest(url=url), CaptureQueriesContext(connection) as consultas:
+                resposta = self.client.get(url)
+                self.assertLess(resposta.status_code, 500)
+                self.assertLessEqual(len(consultas), self.TETOS[padrao.name],
+                                     '\n'.join(q['sql'] for q in consultas.captured_queries))
+
+    def test_consultas_principais_usam_indice(self):
+        ativos = Paciente.objects.filter(ativo=True)
+        planos = {
+            'afericao_paciente_data_idx': [
+                Afericao.objects.filter(paciente=self.paciente)[:1],
+                Afericao.objects.filter(paciente=self.paciente).order_by('data_afericao'),
+                Afericao.objects.filter(data_afericao__gte=timezone.now() - timedelta(days=30),
+                                        paciente__in=ativos).order_by(),
+            ],
+            'paciente_ativo_municipio_idx': [
+                ativos.filter(municipio__in=['Ubatuba']),
+                ativos.values('municipio').annotate(total=Count('id')),
+                ativos.values_list('municipio', flat=True).distinct().order_by('municipio'),
+            ],
+            'paciente_lista_risco_idx': [ativos.order_by('-nivel_risco', '-ultima_pas', '-id')[:51]],
+            'prevent_paciente_data_idx': [
+                AvaliacaoPrevent.objects.filter(paciente=self.paciente).order_by('-data_avaliacao')[:1],
+            ],
+        }
+        for indice, querysets in planos.items():
+            for queryset in querysets:
+                plano = queryset.explain()
+                with self.subTest(sql=str(queryset.query)):
+                    self.assertIn(indice, plano)
+                    self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plano)
+
+
+class InstrumentacaoTests(TestCase):
+    @override_settings(INSTRUMENTACAO_HABILITADA=True)
+    def test_server_timing_e_log(self):
+        usuario = Usuario.objects.create_user(username='enf', password='x', tipo_profissional='ENF')
+        paciente = Paciente.objects.create(nome='Kit', cpf='52998224725', sexo='F', etnia='Parda',
+                                           data_nascimento=date(1960, 1, 1))
+        self.client.force_login(usuario)
+        with self.assertLogs('core.instrumentacao', 'INFO') as logs:
+            resposta = self.client.get(f'/atendimento/kit-exames/{paciente.id}/')
+
+        metricas = [m.split(';')[0] for m in resposta['Server-Timing'].split(', ')]
+        self.assertEqual(metricas, ['sql', 'template', 'pdf', 'total'])
+        registro = json.loads(logs.records[0].getMessage())
+        self.assertEqual((registro['rota'], registro['pdf_n'], registro['http_n']), ('gerar_kit_exames', 1, 0))
+        self.assertGreater(registro['sql_n'], 0)
+
+    def test_desligada_por_padrao(self):
+        self.assertNotIn('Server-Timing', self.client.get('/login/'))
+
+
+class BenchmarkFluxosTests(TestCase):
+    def test_fluxos_rodam_sem_erros_e_sem_gravar(self):
+        sincronizar_catalogo(list(ler_catalogo_medicamentos()))
+        Paciente.objects.create(nome='Kit', cpf='52998224725', sexo='F', etnia='Parda', municipio='Ubatuba',
+                                data_nascimento=date(1960, 1, 1))
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta)
+        saida = os.path.join(pasta, 'fluxos.json')
+        call_command('benchmark_fluxos', iteracoes=1, aquecimento=0, saida=saida, stdout=open(os.devnull, 'w'))
+
+        with open(saida, encoding='utf-8') as arquivo:
+            etapas = json.load(arquivo)['etapas']
+        self.assertEqual({etapa.split('/')[0] for etapa in etapas}, {'triagem', 'consulta', 'painel'})
+        # PDFs no fim de cada fluxo: os redirecionamentos foram seguidos até o fim
+        self.assertIn('consulta/reimprimir_receita', etapas)
+        self.assertEqual({etapa: e['erros'] for etapa, e in etapas.items() if e['erros']}, {})
+        self.assertFalse(AtendimentoMedico.objects.exists())
+
+
+class PerfilamentoTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta)
+        patcher = mock.patch('core.perfilamento.PASTA_PERFIS', pasta)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @override_settings(PERFIS_MAXIMO=2)
+    def test_so_admin_e_guarda_os_mais_recentes(self):
+        enfermeira = Usuario.objects.create_user(username='enf', password='x', tipo_profissional='ENF')
+        self.client.force_login(enfermeira)
+        self.assertNotIn('X-Perfil', self.client.get('/pacientes/?_perfil=1'))
+
+        self.client.force_login(Usuario.objects.create_superuser(username='admin', password='x'))
+        self.assertNotIn('X-Perfil', self.client.get('/pacientes/'))
+        nomes = [self.client.get('/pacientes/', HTTP_X_PERFILAR='1')['X-Perfil'] for _ in range(3)]
+
+        self.assertEqual([p['nome'] for p in listar_perfis()], nomes[:0:-1])
+        self.assertIn('cumulative', listar_perfis()[0]['resumo'])
+        self.assertEqual(self.client.get(f'/perfis/{nomes[-1]}/baixar/').status_code, 200)
+        self.assertEqual(self.client.get(f'/perfis/{nomes[0]}/baixar/').status_code, 302)
+
+
+class MetricasTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta)
+        patcher = mock.patch('core.metricas.PASTA_METRICAS', pasta)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pasta = pasta
+
+    def test_soma_os_workers_e_exporta(self):
+        paciente = Paciente.objects.create(nome='Kit', cpf='52998224725', sexo='F', etnia='Parda',
+                                           data_nascimento=date(1960, 1, 1))
+        self.client.force_login(Usuario.objects.create_user(username='enf', password='x', tipo_profissional='ENF'))
+        self.client.get(f'/atendimento/kit-exames/{paciente.id}/')
+        self.client.get('/')
+        # Retrato de outro worker, vivo (o processo pai serve de exemplo)
+        with open(os.path.join(self.pasta, f'{os.getppid()}-1.json'), 'w') as arquivo:
+            json.dump({'contadores': [['pdf_gerados_total', [['template', 'pdf_kit_exames.html']], 4]],
+                       'histogramas': [], 'gauges': [['disjuntor_estado', [['api', 'laboratorio']], 2]]}, arquivo)
+
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.9').status_code, 403)
+        self.client.logout()
+        texto = self.client.get('/metrics').content.decode()  # 127.0.0.1 liberado
+
+        valores = dict(linha.rsplit(' ', 1) for linha in texto.splitlines() if not linha.startswith('#'))
+        self.assertGreaterEqual(float(valores['pdf_gerados_total{template="pdf_kit_exames.html"}']), 5)
+        self.assertEqual(valores['disjuntor_estado{api="laboratorio"}'], '2')
+        self.assertGreaterEqual(int(valores['http_requisicao_segundos_count{metodo="GET",rota="index"}']), 1)
+        self.assertIn('http_requisicao_segundos_bucket{metodo="GET",rota="index",le="+Inf"}', valores)
+        self.assertIn('db_consultas_total{rota="gerar_kit_exames"}', valores)
+
+    def test_retratos_de_processos_encerrados_sao_recolhidos(self):
+        encerrado = subprocess.Popen(['true'])
+        encerrado.wait()
+
+        def retrato(nome, pdfs, gauge):
+            with open(os.path.join(self.pasta, nome), 'w') as arquivo:
+                json.dump({'contadores': [['pdf_gerados_total', [['template', 'x.html']], pdfs]], 'histogramas': [],
+                           'gauges': [['disjuntor_estado', [['api', 'oms']], gauge]]}, arquivo)
+
+        def pdfs():
+            texto = metricas.exportar()
+            valores = dict(linha.rsplit(' ', 1) for linha in texto.splitlines() if not linha.startswith('#'))
+            return float(valores['pdf_gerados_total{template="x.html"}']), valores.get('disjuntor_estado{api="oms"}')
+
+        retrato(f'{encerrado.pid}-1.json', 3, 2)  # PID que não existe mais
+        retrato(f'{os.getpid()}-1.json', 4, 2)  # mesmo PID deste processo, início anterior: reaproveitado
+        self.assertEqual(pdfs(), (7, None))  # contadores preservados; gauges de mortos descartados
+        self.assertEqual(sorted(n for n in os.listdir(self.pasta) if n.endswith('.json')),
+                         sorted([metricas.ARQUIVO_MORTOS, f'{os.getpid()}-{metricas._inicio}.json']))
+
+        retrato(f'{encerrado.pid}-2.json', 1, 0)
+        self.assertEqual(pdfs(), (8, None))
+        self.assertEqual(len([n for n in os.listdir(self.pasta) if n.endswith('.json')]), 2)
+
+    def test_disjuntor_abre_e_fecha(self):
+        disjuntor = Disjuntor('teste', falhas_para_abrir=2, segundos_aberto=60)
+        falha = mock.Mock(side_effect=requests.ConnectionError)
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                disjuntor.chamar(falha)
+        with self.assertRaises(CircuitoAberto):
+            disjuntor.chamar(falha)
+        self.assertEqual((falha.call_count, disjuntor.estado), (2, ABERTO))
+
+        disjuntor.aberto_ate = 0  # passou o tempo: a próxima chamada é o teste
+        disjuntor.chamar(mock.Mock(return_value=mock.Mock(status_code=200)))
+        self.assertEqual(disjuntor.estado, FECHADO)
+
+
+class ReplicaTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta)
+        bancos = {**settings.DATABASES, 'replica': {**settings.DATABASES['default'],
+                                                    'NAME': os.path.join(pasta, 'replica.sqlite3')}}
+        configuracao = override_settings(DATABASES=bancos, REPLICA_ATRASO_MAXIMO=30)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.roteador = replica.RoteadorReplica()
+
+    def _copia_com_idade(self, segundos):
+        with open(replica.caminho_marcador(), 'w') as arquivo:
+            arquivo.write(repr(time.time() - segundos))
+        replica._marcador_cache[0] = 0.0
+
+    def _ler_na_view(self, modelo):
+        return usa_replica(lambda request: self.roteador.db_for_read(modelo))(None)
+
+    def test_leitura_na_replica_ate_a_primeira_escrita(self):
+        self._copia_com_idade(0)
+        token = replica.iniciar_requisicao()
+        try:
+            self.assertIsNone(self.roteador.db_for_read(Paciente))  # view sem @usa_replica
+            self.assertEqual(self._ler_na_view(Paciente), 'replica')
+            self.assertIsNone(self._ler_na_view(Usuario))
+            self.assertEqual(self.roteador.db_for_write(Afericao), 'default')
+            self.assertIsNone(self._ler_na_view(Paciente))
+        finally:
+            estado = replica.finalizar_requisicao(token)
+        self.assertTrue(estado.escreveu)
+
+        token = replica.iniciar_requisicao()
+        self._copia_com_idade(60)  # mais atrasada que REPLICA_ATRASO_MAXIMO
+        self.assertIsNone(self._ler_na_view(Paciente))
+        replica.finalizar_requisicao(token)
+
+    def test_cookie_prende_ao_principal_depois_de_escrever(self):
+        self._copia_com_idade(0)
+        escrever = ReplicaMiddleware(lambda request: (self.roteador.db_for_write(Afericao), HttpResponse())[1])
+        response = escrever(RequestFactory().post('/'))
+        cookie = response.cookies[replica.COOKIE_PRIMARIO]
+        self.assertEqual(cookie['max-age'], 30)
+
+        ler = ReplicaMiddleware(lambda request: HttpResponse(self._ler_na_view(Paciente) or 'default'))
+        self.assertEqual(ler(RequestFactory().get('/')).content, b'replica')
+        request = RequestFactory().get('/')
+        request.COOKIES[replica.COOKIE_PRIMARIO] = cookie.value
+        self.assertEqual(ler(request).content, b'default')
+
+
+class ArquivoTests(TestCase):
+    def test_arquiva_alta_antiga_mostra_e_restaura_na_readmissao(self):
+        admin = Usuario.objects.create_superuser(username='admin', password='x')
+        medicamento = Medicamento.objects.create(classe='BRA', principio_ativo='Losartana', dose_padrao='50mg')
+        antigo, recente = (
+            Paciente.objects.create(nome=nome, cpf=cpf, sexo='F', etnia='Parda', data_nascimento=date(1950, 1, 1),
+                                    ativo=False, data_alta=date.today() - timedelta(days=dias))
+            for nome, cpf, dias in (('Antigo', '52998224725', 1000), ('Recente', '11144477735', 30))
+        )
+        for paciente in (antigo, recente):
+            afericao = Afericao.objects.create(paciente=paciente, usuario=admin, pressao_sistolica=150,
+                                               pressao_diastolica=95)
+            afericao.medicamentos.add(medicamento)
+            atendimento = AtendimentoMedico.objects.create(
+                paciente=paciente, medico=admin, score_prevent_valor=Decimal('8.5'), subjetivo='-', objetivo='-',
+                avaliacao='-', plano='Manter', cid10_1='I10')
+            ItemPrescricao.objects.create(prescricao=PrescricaoMedica.objects.create(atendimento=atendimento),
+                                          medicamento_nome='Anlodipino', concentracao='5mg', posologia='1x',
+                                          quantidade='30')
+        original = Afericao.objects.get(paciente=antigo)
+
+        call_command('arquivar_pacientes', meses=24, stdout=open(os.devnull, 'w'))
+        self.assertEqual(ArquivoPaciente.objects.get().total_registros, 4)
+        self.assertFalse(Afericao.objects.filter(paciente=antigo).exists())
+        self.assertFalse(ItemPrescricao.objects.filter(prescricao__atendimento__paciente=antigo).exists())
+        self.assertEqual(Afericao.objects.filter(paciente=recente).count(), 1)
+
+        self.client.force_login(admin)
+        pagina = self.client.get(reverse('detalhe_paciente', args=[antigo.id]))
+        self.assertContains(pagina, 'Histórico arquivado')
+        self.assertContains(pagina, 'Anlodipino')
+        self.assertEqual(pagina.context['grafico_pas'], '[150]')
+
+        self.client.post(reverse('salvar_paciente'), {
+            'paciente_id': antigo.id, 'nome': 'Antigo', 'cpf': antigo.cpf, 'sexo': 'F', 'etnia': 'Parda',
+            'data_nascimento': '1950-01-01', 'data_insercao': antigo.data_insercao, 'municipio': antigo.municipio,
+            'ativo': 'on',
+        })
+        restaurada = Afericao.objects.get(paciente=antigo)
+        self.assertEqual((restaurada.pk, restaurada.data_afericao), (original.pk, original.data_afericao))
+        self.assertEqual(list(restaurada.medicamentos.all()), [medicamento])
+        self.assertEqual(AtendimentoMedico.objects.get(paciente=antigo).prescricao.itens.get().medicamento_nome,
+                         'Anlodipino')
+        self.assertFalse(ArquivoPaciente.objects.exists())
+
+
+
+class AutenticacaoCacheTests(TestCase):
+    def setUp(self):
+        self.usuario = Usuario.objects.create_user(username='enf', password='x', tipo_profissional='ENF')
+        self.client.force_login(self.usuario)
+        self.client.get(reverse('index'))  # usuário vai para o cache
+
+    def test_sessao_e_usuario_sem_consultas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.client.get(reverse('index')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('gestao_usuarios')).status_code, 302)  # admin_only
+        self.assertEqual(len(consultas), 0)
+
+    def test_alteracao_do_usuario_invalida_o_cache(self):
+        self.usuario.set_password('nova')
+        self.usuario.save()
+        resposta = self.client.get(reverse('index'))
+        self.assertRedirects(resposta, f"{reverse('login')}?next=/", fetch_redirect_response=False)
+
+    def test_menu_em_cache_por_papel(self):
+        self.assertNotContains(self.client.get(reverse('index')), 'Perfis de Desempenho')
+        self.client.force_login(Usuario.objects.create_superuser(username='admin', password='x'))
+        self.assertContains(self.client.get(reverse('index')), 'Perfis de Desempenho')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CacheTests(TestCase):
+    def _consultas(self, namespace, resultado):
+        return metricas._contadores[metricas._chave('cache_consultas_total',
+                                                    {'namespace': namespace, 'resultado': resultado})]
+
+    def test_versao_e_invalidacao(self):
+        calcular = mock.Mock(side_effect=[1, 2])
+        self.assertEqual(cache.obter('teste', ['a', 'b'], calcular, 60), 1)
+        self.assertEqual(cache.obter('teste', ['a', 'b'], calcular, 60), 1)
+        cache.invalidar('teste')
+        self.assertEqual(cache.obter('teste', ['a', 'b'], calcular, 60), 2)
+        self.assertEqual(calcular.call_count, 2)
+        self.assertEqual((self._consultas('teste', 'acerto'), self._consultas('teste', 'falta')), (1, 2))
+
+    def test_um_so_calculo_com_acessos_simultaneos(self):
+        calcular = mock.Mock(side_effect=lambda: time.sleep(0.3) or 'valor')
+        resultados = []
+        threads = [threading.Thread(target=lambda: resultados.append(cache.obter('simultaneo', 'x', calcular, 60)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calcular.call_count, 1)
+        self.assertEqual(resultados, ['valor'] * 8)
+        self.assertEqual(self._consultas('simultaneo', 'espera'), 7)
@@ -0,0 +1,88 @@
+"""
+Regra de elegibilidade da triagem de hipertensão (linha de cuidado do AME).
+
+Elegível: sem aferição registrada, PA estágio 2 (PAS >= 140 ou PAD >= 90), ou
+estágio 1 (PAS 130-139 ou PAD 80-89) com diabetes ou lesão de órgão-alvo.
+Caso contrário o paciente é contrarreferenciado.
+
+A mesma regra existe em três formas: um paciente (ficha de enfermagem),
+vetorizada com NumPy e como expressão SQL (reprocessamento da coorte).
+"""
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+PROTOCOLO_PADRAO = {
+    'pas_estagio_2': 140,
+    'pad_estagio_2': 90,
+    'pas_estagio_1': 130,
+    'pad_estagio_1': 80,
+}
+
+
+def protocolo_vigente(**alteracoes):
+    """Limiares do protocolo: padrão, sobrescritos por settings.TRIAGEM_PROTOCOLO e pelos argumentos."""
+    protocolo = dict(PROTOCOLO_PADRAO)
+    protocolo.update(getattr(settings, 'TRIAGEM_PROTOCOLO', {}))
+    protocolo.update({k: v for k, v in alteracoes.items() if v is not None})
+    return protocolo
+
+
+def avaliar_elegibilidade(pas, pad, tem_diabetes, tem_loa, protocolo=None):
+    """Um paciente: pas/pad da última aferição (None se não houver)."""
+    p = protocolo or protocolo_vigente()
+    if pas is None:
+        return True
+    estagio_2 = pas >= p['pas_estagio_2'] or pad >= p['pad_estagio_2']
+    estagio_1 = pas >= p['pas_estagio_1'] or pad >= p['pad_estagio_1']
+    return estagio_2 or (estagio_1 and (tem_diabetes or tem_loa))
+
+
+def avaliar_elegibilidade_lote(pas, pad, tem_diabetes, tem_loa, protocolo=None):
+    """Vetorizada: arrays de mesmo tamanho; PAS NaN indica paciente sem aferição."""
+    p = protocolo or protocolo_vigente()
+    pas = np.asarray(pas, dtype=float)
+    pad = np.asarray(pad, dtype=float)
+    alto_risco = np.asarray(tem_diabetes, dtype=bool) | np.asarray(tem_loa, dtype=bool)
+    estagio_2 = (pas >= p['pas_estagio_2']) | (pad >= p['pad_estagio_2'])
+    estagio_1 = (pas >= p['pas_estagio_1']) | (pad >= p['pad_estagio_1'])
+    return np.isnan(pas) | estagio_2 | (estagio_1 & alto_risco)
+
+
+def anotar_fatores_risco(pacientes):
+    """Anota diabetes e lesão de órgão-alvo da última avaliação multidisciplinar de cada paciente."""
+    from .models import AtendimentoMultidisciplinar
+
+    ultimo_multi = AtendimentoMultidisciplinar.objects.filter(
+        paciente=OuterRef('pk')
+    ).order_by('-data_atendimento', '-id')
+    return pacientes.annotate(
+        triagem_diabetes=Coalesce(Subquery(ultimo_multi.values('tem_diabetes')[:1]), Value(False)),
+        triagem_loa=Coalesce(Subquery(ultimo_multi.values('tem_lesao_orgao')[:1]), Value(False)),
+    )
+
+
+def q_elegivel(protocolo=None):
+    """
+    Regra em SQL sobre Paciente (última PA em ultima_pas/ultima_pad, 0 = sem aferição).
+    Requer os campos anotados por anotar_fatores_risco.
+    """
+    p = protocolo or protocolo_vigente()
+    estagio_2 = Q(ultima_pas__gte=p['pas_estagio_2']) | Q(ultima_pad__gte=p['pad_estagio_2'])
+    estagio_1 = Q(ultima_pas__gte=p['pas_estagio_1']) | Q(ultima_pad__gte=p['pad_estagio_1'])
+    alto_risco = Q(triagem_diabetes=True) | Q(triagem_loa=True)
+    return Q(ultima_pas=0) | estagio_2 | (estagio_1 & alto_risco)
+
+
+def contar_elegibilidade(pacientes, protocolo=None):
+    """Conta elegíveis e contrarreferências em uma única consulta agregada."""
+    totais = anotar_fatores_risco(pacientes).aggregate(
+        total=Count('id'),
+        elegiveis=Count('id', filter=q_elegivel(protocolo)),
+    )
+    return {
+        'total': totais['total'],
+        'elegiveis': totais['elegiveis'],
+        'contrarreferencia': totais['total'] - totais['elegiveis'],
+    }
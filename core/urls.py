@@ -10,6 +10,11 @@ urlpatterns = [
 
     # API de Dados (Atualizada)
     path('api/dashboard', views.api_dashboard, name='api_dashboard'),
+    path('api/triagem/coorte', views.api_triagem_coorte, name='api_triagem_coorte'),
+    path('exportar/<str:conjunto>/', views.exportar, name='exportar'),
+    path('fhir/$export', views.fhir_export, name='fhir_export'),
+    path('fhir/exportacoes/<uuid:exportacao_id>/', views.fhir_status, name='fhir_status'),
+    path('fhir/exportacoes/<uuid:exportacao_id>/<str:arquivo>', views.fhir_arquivo, name='fhir_arquivo'),
 
     # ... (mantenha as rotas de login, pacientes, atendimento, usuarios, medicamentos) ...
     path('login/', views.login_view, name='login'),
@@ -18,9 +23,14 @@ urlpatterns = [
     path('pacientes/', views.gestao_pacientes, name='gestao_pacientes'),
     path('paciente/salvar', views.salvar_paciente, name='salvar_paciente'),
     path('api/paciente/<int:id>/', views.api_paciente, name='api_paciente'),
+    path('pacientes/importar/', views.importar_pacientes_view, name='importar_pacientes'),
+    path('pacientes/importar/rejeitados/<str:token>/', views.baixar_rejeitados_importacao, name='baixar_rejeitados_importacao'),
+    path('pacientes/risco/', views.lista_risco, name='lista_risco'),
+    path('api/pacientes/risco/', views.api_lista_risco, name='api_lista_risco'),
     path('atendimento/', views.atendimento_hub, name='atendimento_hub'),
     path('atendimento/multi/<int:paciente_id>/', views.atendimento_multidisciplinar, name='atendimento_multidisciplinar'),
     path('atendimento/prevent/<int:paciente_id>/', views.atendimento_prevent, name='atendimento_prevent'),
+    path('api/prevent/<int:paciente_id>/', views.api_prevent_calcular, name='api_prevent_calcular'),
     path('atendimento/pedidos/<int:paciente_id>/', views.gerar_pedido_exames, name='gerar_pedido_exames'),
     path('atendimento/exames/<int:atendimento_id>/', views.solicitar_exames, name='solicitar_exames'),
     path('atendimento/kit-exames/<int:paciente_id>/', views.gerar_kit_exames, name='gerar_kit_exames'),
@@ -32,9 +42,14 @@ urlpatterns = [
     path('api/usuario/<int:id>/', views.api_usuario, name='api_usuario'),
     path('paciente/alta/<int:id>/', views.gerar_alta, name='gerar_alta'),
     path('paciente/<int:paciente_id>/detalhes/', views.detalhe_paciente, name='detalhe_paciente'),
+    path('paciente/<int:paciente_id>/afericoes/importar/', views.importar_afericoes_paciente, name='importar_afericoes_paciente'),
     path('monitoramento/', views.monitoramento_busca, name='monitoramento_busca'),
     path('monitoramento/painel/<int:paciente_id>/', views.monitoramento_painel, name='monitoramento_painel'),
     path('prontuario/medico/<int:paciente_id>/', views.realizar_atendimento_medico, name='atendimento_medico'),
+    path('metrics', views.metricas_prometheus, name='metricas'),
+    path('perfis/', views.lista_perfis, name='lista_perfis'),
+    path('perfis/<str:nome>/baixar/', views.baixar_perfil, name='baixar_perfil'),
+    path('api/cid10/', views.api_cid10, name='api_cid10'),
     path('prontuario/prescricao/<int:atendimento_id>/', views.prescricao_medica_view, name='prescricao_medica'),
     path('prescricao/imprimir/<int:prescricao_id>/', views.reimprimir_receita, name='reimprimir_receita'),
 ]
\ No newline at end of file
@@ -1,18 +1,27 @@
 import os
 import base64
+import csv
+import tempfile
+import time
+import uuid
 import requests
 import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.staticfiles import finders
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import login, logout, update_session_auth_hash
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
 from django.db.models import Q, Avg, Count, F, ExpressionWrapper, fields
-from django.http import JsonResponse, HttpResponse
+from django.db import router
+from django.http import FileResponse, Http404, JsonResponse, HttpResponse, StreamingHttpResponse
 from django.template.loader import get_template
+from django.urls import reverse
+from urllib.parse import urlencode
 from xhtml2pdf import pisa
 from django.conf import settings
+from django.utils import timezone
 from datetime import datetime, date, timedelta
 from django.forms import inlineformset_factory  # Faltava este import
 from operator import attrgetter # Para ordenar listas combinadas
@@ -20,14 +29,26 @@ from operator import attrgetter # Para ordenar listas combinadas
 # Imports dos Models e Forms
 from .models import (
     Paciente, Medicamento, Afericao, Usuario, AtendimentoMultidisciplinar,
-    AvaliacaoPrevent, AtendimentoMedico, TriagemHipertensao, PrescricaoMedica, ItemPrescricao
+    AvaliacaoPrevent, AtendimentoMedico, TriagemHipertensao, PrescricaoMedica, ItemPrescricao, ExportacaoFHIR
 )
 from .forms import (
     PacienteForm, UsuarioForm, AtendimentoMedicoForm, TriagemHASForm
 )
 
+from . import metricas
+from .disjuntor import LABORATORIO
+
 # IMPORTE CORRETO DOS DECORADORES DE SEGURANÇA
-from .decorators import admin_only, multi_only, medico_only, health_team
+from .decorators import admin_only, multi_only, medico_only, health_team, usa_replica
+from .services_cid import buscar_cid10, converter_lote
+from .prevent import calcular_risco_prevent, classificar_risco, ErroPrevent, FAIXAS_RISCO
+from .triagem import avaliar_elegibilidade, contar_elegibilidade, protocolo_vigente
+from .importacao import importar_afericoes, importar_pacientes
+from .perfilamento import caminho_perfil, listar_perfis
+from .arquivo import carregar_arquivo, restaurar_paciente
+from .autenticacao import papeis
+from . import cache, estatisticas_pa, exportacao, fhir
+from .services_medicamentos import autocomplete_medicamentos
 
 
 # --- Funções Auxiliares ---
@@ -50,6 +71,16 @@ def get_base64_image(filename):
         return None
 
 
+def renderizar_pdf(template_nome, contexto, destino):
+    """Renderiza o template e gera o PDF em `destino` (xhtml2pdf), com contagem e tempo por template em /metrics."""
+    inicio = time.perf_counter()
+    html = get_template(template_nome).render(contexto)
+    pisa_status = pisa.CreatePDF(html, dest=destino)
+    metricas.observar('pdf_render_segundos', time.perf_counter() - inicio, template=template_nome)
+    metricas.incrementar('pdf_erros_total' if pisa_status.err else 'pdf_gerados_total', template=template_nome)
+    return pisa_status
+
+
 # --- Autenticação ---
 
 def login_view(request):
@@ -105,41 +136,46 @@ def index(request):
 
 @login_required
 @admin_only  # <--- Proteção
+@usa_replica
 def dashboard_clinico(request):
-    municipios = Paciente.objects.values_list('municipio', flat=True).distinct().order_by('municipio')
+    municipios = Paciente.objects.filter(ativo=True).values_list('municipio', flat=True).distinct().order_by('municipio')
     # Atenção: Renomeamos indices.html para dashboard.html
     return render(request, 'dashboard.html', {'municipios': municipios})
 
 
 @login_required
 @admin_only  # <--- Proteção
+@usa_replica
 def api_dashboard(request):
-    cidades_selecionadas = request.GET.getlist('municipios[]')
+    # Mesmos números para todos os administradores: um cálculo por minuto por seleção de municípios
+    cidades_selecionadas = sorted(set(request.GET.getlist('municipios[]')))
+    dados = cache.obter('dashboard', cidades_selecionadas or 'todos',
+                        lambda: _dados_dashboard(cidades_selecionadas), 60)
+    return JsonResponse(dados)
+
+
+def _dados_dashboard(cidades_selecionadas):
     pacientes = Paciente.objects.filter(ativo=True)
 
     if cidades_selecionadas:
         pacientes = pacientes.filter(municipio__in=cidades_selecionadas)
 
     total_pacientes = pacientes.count()
-    hoje = datetime.now()
+    # Intervalo em vez de __month/__year: o filtro por data usa o índice (paciente, data_afericao)
+    inicio_mes = timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     total_afericoes = Afericao.objects.filter(
-        data_afericao__month=hoje.month,
-        data_afericao__year=hoje.year,
+        data_afericao__gte=inicio_mes,
         paciente__in=pacientes
     ).count()
 
-    controlados = 0
-    nao_controlados = 0
-    sem_dados = 0
-
-    for p in pacientes:
-        ultima = p.afericoes.first()
-        if not ultima:
-            sem_dados += 1
-        elif ultima.pressao_sistolica < 140 and ultima.pressao_diastolica < 90:
-            controlados += 1
-        else:
-            nao_controlados += 1
+    # Controle pela última PA do resumo do paciente (uma consulta, em vez de uma por paciente)
+    controle = pacientes.aggregate(
+        controlados=Count('id', filter=Q(data_ultima_afericao__isnull=False, ultima_pas__lt=140, ultima_pad__lt=90)),
+        sem_dados=Count('id', filter=Q(data_ultima_afericao__isnull=True)),
+    )
+    controlados = controle['controlados']
+    sem_dados = controle['sem_dados']
+    nao_controlados = total_pacientes - controlados - sem_dados
 
     sexo_stats = pacientes.values('sexo').annotate(total=Count('sexo'))
     sexo_data = {'M': 0, 'F': 0}
@@ -154,8 +190,8 @@ def api_dashboard(request):
     soma_dias_lc = 0
     data_atual = date.today()
 
-    for p in pacientes:
-        idade = calcular_idade(p.data_nascimento)
+    for data_nascimento, data_insercao in pacientes.values_list('data_nascimento', 'data_insercao'):
+        idade = calcular_idade(data_nascimento)
         if idade < 40:
             faixas_etarias['<40'] += 1
         elif idade < 60:
@@ -165,15 +201,15 @@ def api_dashboard(request):
         else:
             faixas_etarias['80+'] += 1
 
-        if p.data_insercao:
-            delta = data_atual - p.data_insercao
+        if data_insercao:
+            delta = data_atual - data_insercao
             soma_dias_lc += delta.days
 
     tempo_medio_meses = 0
     if total_pacientes > 0:
         tempo_medio_meses = round((soma_dias_lc / total_pacientes) / 30, 1)
 
-    return JsonResponse({
+    return {
         'kpi_pacientes': total_pacientes,
         'kpi_afericoes': total_afericoes,
         'kpi_tempo_medio': tempo_medio_meses,
@@ -183,7 +219,131 @@ def api_dashboard(request):
         'idade_data': list(faixas_etarias.values()),
         'mun_labels': mun_labels,
         'mun_data': mun_data
+    }
+
+
+@login_required
+@admin_only
+@usa_replica
+def api_triagem_coorte(request):
+    """Re-triagem de todos os pacientes ativos (ex.: após mudança de protocolo), em uma consulta."""
+    protocolo = protocolo_vigente(**{
+        campo: int(request.GET[campo]) for campo in ('pas_estagio_2', 'pad_estagio_2', 'pas_estagio_1', 'pad_estagio_1')
+        if request.GET.get(campo, '').isdigit()
     })
+    pacientes = Paciente.objects.filter(ativo=True)
+    cidades_selecionadas = request.GET.getlist('municipios[]')
+    if cidades_selecionadas:
+        pacientes = pacientes.filter(municipio__in=cidades_selecionadas)
+
+    resultado = contar_elegibilidade(pacientes, protocolo)
+    resultado['protocolo'] = protocolo
+    return JsonResponse(resultado)
+
+
+TIPOS_EXPORTACAO = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+@login_required
+@admin_only
+@usa_replica
+def exportar(request, conjunto):
+    """Planilha (CSV ou XLSX) de pacientes, aferições ou atendimentos, gerada em fluxo (core/exportacao.py)."""
+    formato = request.GET.get('formato', 'csv')
+    if conjunto not in exportacao.CONJUNTOS or formato not in exportacao.FORMATOS:
+        messages.error(request, 'Exportação inexistente.')
+        return redirect('indices')
+    try:
+        filtros = exportacao.ler_filtros(request.GET)
+    except ValueError as erro:
+        messages.error(request, str(erro))
+        return redirect('indices')
+
+    # As linhas são lidas depois que a view e os middlewares terminaram (estado da réplica já
+    # descartado): o banco é escolhido aqui, enquanto o @usa_replica ainda vale
+    banco = router.db_for_read(exportacao.CONJUNTOS[conjunto].modelo)
+    if formato == 'xlsx' and exportacao.excede_limite_xlsx_web(conjunto, banco=banco, **filtros):
+        messages.error(request, f'O XLSX pelo navegador vai até {exportacao.limite_xlsx_web()} linhas. Use o CSV '
+                                f'ou, no servidor, python manage.py exportar {conjunto} --formato xlsx.')
+        return redirect('indices')
+    linhas = exportacao.consultar(conjunto, banco=banco, **filtros)
+    response = StreamingHttpResponse(exportacao.gerar(conjunto, formato, linhas),
+                                     content_type=TIPOS_EXPORTACAO[formato])
+    response['Content-Disposition'] = f'attachment; filename="{conjunto}_{date.today():%Y%m%d}.{formato}"'
+    return response
+
+
+def _resposta_fhir(dados, status=200):
+    return JsonResponse(dados, status=status, content_type='application/fhir+json',
+                        json_dumps_params={'ensure_ascii': False})
+
+
+@login_required
+@admin_only
+def fhir_export(request):
+    """
+    Kick-off do $export (FHIR Bulk Data): registra a exportação e responde 202 com a URL de
+    acompanhamento em Content-Location. Parâmetros: _type, _since e _outputFormat.
+    """
+    formato = request.GET.get('_outputFormat')
+    if formato and formato not in fhir.FORMATOS_SAIDA:
+        return _resposta_fhir(fhir.operation_outcome(f'_outputFormat não suportado: {formato}.'), status=400)
+    try:
+        pedido = fhir.solicitar_exportacao(request.user, request.GET.get('_type'), request.GET.get('_since'))
+    except ValueError as erro:
+        return _resposta_fhir(fhir.operation_outcome(str(erro)), status=400)
+    response = HttpResponse(status=202)
+    response['Content-Location'] = request.build_absolute_uri(reverse('fhir_status', args=[pedido.id]))
+    return response
+
+
+# DELETE vem de clientes FHIR, sem token CSRF; um site de outra origem não consegue enviar DELETE
+# (o navegador exige preflight CORS, que não é atendido)
+@csrf_exempt
+@login_required
+@admin_only
+def fhir_status(request, exportacao_id):
+    """
+    Acompanhamento do $export: 202 com X-Progress enquanto executa, depois o manifesto (ou o erro).
+    DELETE apaga a exportação e seus arquivos (202).
+    """
+    pedido = get_object_or_404(ExportacaoFHIR, id=exportacao_id)
+    if request.method == 'DELETE':
+        fhir.apagar(pedido)
+        return HttpResponse(status=202)
+    pedido = fhir.conferir_interrompida(pedido)
+    if pedido.status in ('PENDENTE', 'EXECUTANDO'):
+        response = HttpResponse(status=202)
+        response['X-Progress'] = pedido.progresso or pedido.get_status_display()
+        response['Retry-After'] = '10'
+        return response
+    if pedido.status == 'ERRO':
+        return _resposta_fhir(fhir.operation_outcome(pedido.erro), status=500)
+
+    parametros = {'_type': pedido.tipos}
+    if pedido.desde:
+        parametros['_since'] = timezone.localtime(pedido.desde).isoformat()
+    url_requisicao = request.build_absolute_uri(f"{reverse('fhir_export')}?{urlencode(parametros)}")
+    return _resposta_fhir(fhir.manifesto(
+        pedido, url_requisicao,
+        lambda arquivo: request.build_absolute_uri(reverse('fhir_arquivo', args=[pedido.id, arquivo])),
+    ))
+
+
+@login_required
+@admin_only
+def fhir_arquivo(request, exportacao_id, arquivo):
+    """Um arquivo NDJSON do manifesto, enviado do disco em pedaços."""
+    pedido = get_object_or_404(ExportacaoFHIR, id=exportacao_id, status='CONCLUIDA')
+    if arquivo not in {item['arquivo'] for item in pedido.arquivos}:
+        raise Http404
+    caminho = os.path.join(fhir.pasta_exportacao(pedido.id), arquivo)
+    if not os.path.exists(caminho):
+        raise Http404
+    return FileResponse(open(caminho, 'rb'), content_type='application/fhir+ndjson')
 
 
 @login_required
@@ -204,6 +364,102 @@ def gestao_pacientes(request):
     return render(request, 'pacientes.html', {'pacientes': pacientes})
 
 
+# --- Lista de Trabalho por Risco ---
+
+LISTA_RISCO_POR_PAGINA = 50
+
+
+def _pagina_lista_risco(params):
+    """
+    Pacientes ativos do mais grave para o menos grave (nível de risco, depois última PAS),
+    paginados por chave: o cursor é 'nivel.pas.id' do último paciente da página anterior.
+    Usa o índice parcial paciente_lista_risco_idx (nivel_risco, ultima_pas, id WHERE ativo).
+    """
+    pacientes = Paciente.objects.filter(ativo=True)
+
+    niveis = [int(n) for n in params.getlist('nivel') if n.isdigit()]
+    if niveis:
+        pacientes = pacientes.filter(nivel_risco__in=niveis)
+    if params.get('municipio'):
+        pacientes = pacientes.filter(municipio=params.get('municipio'))
+    if params.get('pas_min', '').isdigit():
+        pacientes = pacientes.filter(ultima_pas__gte=int(params.get('pas_min')))
+    # Estatísticas de PA da janela (core/estatisticas_pa.py), como subconsulta
+    filtros_pa = {}
+    if params.get('alvo_max', '').isdigit():
+        filtros_pa['percentual_alvo__lte'] = int(params.get('alvo_max'))
+    if params.get('arv_min', '').isdigit():
+        filtros_pa['arv_sistolica__gte'] = int(params.get('arv_min'))
+    if filtros_pa:
+        pacientes = pacientes.filter(id__in=estatisticas_pa.coorte(**filtros_pa).values('paciente_id'))
+
+    cursor = params.get('cursor', '')
+    if cursor:
+        try:
+            nivel, pas, pid = (int(v) for v in cursor.split('.'))
+        except ValueError:
+            pass
+        else:
+            pacientes = pacientes.filter(
+                Q(nivel_risco__lt=nivel) |
+                Q(nivel_risco=nivel, ultima_pas__lt=pas) |
+                Q(nivel_risco=nivel, ultima_pas=pas, id__lt=pid)
+            )
+
+    pagina = list(pacientes.order_by('-nivel_risco', '-ultima_pas', '-id').only(
+        'id', 'nome', 'cpf', 'municipio', 'telefone', 'nivel_risco', 'risco_prevent_atual',
+        'ultima_pas', 'ultima_pad', 'data_ultima_afericao'
+    )[:LISTA_RISCO_POR_PAGINA + 1])
+
+    proximo = None
+    if len(pagina) > LISTA_RISCO_POR_PAGINA:
+        pagina = pagina[:LISTA_RISCO_POR_PAGINA]
+        ultimo = pagina[-1]
+        proximo = f"{ultimo.nivel_risco}.{ultimo.ultima_pas}.{ultimo.id}"
+    return pagina, proximo
+
+
+@login_required
+@health_team
+def lista_risco(request):
+    pacientes, proximo = _pagina_lista_risco(request.GET)
+    filtros = request.GET.copy()
+    filtros.pop('cursor', None)
+    municipios = Paciente.objects.filter(ativo=True).values_list('municipio', flat=True).distinct().order_by('municipio')
+    return render(request, 'lista_risco.html', {
+        'pacientes': pacientes,
+        'proximo_cursor': proximo,
+        'filtros_url': filtros.urlencode(),
+        'niveis': Paciente.NIVEL_RISCO_CHOICES,
+        'niveis_selecionados': request.GET.getlist('nivel'),
+        'classes_nivel': {nivel: css for _, nivel, css, _ in FAIXAS_RISCO},
+        'municipios': municipios,
+        'janela_dias': estatisticas_pa.parametros()['janela_dias'],
+    })
+
+
+@login_required
+@health_team
+def api_lista_risco(request):
+    pacientes, proximo = _pagina_lista_risco(request.GET)
+    return JsonResponse({
+        'pacientes': [{
+            'id': p.id,
+            'nome': p.nome,
+            'cpf': p.cpf,
+            'municipio': p.municipio,
+            'telefone': p.telefone,
+            'nivel_risco': p.nivel_risco,
+            'faixa_risco': p.get_nivel_risco_display(),
+            'risco_10_anos': float(p.risco_prevent_atual) if p.risco_prevent_atual is not None else None,
+            'ultima_pas': p.ultima_pas or None,
+            'ultima_pad': p.ultima_pad or None,
+            'data_ultima_afericao': p.data_ultima_afericao,
+        } for p in pacientes],
+        'proximo_cursor': proximo,
+    })
+
+
 @login_required
 @multi_only
 def salvar_paciente(request):
@@ -212,14 +468,19 @@ def salvar_paciente(request):
         data = request.POST.copy()
         if 'cpf' in data: data['cpf'] = data['cpf'].replace('.', '').replace('-', '')
 
+        readmissao = False
         if pid:
             instance = get_object_or_404(Paciente, id=pid)
+            readmissao = not instance.ativo
             form = PacienteForm(data, instance=instance)
         else:
             form = PacienteForm(data)
 
         if form.is_valid():
-            form.save()
+            paciente = form.save()
+            # Readmissão: o histórico arquivado volta para as tabelas do dia a dia
+            if readmissao and paciente.ativo and restaurar_paciente(paciente):
+                messages.info(request, 'Histórico arquivado do paciente restaurado.')
             messages.success(request, 'Paciente salvo!')
         else:
             messages.error(request, f'Erro: {form.errors}')
@@ -227,6 +488,96 @@ def salvar_paciente(request):
     return redirect('gestao_pacientes')
 
 
+# --- Importação em Massa (planilhas CROSS) ---
+
+PASTA_IMPORTACAO = os.path.join(tempfile.gettempdir(), 'hipertensao_importacao')
+
+
+@login_required
+@admin_only
+def importar_pacientes_view(request):
+    contexto = {}
+    arquivo = request.FILES.get('arquivo')
+    if request.method == 'POST' and arquivo:
+        extensao = os.path.splitext(arquivo.name)[1].lower()
+        if extensao not in ('.csv', '.txt', '.xlsx', '.xlsm'):
+            messages.error(request, 'Formato não suportado: envie um arquivo CSV ou XLSX.')
+            return redirect('importar_pacientes')
+
+        os.makedirs(PASTA_IMPORTACAO, exist_ok=True)
+        token = uuid.uuid4().hex
+        caminho = os.path.join(PASTA_IMPORTACAO, f'{token}{extensao}')
+        rejeitados = os.path.join(PASTA_IMPORTACAO, f'{token}_rejeitados.csv')
+        with open(caminho, 'wb') as destino:
+            for parte in arquivo.chunks():
+                destino.write(parte)
+
+        try:
+            resultado = importar_pacientes(
+                caminho, arquivo_rejeitados=rejeitados, encoding=request.POST.get('encoding') or 'utf-8-sig'
+            )
+        except (UnicodeDecodeError, csv.Error, ValueError) as e:
+            messages.error(request, f'Não foi possível ler o arquivo: {e}')
+            return redirect('importar_pacientes')
+        finally:
+            os.remove(caminho)
+
+        contexto['resultado'] = resultado
+        if resultado['rejeitados']:
+            contexto['token'] = token
+            with open(rejeitados, encoding='utf-8-sig', newline='') as f:
+                linhas = csv.reader(f, delimiter=';')
+                contexto['cabecalho_rejeitados'] = next(linhas, [])
+                contexto['amostra_rejeitados'] = [l for _, l in zip(range(100), linhas)]
+        else:
+            os.remove(rejeitados)
+
+    return render(request, 'importar_pacientes.html', contexto)
+
+
+@login_required
+@admin_only
+def baixar_rejeitados_importacao(request, token):
+    caminho = os.path.join(PASTA_IMPORTACAO, f'{token}_rejeitados.csv')
+    if not token.isalnum() or not os.path.exists(caminho):
+        messages.error(request, 'Arquivo de rejeitados não encontrado.')
+        return redirect('importar_pacientes')
+    with open(caminho, 'rb') as f:
+        response = HttpResponse(f.read(), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="pacientes_rejeitados.csv"'
+    return response
+
+
+@login_required
+@multi_only
+def importar_afericoes_paciente(request, paciente_id):
+    """Leituras do monitor de pressão domiciliar trazidas pelo paciente (o arquivo não precisa ter CPF)."""
+    paciente = get_object_or_404(Paciente, id=paciente_id)
+    arquivo = request.FILES.get('arquivo')
+    if request.method == 'POST' and arquivo:
+        extensao = os.path.splitext(arquivo.name)[1].lower()
+        if extensao not in ('.csv', '.txt', '.xlsx', '.xlsm'):
+            messages.error(request, 'Formato não suportado: envie um arquivo CSV ou XLSX.')
+            return redirect('detalhe_paciente', paciente_id=paciente.id)
+
+        with tempfile.NamedTemporaryFile(suffix=extensao, delete=False) as destino:
+            for parte in arquivo.chunks():
+                destino.write(parte)
+        try:
+            resultado = importar_afericoes(destino.name, request.user, cpf=paciente.cpf)
+        except (UnicodeDecodeError, csv.Error, ValueError) as e:
+            messages.error(request, f'Não foi possível ler o arquivo: {e}')
+        else:
+            messages.success(request, (
+                f"{resultado['inseridos']} aferições importadas, {resultado['duplicados']} já registradas, "
+                f"{resultado['rejeitados']} rejeitadas."
+            ))
+        finally:
+            os.remove(destino.name)
+
+    return redirect('detalhe_paciente', paciente_id=paciente.id)
+
+
 @login_required
 @multi_only
 def api_paciente(request, id):
@@ -304,18 +655,12 @@ def atendimento_multidisciplinar(request, paciente_id):
             observacoes=request.POST.get('obs')
         )
 
-        eligible = False
-        if not ultima_afericao:
-            eligible = True
-        else:
-            pas = ultima_afericao.pressao_sistolica
-            pad = ultima_afericao.pressao_diastolica
-            is_estagio_2_plus = (pas >= 140) or (pad >= 90)
-            is_estagio_1 = (130 <= pas < 140) or (80 <= pad < 90)
-            has_alto_risco = tem_diabetes or tem_loa or loa_rins
-
-            if is_estagio_2_plus or (is_estagio_1 and has_alto_risco):
-                eligible = True
+        eligible = avaliar_elegibilidade(
+            ultima_afericao.pressao_sistolica if ultima_afericao else None,
+            ultima_afericao.pressao_diastolica if ultima_afericao else None,
+            tem_diabetes,
+            tem_loa,
+        )
 
         if eligible:
             messages.success(request, "Paciente ELEGÍVEL. Gerando Kit de Exames...")
@@ -326,42 +671,71 @@ def atendimento_multidisciplinar(request, paciente_id):
     return render(request, 'atendimento/ficha_enf_aval_inicial.html', {'paciente': paciente, 'idade': idade})
 
 
+def _entradas_prevent(dados):
+    """Converte os campos do formulário PREVENT (POST ou GET) para os tipos do motor de cálculo."""
+    return {
+        'colesterol_total': int(dados.get('col_total')),
+        'hdl': int(dados.get('hdl')),
+        'pressao_sistolica': int(dados.get('pas')),
+        'tfg': float(dados.get('tfg').replace(',', '.')),
+        'em_tratamento_has': dados.get('em_tto') == 'on',
+        'tem_diabetes': dados.get('diabetes') == 'on',
+        'fumante': dados.get('fumante') == 'on',
+        'em_uso_estatina': dados.get('estatina') == 'on',
+    }
+
+
 @login_required
 def atendimento_prevent(request, paciente_id):
     paciente = get_object_or_404(Paciente, id=paciente_id)
     idade = calcular_idade(paciente.data_nascimento)
     ultimo_multi = paciente.atendimentos_multi.last()
     ultima_afericao = paciente.afericoes.order_by('-data_afericao').first()
+    erro = None
 
     if request.method == 'POST':
+        # O risco é sempre calculado aqui; valores enviados pelo navegador são ignorados
         try:
+            entradas = _entradas_prevent(request.POST)
+            risco = calcular_risco_prevent(idade, paciente.sexo, **entradas)
             AvaliacaoPrevent.objects.create(
                 paciente=paciente,
                 idade=idade,
                 sexo=paciente.sexo,
-                colesterol_total=request.POST.get('col_total'),
-                hdl=request.POST.get('hdl'),
-                pressao_sistolica=request.POST.get('pas'),
-                tfg=request.POST.get('tfg').replace(',', '.'),
-                em_tratamento_has=True if request.POST.get('em_tto') == 'on' else False,
-                tem_diabetes=True if request.POST.get('diabetes') == 'on' else False,
-                fumante=True if request.POST.get('fumante') == 'on' else False,
-                risco_10_anos=request.POST.get('risco_10').replace(',', '.'),
-                risco_30_anos=request.POST.get('risco_30').replace(',', '.')
+                risco_10_anos=risco['risco_10_anos'],
+                risco_30_anos=risco['risco_30_anos'],
+                **entradas
             )
             return redirect('atendimento_hub')
-        except Exception as e:
-            print(f"Erro: {e}")
+        except ErroPrevent as e:
+            erro = str(e)
+        except (TypeError, ValueError):
+            erro = "Preencha colesterol total, HDL, eGFR e PAS com valores numéricos."
 
     context = {
         'paciente': paciente,
         'idade': idade,
+        'erro': erro,
         'pre_diabetes': ultimo_multi.tem_diabetes if ultimo_multi else False,
         'pre_fumante': ultimo_multi.fumante if ultimo_multi else False,
         'pre_pas': ultima_afericao.pressao_sistolica if ultima_afericao else ''
     }
     return render(request, 'atendimento_prevent.html', context)
 
+
+@login_required
+def api_prevent_calcular(request, paciente_id):
+    """Pré-visualização do risco PREVENT (mesmo cálculo do salvamento) para o botão 'Calcular Risco'."""
+    paciente = get_object_or_404(Paciente, id=paciente_id)
+    try:
+        risco = calcular_risco_prevent(calcular_idade(paciente.data_nascimento), paciente.sexo,
+                                       **_entradas_prevent(request.GET))
+    except ErroPrevent as e:
+        return JsonResponse({'erro': str(e)}, status=400)
+    except (TypeError, ValueError):
+        return JsonResponse({'erro': "Preencha colesterol total, HDL, eGFR e PAS com valores numéricos."}, status=400)
+    return JsonResponse(risco)
+
 @login_required
 def realizar_atendimento_medico(request, paciente_id):
     paciente = get_object_or_404(Paciente, id=paciente_id)
@@ -401,14 +775,7 @@ def realizar_atendimento_medico(request, paciente_id):
         form = AtendimentoMedicoForm()
 
     # Definição de Cores de Risco
-    if score_valor < 5:
-        classe_risco, texto_risco = "bg-success text-white", "Risco Baixo"
-    elif 5 <= score_valor < 7.5:
-        classe_risco, texto_risco = "bg-warning text-dark", "Risco Limítrofe"
-    elif 7.5 <= score_valor < 20:
-        classe_risco, texto_risco = "bg-orange text-white", "Risco Intermediário"
-    else:
-        classe_risco, texto_risco = "bg-danger text-white", "Alto Risco"
+    _, classe_risco, texto_risco = classificar_risco(score_valor)
 
     context = {
         'paciente': paciente,
@@ -420,6 +787,16 @@ def realizar_atendimento_medico(request, paciente_id):
     return render(request, 'atendimento/ficha_medica.html', context)
 
 
+@login_required
+def api_cid10(request):
+    """Autocomplete de CID-10 (código ou descrição) com a conversão CID-11 de cada resultado."""
+    resultados = buscar_cid10(request.GET.get('q', ''))
+    cid11 = converter_lote([r['codigo'] for r in resultados], agrupamento=True)
+    for r in resultados:
+        r['cid11'] = cid11[r['codigo']]
+    return JsonResponse({'resultados': resultados})
+
+
 @login_required
 def solicitar_exames(request, atendimento_id):
     """
@@ -486,35 +863,12 @@ def prescricao_medica_view(request, atendimento_id):
             elif action == 'voltar':
                 return redirect('atendimento_medico', paciente_id=atendimento.paciente.id)
 
-    # Preparação do Autocomplete (DCB)
-    medicamentos_all = Medicamento.objects.filter(ativo=True)
-    lista_autocomplete = []
-    for med in medicamentos_all:
-        lista_autocomplete.append({
-            'id': med.id,
-            'label': f"{med.principio_ativo} {med.dose_padrao} (Genérico)",
-            'dose': med.dose_padrao,
-            'tipo': 'DCB'
-        })
-        if med.nomes_comerciais:
-            nomes = [n.strip() for n in med.nomes_comerciais.split(',')]
-            for nome in nomes:
-                if nome:
-                    lista_autocomplete.append({
-                        'id': med.id,
-                        'label': f"{nome} -> {med.principio_ativo}",
-                        'dose': med.dose_padrao,
-                        'tipo': 'COMERCIAL'
-                    })
-
-    lista_autocomplete.sort(key=lambda x: x['label'])
-
     context = {
         'atendimento': atendimento,
         'paciente': atendimento.paciente,
         'prescricao': prescricao,
         'itens': prescricao.itens.all(),
-        'db_medicamentos': json.dumps(lista_autocomplete)
+        'db_medicamentos': autocomplete_medicamentos(),
     }
     return render(request, 'prescricao_form.html', context)
 
@@ -543,10 +897,7 @@ def gerar_receita_pdf_bytes(request, prescricao):
     response = HttpResponse(content_type='application/pdf')
     response['Content-Disposition'] = f'inline; filename="receita_{paciente.nome}.pdf"'  # 'inline' abre no navegador
 
-    template = get_template('pdf_receita.html')
-    html = template.render(context)
-
-    pisa_status = pisa.CreatePDF(html, dest=response)
+    pisa_status = renderizar_pdf('pdf_receita.html', context, response)
 
     if pisa_status.err:
         return HttpResponse('Erro ao gerar PDF')
@@ -569,36 +920,60 @@ def monitoramento_busca(request):
     return render(request, 'monitoramento_busca.html', {'erro': erro})
 
 
+class ErroLaboratorio(Exception):
+    pass
+
+
+def _consultar_laboratorio(cpf_limpo):
+    """Exames do paciente na API do laboratório; ErroLaboratorio se a resposta não for 200."""
+    url_api = f"http://172.15.0.152:5897/api/laboratorio/{cpf_limpo}"
+    response = LABORATORIO.chamar(requests.get, url_api, timeout=5)
+    if response.status_code != 200:
+        raise ErroLaboratorio(f"Status API: {response.status_code}")
+    exames_lista = []
+    for item in response.json():
+        try:
+            data_part = item[2].split('T')[0]
+            status_cor = "bg-success" if item[7] == "LIBERADO" else "bg-danger"
+            exames_lista.append({
+                'data': data_part,
+                'nome_exame': item[5],
+                'status_texto': item[7],
+                'status_cor': status_cor
+            })
+        except:
+            pass
+    return exames_lista
+
+
+def _quadro_estatisticas_pa(paciente):
+    """Contexto de estatisticas_pa.html: janela dos últimos dias e o histórico (paciente com select_related)."""
+    parametros = estatisticas_pa.parametros()
+    return {
+        'alvo': parametros,
+        'linhas': [
+            (f"Últimos {parametros['janela_dias']} dias", estatisticas_pa.janela(paciente.id)),
+            ('Todo o histórico', getattr(paciente, 'estatistica_pa', None)),
+        ],
+    }
+
+
 @login_required
 @multi_only
 def monitoramento_painel(request, paciente_id):
-    paciente = get_object_or_404(Paciente, id=paciente_id)
+    paciente = get_object_or_404(Paciente.objects.select_related('estatistica_pa'), id=paciente_id)
     qtd_multi = AtendimentoMultidisciplinar.objects.filter(paciente=paciente).count()
     qtd_medico = AtendimentoMedico.objects.filter(paciente=paciente).count()
 
     exames_lista = []
     erro_api = None
     cpf_limpo = paciente.cpf.replace('.', '').replace('-', '')
-    url_api = f"http://172.15.0.152:5897/api/laboratorio/{cpf_limpo}"
 
     try:
-        response = requests.get(url_api, timeout=5)
-        if response.status_code == 200:
-            dados_brutos = response.json()
-            for item in dados_brutos:
-                try:
-                    data_part = item[2].split('T')[0]
-                    status_cor = "bg-success" if item[7] == "LIBERADO" else "bg-danger"
-                    exames_lista.append({
-                        'data': data_part,
-                        'nome_exame': item[5],
-                        'status_texto': item[7],
-                        'status_cor': status_cor
-                    })
-                except:
-                    pass
-        else:
-            erro_api = f"Status API: {response.status_code}"
+        # Só respostas 200 entram no cache (erros levantam exceção e não são gravados)
+        exames_lista = cache.obter('laboratorio', cpf_limpo, lambda: _consultar_laboratorio(cpf_limpo), 300)
+    except ErroLaboratorio as erro:
+        erro_api = str(erro)
     except:
         erro_api = "API Indisponível"
 
@@ -607,7 +982,8 @@ def monitoramento_painel(request, paciente_id):
         'qtd_multi': qtd_multi,
         'qtd_medico': qtd_medico,
         'exames': exames_lista,
-        'erro_api': erro_api
+        'erro_api': erro_api,
+        'estatisticas_pa': _quadro_estatisticas_pa(paciente),
     })
 
 
@@ -699,6 +1075,37 @@ def salvar_medicamento(request):
     return redirect('gestao_medicamentos')
 
 
+# --- Métricas Prometheus ---
+
+def metricas_prometheus(request):
+    """Exposição para o Prometheus: liberada para METRICAS_IPS_PERMITIDOS ou administrador logado."""
+    permitido = request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICAS_IPS_PERMITIDOS', [])
+    if not (permitido or papeis(request).admin):
+        return HttpResponse(status=403)
+    return HttpResponse(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# --- Perfis cProfile sob demanda (APENAS ADMIN) ---
+
+@login_required
+@admin_only
+def lista_perfis(request):
+    return render(request, 'perfis.html', {'perfis': listar_perfis()})
+
+
+@login_required
+@admin_only
+def baixar_perfil(request, nome):
+    caminho = caminho_perfil(nome, '.prof')
+    if caminho is None:
+        messages.error(request, 'Perfil não encontrado (os mais antigos são descartados).')
+        return redirect('lista_perfis')
+    with open(caminho, 'rb') as f:
+        response = HttpResponse(f.read(), content_type='application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="{nome}.prof"'
+    return response
+
+
 # --- PDFs (Gerais) ---
 
 @login_required
@@ -706,14 +1113,13 @@ def gerar_kit_exames(request, paciente_id):
     paciente = get_object_or_404(Paciente, id=paciente_id)
     response = HttpResponse(content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="kit_{paciente.nome}.pdf"'
-    html = get_template('pdf_kit_exames.html').render({
+    renderizar_pdf('pdf_kit_exames.html', {
         'paciente': paciente,
         'header_b64': get_base64_image('header.png'),
         'usuario': request.user,
         'idade': calcular_idade(paciente.data_nascimento),
         'data_hoje': date.today()
-    })
-    pisa.CreatePDF(html, dest=response)
+    }, response)
     return response
 
 
@@ -722,14 +1128,13 @@ def gerar_contrarreferencia_triagem(request, paciente_id):
     paciente = get_object_or_404(Paciente, id=paciente_id)
     response = HttpResponse(content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="contra_{paciente.nome}.pdf"'
-    html = get_template('pdf_contrarreferencia_triagem.html').render({
+    renderizar_pdf('pdf_contrarreferencia_triagem.html', {
         'paciente': paciente,
         'header_b64': get_base64_image('header.png'),
         'footer_b64': get_base64_image('footer.png'),
         'usuario': request.user,
         'hoje': date.today()
-    })
-    pisa.CreatePDF(html, dest=response)
+    }, response)
     return response
 
 
@@ -742,14 +1147,13 @@ def gerar_alta(request, id):
 
     response = HttpResponse(content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="alta_{paciente.nome}.pdf"'
-    html = get_template('pdf_alta.html').render({
+    renderizar_pdf('pdf_alta.html', {
         'paciente': paciente,
         'header_b64': get_base64_image('header.png'),
         'footer_b64': get_base64_image('footer.png'),
         'usuario': request.user,
         'hoje': date.today()
-    })
-    pisa.CreatePDF(html, dest=response)
+    }, response)
     return response
 
 
@@ -758,14 +1162,13 @@ def gerar_pedido_exames(request, paciente_id):
     paciente = get_object_or_404(Paciente, id=paciente_id)
     response = HttpResponse(content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="pedidos_{paciente.nome}.pdf"'
-    html = get_template('pdf_pedidos_exames.html').render({
+    renderizar_pdf('pdf_pedidos_exames.html', {
         'paciente': paciente,
         'header_b64': get_base64_image('header.png'),
         'usuario': request.user,
         'idade': calcular_idade(paciente.data_nascimento),
         'data_hoje': date.today()
-    })
-    pisa.CreatePDF(html, dest=response)
+    }, response)
     return response
 
 @login_required
@@ -775,11 +1178,15 @@ def reimprimir_receita(request, prescricao_id):
 
 @login_required
 def detalhe_paciente(request, paciente_id):
-    paciente = get_object_or_404(Paciente, id=paciente_id)
+    paciente = get_object_or_404(Paciente.objects.select_related('estatistica_pa'), id=paciente_id)
+    # Alta antiga: o histórico pode estar no arquivo (somente leitura), junto do que houver nas tabelas
+    arquivo = None if paciente.ativo else carregar_arquivo(paciente)
 
     # --- 1. DADOS PARA O GRÁFICO DE PA (Evolução) ---
     # Pegamos todas as aferições ordenadas cronologicamente
     afericoes = Afericao.objects.filter(paciente=paciente).order_by('data_afericao')
+    if arquivo:
+        afericoes = sorted(arquivo[Afericao] + list(afericoes), key=attrgetter('data_afericao'))
 
     grafico_labels = []
     grafico_pas = []
@@ -802,8 +1209,11 @@ def detalhe_paciente(request, paciente_id):
         grafico_pam.append(pam)
 
     # --- 2. HISTÓRICO DE CONSULTAS (Linha do Tempo) ---
-    atendimentos_med = AtendimentoMedico.objects.filter(paciente=paciente)
-    atendimentos_multi = AtendimentoMultidisciplinar.objects.filter(paciente=paciente)
+    atendimentos_med = AtendimentoMedico.objects.filter(paciente=paciente).select_related('medico')
+    atendimentos_multi = AtendimentoMultidisciplinar.objects.filter(paciente=paciente).select_related('profissional')
+    if arquivo:
+        atendimentos_med = arquivo[AtendimentoMedico] + list(atendimentos_med)
+        atendimentos_multi = arquivo[AtendimentoMultidisciplinar] + list(atendimentos_multi)
 
     # Unifica as listas e ordena por data decrescente
     # Adicionamos um atributo 'tipo_atendimento' dinamicamente para usar no template
@@ -826,7 +1236,11 @@ def detalhe_paciente(request, paciente_id):
 
     # --- 3. ESQUEMAS TERAPÊUTICOS (Prescrições Anteriores) ---
     # Busca prescrições ordenadas da mais recente para a mais antiga
-    prescricoes = PrescricaoMedica.objects.filter(atendimento__paciente=paciente).order_by('-data_prescricao')
+    prescricoes = PrescricaoMedica.objects.filter(atendimento__paciente=paciente).select_related(
+        'atendimento__medico').prefetch_related('itens').order_by('-data_prescricao')
+    if arquivo:
+        prescricoes = sorted(arquivo[PrescricaoMedica] + list(prescricoes), key=attrgetter('data_prescricao'),
+                             reverse=True)
 
     context = {
         'paciente': paciente,
@@ -835,7 +1249,9 @@ def detalhe_paciente(request, paciente_id):
         'grafico_pad': json.dumps(grafico_pad),
         'grafico_pam': json.dumps(grafico_pam),
         'historico_consultas': historico_consultas,
-        'prescricoes': prescricoes
+        'prescricoes': prescricoes,
+        'arquivo': arquivo.arquivo if arquivo else None,
+        'estatisticas_pa': _quadro_estatisticas_pa(paciente),
     }
 
     return render(request, 'detalhe_paciente.html', context)
\ No newline at end of file
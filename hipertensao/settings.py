@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -17,13 +18,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentacaoMiddleware',  # primeiro, para medir a requisição inteira
+    'core.middleware.MetricasMiddleware',
+    'core.middleware.ReplicaMiddleware',  # leia-suas-escritas da réplica de leitura (se configurada)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.autenticacao.AutenticacaoMiddleware',  # usuário do cache (ver core/autenticacao.py)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.PerfilamentoMiddleware',  # cProfile sob demanda (?_perfil=1), só para admin
 ]
 
 ROOT_URLCONF = 'hipertensao.urls'
@@ -32,13 +37,21 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [], 
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Templates compilados uma vez por processo. Explícito para valer com qualquer DEBUG; no
+            # runserver o autoreload limpa este cache quando um template muda
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.autenticacao.papeis_do_usuario',
             ],
         },
     },
@@ -46,13 +59,85 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'hipertensao.wsgi.application'
 
+# SQLite com vários workers (gunicorn): aplicados em toda conexão nova.
+# - WAL: leituras não bloqueiam a escrita (e vice-versa). Fica gravado no próprio arquivo, então é
+#   ligado uma vez pela migração core/0020_sqlite_wal (python manage.py migrate), não aqui: em cada
+#   conexão ele reescreveria o cabeçalho do banco a cada execução do manage.py.
+# - synchronous=NORMAL é seguro em WAL (pode perder só a última transação numa queda de energia,
+#   nunca corrompe o arquivo).
+# - busy_timeout: espera o lock de escrita em vez de falhar com "database is locked".
+# - transaction_mode IMMEDIATE: transaction.atomic() reserva a escrita no BEGIN; em DEFERRED uma
+#   transação que lê antes de escrever recebe SQLITE_BUSY na hora, sem respeitar o busy_timeout.
+# Verificar com: python manage.py estresse_sqlite
+# Compromisso medido ali (8 processos, 30% de escritas): ~3x mais escritas gravadas e p95 de leitura
+# menor, mas o total de operações/s pode ficar abaixo do padrão (0,6x a 1,1x conforme a máquina). Não
+# é regressão de leitura: só com leituras os dois perfis empatam, e tirar mmap_size/cache_size não muda
+# nada (cada processo abre uma conexão só). No padrão a escrita concorrente falha na hora ("database is
+# locked") e o processo volta a ler; aqui toda escrita espera a vez pelo único lock de escrita do
+# SQLite (busy_timeout, com esperas de até 100 ms entre tentativas) e é gravada. Preferimos perder
+# vazão a perder aferições.
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,        # ms
+    'mmap_size': 268435456,       # 256 MB mapeados em memória
+    'cache_size': -32000,         # ~32 MB de cache de páginas por conexão
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {nome}={valor}' for nome, valor in SQLITE_PRAGMAS.items()),
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Réplica de leitura (opcional) para painéis, relatórios e exportações (views com @usa_replica;
+# ver core/replica.py). Liga com HIPERTENSAO_REPLICA=<caminho do .sqlite3>; a cópia local é mantida
+# por: python manage.py atualizar_replica --continuo
+# REPLICA_ATRASO_MAXIMO: atraso aceito (s). Depois de uma escrita o usuário lê do principal por
+# esse tempo; réplica mais atrasada que isso é ignorada.
+REPLICA_ATRASO_MAXIMO = int(os.environ.get('HIPERTENSAO_REPLICA_ATRASO', '30'))
+if os.environ.get('HIPERTENSAO_REPLICA'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['HIPERTENSAO_REPLICA'],
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.replica.RoteadorReplica']
+
+# Cache compartilhado entre os workers: arquivos em disco por padrão; HIPERTENSAO_REDIS_URL
+# (ex.: redis://127.0.0.1:6379/1) troca para o Redis sem mudar mais nada.
+if os.environ.get('HIPERTENSAO_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['HIPERTENSAO_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(tempfile.gettempdir(), 'hipertensao_cache'),
+            # Acima do limite o backend apaga um terço das entradas (as sessões voltam do banco)
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+
+# Sessões: leitura pelo cache (sem consulta à django_session a cada requisição) com cópia no banco,
+# que sobrevive à limpeza ou ao corte do cache em disco (MAX_ENTRIES). Só cache, sem cópia no banco,
+# apenas com Redis (HIPERTENSAO_REDIS_URL). HIPERTENSAO_SESSOES sobrescreve a escolha.
+SESSION_ENGINE = os.environ.get('HIPERTENSAO_SESSOES', (
+    'django.contrib.sessions.backends.cache' if os.environ.get('HIPERTENSAO_REDIS_URL')
+    else 'django.contrib.sessions.backends.cached_db'
+))
+# Usuário logado em cache (core.autenticacao), invalidado a cada alteração do usuário
+USUARIO_CACHE_SEGUNDOS = 300
+
 # Usuário Personalizado
 AUTH_USER_MODEL = 'core.Usuario'
 
@@ -70,5 +155,29 @@ USE_TZ = True
 STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Instrumentação por requisição (Server-Timing + log JSON em 'core.instrumentacao').
+# Desligada por padrão; ligar com HIPERTENSAO_INSTRUMENTACAO=1 no ambiente do gunicorn.
+INSTRUMENTACAO_HABILITADA = os.environ.get('HIPERTENSAO_INSTRUMENTACAO') == '1'
+
+# Métricas Prometheus em /metrics (agregadas entre os workers; ver core/metricas.py).
+# Acesso: IPs abaixo (o servidor do Prometheus) ou administrador logado.
+METRICAS_HABILITADAS = True
+METRICAS_IPS_PERMITIDOS = ['127.0.0.1']
+
+# Quantos perfis cProfile recentes são guardados (tela Perfis)
+PERFIS_MAXIMO = 20
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.instrumentacao': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'core': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
+
 # Configuração de E-mail (Console para testes - troca para SMTP em produção)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
\ No newline at end of file